@@ -0,0 +1,306 @@
+"""
+文件搜索工具 - 性能基准测试
+
+生成可配置规模的模拟目录树（1万到500万个文件，深度、分支数可调，混合媒体和文本类型），
+测量索引吞吐量、增量索引耗时、常见查询的延迟分位数和数据库大小，结果以 JSON 输出，
+便于在不同提交之间比较。
+
+用法示例:
+    python benchmark.py --files 10000
+    python benchmark.py --files 1000000 --depth 6 --fanout 10 --output result.json
+    python benchmark.py --files 100000 --enrich --queries 200
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from everything import (HashCache, FileProperties, LightweightDatabase, FileIndexer, PropertyEnricher,
+                        FILE_TYPE_FILTERS)
+
+# 生成文件名使用的词，搜索测试从中选取关键词
+WORDS = ['report', 'photo', 'holiday', 'invoice', 'backup', 'music', 'project', 'draft', 'final', 'scan',
+         'meeting', 'budget', 'family', 'trip', 'video', 'archive', 'notes', 'design', 'export', 'log',
+         '报告', '照片', '项目', '会议', '备份']
+
+# 扩展名及其权重：文本和图片居多，夹杂音视频、压缩包和无法分类的文件
+EXTENSION_WEIGHTS = (
+    [(ext, 4) for ext in FILE_TYPE_FILTERS['文档']] +
+    [(ext, 3) for ext in FILE_TYPE_FILTERS['图片']] +
+    [(ext, 1) for ext in FILE_TYPE_FILTERS['音频'] + FILE_TYPE_FILTERS['视频'] +
+     FILE_TYPE_FILTERS['压缩文件'] + FILE_TYPE_FILTERS['可执行文件']] +
+    [('.dat', 2), ('.json', 2), ('.py', 2), ('', 1)]
+)
+
+def generate_tree(root: str, files: int, depth: int, fanout: int, max_size: int, rng: random.Random) -> dict:
+    """生成模拟目录树，返回 {files, directories, bytes, seconds}"""
+    start = time.perf_counter()
+
+    # 按层生成目录，直到目录数足够分摊文件（每个目录平均约 files / 目录数 个文件）
+    directories = [root]
+    level = [root]
+    for _ in range(depth):
+        next_level = []
+        for parent in level:
+            for i in range(fanout):
+                next_level.append(os.path.join(parent, f"{rng.choice(WORDS)}_{i}"))
+        directories.extend(next_level)
+        level = next_level
+        if len(directories) * 50 >= files:
+            break
+    for directory in directories:
+        os.makedirs(directory, exist_ok=True)
+
+    extensions = [ext for ext, _ in EXTENSION_WEIGHTS]
+    weights = [weight for _, weight in EXTENSION_WEIGHTS]
+    total_bytes = 0
+    for i in range(files):
+        directory = rng.choice(directories)
+        name = f"{rng.choice(WORDS)}_{rng.choice(WORDS)}_{i}{rng.choices(extensions, weights)[0]}"
+        # 大小服从长尾分布：大部分文件很小
+        size = min(max_size, int(rng.paretovariate(1.2) * 64) - 64)
+        with open(os.path.join(directory, name), 'wb') as f:
+            f.write(b'x' * size)
+        total_bytes += size
+
+    return {
+        'files': files,
+        'directories': len(directories),
+        'bytes': total_bytes,
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+
+def mutate_tree(root: str, ratio: float, rng: random.Random) -> dict:
+    """修改、删除和新增一部分文件（模拟两次索引之间的变化），返回各操作的数量"""
+    paths = [os.path.join(directory, name) for directory, _, names in os.walk(root) for name in names]
+    count = max(1, int(len(paths) * ratio))
+    sample = rng.sample(paths, min(len(paths), count * 2))
+    modified, deleted = sample[:count], sample[count:]
+
+    for path in modified:
+        with open(path, 'ab') as f:
+            f.write(b'changed')
+    for path in deleted:
+        os.remove(path)
+    for i in range(count):
+        directory = os.path.dirname(rng.choice(paths))
+        with open(os.path.join(directory, f"added_{rng.choice(WORDS)}_{i}.txt"), 'w') as f:
+            f.write('new')
+
+    return {'modified': len(modified), 'deleted': len(deleted), 'added': count}
+
+def percentiles(samples: list) -> dict:
+    """延迟统计（毫秒）"""
+    ordered = sorted(samples)
+
+    def rank(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    return {
+        'runs': len(ordered),
+        'mean_ms': round(sum(ordered) / len(ordered), 3),
+        'p50_ms': round(rank(50), 3),
+        'p90_ms': round(rank(90), 3),
+        'p99_ms': round(rank(99), 3),
+        'max_ms': round(ordered[-1], 3),
+    }
+
+def query_patterns(rng: random.Random) -> dict:
+    """常见查询模式：名称 -> 生成一次查询的函数（返回 (方法名, 参数)）"""
+    now = datetime.now()
+
+    def language_query():
+        extensions = ';'.join(extension.lstrip('.') for extension, _ in rng.sample(EXTENSION_WEIGHTS[:20], 2))
+        return 'search', {'query': f"ext:{extensions} size:>1kb dm:thismonth {rng.choice(WORDS)}"}
+
+    return {
+        # 界面默认视图：无条件，按文件名排序的第一页
+        'first_page': lambda: ('search', {}),
+        # 1-2 个字符的关键词走 LIKE 扫描
+        'short_substring': lambda: ('search', {'query': rng.choice(WORDS)[:2]}),
+        # 常见词，走全文索引
+        'word_substring': lambda: ('search', {'query': rng.choice(WORDS)}),
+        # 只匹配少量文件的关键词（文件名中的序号）
+        'rare_substring': lambda: ('search', {'query': f"_{rng.randrange(1000, 100000)}."}),
+        'extension': lambda: ('search', {'query': rng.choice(EXTENSION_WEIGHTS[:20])[0]}),
+        'type_filter': lambda: ('search', {'file_type': rng.choice(list(FILE_TYPE_FILTERS))}),
+        'size_range': lambda: ('search', {'min_size': rng.randrange(0, 2048), 'order_by': [('size', True)]}),
+        'date_range': lambda: ('search', {'modified_after': now - timedelta(days=rng.randrange(1, 30)),
+                                          'order_by': [('modified', True)]}),
+        'multi_column_sort': lambda: ('search', {'order_by': [('extension', False), ('size', True)]}),
+        'count_word': lambda: ('count', {'query': rng.choice(WORDS)}),
+        # 搜索语法：多个可下推的条件组合
+        'query_language': language_query,
+        # 正则表达式：字面量部分走全文索引，其余逐行过滤
+        'regex_filter': lambda: ('search', {'query': rf"regex:^{rng.choice(WORDS)}_\w+_\d+\.txt$"}),
+    }
+
+def benchmark_queries(database: LightweightDatabase, runs: int, page_size: int, rng: random.Random) -> dict:
+    """测量各查询模式的延迟（每次取一页结果），以及深翻页的延迟"""
+    results = {}
+    for name, make_query in query_patterns(rng).items():
+        samples = []
+        for _ in range(runs):
+            method, params = make_query()
+            start = time.perf_counter()
+            if method == 'count':
+                database.count_files(**params)
+            else:
+                database.search_files(**params, limit=page_size)
+            samples.append((time.perf_counter() - start) * 1000)
+        results[name] = percentiles(samples)
+
+    # 连续翻页（键集分页）：每页延迟应与页码无关
+    samples = []
+    cursor = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        page = database.search_files(limit=page_size, after=cursor, order_by=[('size', True)])
+        samples.append((time.perf_counter() - start) * 1000)
+        if len(page) < page_size:
+            cursor = None
+        else:
+            cursor = database.get_cursor(page[-1])
+    results['sequential_pages'] = percentiles(samples)
+    return results
+
+def database_size(data_dir: Path) -> dict:
+    """数据库文件大小（检查点之后）"""
+    db_path = data_dir / "files.db"
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    conn.close()
+    return {'bytes': os.path.getsize(db_path), 'pages': page_count, 'page_size': page_size}
+
+def git_revision() -> str:
+    """当前提交（用于比较不同版本的结果），不在仓库中时返回空字符串"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ''
+
+def run_benchmark(files: int = 10000, depth: int = 4, fanout: int = 8, max_size: int = 4096,
+                  queries: int = 50, page_size: int = 500, change_ratio: float = 0.01, workers: int = None,
+                  enrich: bool = False, name_index: bool = False, seed: int = 42, work_dir: str = None,
+                  keep: bool = False) -> dict:
+    """执行完整的基准测试，返回结果"""
+    rng = random.Random(seed)
+    base_dir = Path(work_dir or tempfile.mkdtemp(prefix="everything_benchmark_"))
+    tree_root = str((base_dir / "tree").absolute())
+    data_dir = base_dir / "data"
+    data_dir.mkdir(parents=True, exist_ok=True)
+
+    result = {
+        'revision': git_revision(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'config': {'files': files, 'depth': depth, 'fanout': fanout, 'max_size': max_size, 'queries': queries,
+                   'page_size': page_size, 'change_ratio': change_ratio, 'workers': workers, 'seed': seed},
+    }
+
+    hash_cache = HashCache(data_dir / "hash_cache.db")
+    properties_manager = FileProperties(hash_cache=hash_cache)
+    database = LightweightDatabase(data_dir)
+    try:
+        result['generate'] = generate_tree(tree_root, files, depth, fanout, max_size, rng)
+        indexer = FileIndexer(database, properties_manager, workers=workers)
+
+        def timed_index(incremental):
+            start = time.perf_counter()
+            stats = indexer.index(tree_root, incremental=incremental)
+            seconds = time.perf_counter() - start
+            stats['seconds'] = round(seconds, 3)
+            stats['files_per_second'] = round(stats['total'] / seconds, 1) if seconds else None
+            return stats
+
+        result['index'] = timed_index(False)
+        result['incremental_unchanged'] = timed_index(True)
+        result['changes'] = mutate_tree(tree_root, change_ratio, rng)
+        result['incremental_changed'] = timed_index(True)
+
+        if enrich:
+            enricher = PropertyEnricher(database, properties_manager, workers=workers or os.cpu_count() or 1)
+            start = time.perf_counter()
+            try:
+                while enricher.enrich_pending():
+                    pass
+            finally:
+                enricher.stop()
+            seconds = time.perf_counter() - start
+            result['enrich'] = {
+                'files': enricher.enriched_count,
+                'seconds': round(seconds, 3),
+                'files_per_second': round(enricher.enriched_count / seconds, 1) if seconds else None,
+            }
+
+        # 两次查询测试使用相同的关键词序列，结果可以直接比较
+        result['queries'] = benchmark_queries(database, queries, page_size, random.Random(seed))
+        
+        if name_index:
+            start = time.perf_counter()
+            index = database.load_name_index()
+            result['name_index'] = {
+                'files': len(index),
+                'load_seconds': round(time.perf_counter() - start, 3),
+                'memory_bytes': index.memory_usage(),
+            }
+            result['queries_name_index'] = benchmark_queries(database, queries, page_size, random.Random(seed))
+        
+        database.close()
+        result['database'] = database_size(data_dir)
+        result['database']['files'] = database.get_file_count()
+        return result
+    finally:
+        database.close()
+        hash_cache.close()
+        if not keep:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="文件搜索工具性能基准测试")
+    parser.add_argument('--files', type=int, default=10000, help="生成的文件数（默认 10000）")
+    parser.add_argument('--depth', type=int, default=4, help="最大目录深度（默认 4）")
+    parser.add_argument('--fanout', type=int, default=8, help="每个目录的子目录数（默认 8）")
+    parser.add_argument('--max-size', type=int, default=4096, help="单个文件的最大字节数（默认 4096）")
+    parser.add_argument('--queries', type=int, default=50, help="每种查询的执行次数（默认 50）")
+    parser.add_argument('--page-size', type=int, default=500, help="每次查询取回的结果数（默认 500）")
+    parser.add_argument('--change-ratio', type=float, default=0.01, help="增量测试中修改的文件比例（默认 0.01）")
+    parser.add_argument('--workers', type=int, default=None, help="索引工作线程数（默认 CPU 核数）")
+    parser.add_argument('--enrich', action='store_true', help="同时测量哈希和属性补全")
+    parser.add_argument('--name-index', action='store_true', help="加载内存文件名索引后再测量一次查询")
+    parser.add_argument('--seed', type=int, default=42, help="随机种子，相同种子生成相同的目录树")
+    parser.add_argument('--work-dir', help="生成目录树和数据库的位置（默认临时目录）")
+    parser.add_argument('--keep', action='store_true', help="保留生成的目录树和数据库")
+    parser.add_argument('--output', help="结果输出文件（默认输出到标准输出）")
+    args = parser.parse_args(argv)
+
+    result = run_benchmark(files=args.files, depth=args.depth, fanout=args.fanout, max_size=args.max_size,
+                           queries=args.queries, page_size=args.page_size, change_ratio=args.change_ratio,
+                           workers=args.workers, enrich=args.enrich, name_index=args.name_index, seed=args.seed,
+                           work_dir=args.work_dir, keep=args.keep)
+
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
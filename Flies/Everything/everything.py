@@ -1,9 +1,14 @@
-import tkinter as tk
-from tkinter import ttk, filedialog, messagebox, scrolledtext
 import os
+import sys
+import errno
+import select
+import struct
+import mmap
+import ctypes
+import ctypes.util
 import threading
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 import mimetypes
 import zipfile
 import tarfile
@@ -12,11 +17,24 @@ import bz2
 import lzma
 from pathlib import Path
 import json
+import csv
+import re
 import sqlite3
+import math
 import hashlib
-import pickle
 import shutil
+import queue
+import bisect
+from array import array
+from concurrent.futures import ProcessPoolExecutor
 from typing import Dict, List, Any, Optional
+# 图形界面可选：没有 tkinter 的服务器上仍可通过 everything_cli.py 使用索引和搜索
+try:
+    import tkinter as tk
+    from tkinter import ttk, filedialog, messagebox, scrolledtext
+    TKINTER_AVAILABLE = True
+except ImportError:
+    TKINTER_AVAILABLE = False
 try:
     import win32api
     import win32con
@@ -25,73 +43,179 @@ try:
     WINDOWS_API_AVAILABLE = True
 except ImportError:
     WINDOWS_API_AVAILABLE = False
+# Parquet 导出可选
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# 文件类型分类（按扩展名）
+FILE_TYPE_FILTERS = {
+    "音频": ['.mp3', '.wav', '.flac', '.aac', '.ogg', '.wma', '.m4a', '.aiff'],
+    "压缩文件": ['.zip', '.rar', '.7z', '.tar', '.gz', '.bz2', '.xz', '.lzma'],
+    "文档": ['.txt', '.doc', '.docx', '.pdf', '.rtf', '.odt', '.xls', '.xlsx', '.ppt', '.pptx'],
+    "可执行文件": ['.exe', '.msi', '.bat', '.cmd', '.com', '.scr'],
+    "图片": ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.svg', '.webp', '.ico'],
+    "视频": ['.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm', '.m4v', '.3gp']
+}
+
+class HashCache:
+    """文件哈希缓存
+    
+    按 (路径, 大小, 修改时间ns, inode, 算法) 缓存哈希值，文件未变化时跨索引轮次复用。
+    数据保存在独立的 SQLite 文件中，不与索引写入争用数据库锁，清空索引后依然有效。
+    可被多个工作线程同时使用，新结果先缓冲再批量写入。
+    """
+    
+    FLUSH_SIZE = 500
+    
+    def __init__(self, cache_path):
+        self.cache_path = Path(cache_path)
+        self._lock = threading.Lock()
+        self._pending = []
+        self._conn = sqlite3.connect(self.cache_path, check_same_thread=False)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS hash_cache (
+                path TEXT NOT NULL,
+                algorithm TEXT NOT NULL,
+                size INTEGER,
+                mtime_ns INTEGER,
+                inode INTEGER,
+                digest TEXT,
+                PRIMARY KEY (path, algorithm)
+            )
+        ''')
+        self._conn.commit()
+    
+    def get(self, file_path: str, stat_result: os.stat_result, algorithm: str) -> Optional[str]:
+        """获取缓存的哈希值，文件已变化时返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT size, mtime_ns, inode, digest FROM hash_cache WHERE path = ? AND algorithm = ?',
+                (file_path, algorithm)
+            ).fetchone()
+        if row and row[:3] == (stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino):
+            return row[3]
+        return None
+    
+    def put(self, file_path: str, stat_result: os.stat_result, algorithm: str, digest: str):
+        """缓存哈希值"""
+        with self._lock:
+            self._pending.append((file_path, algorithm, stat_result.st_size,
+                                  stat_result.st_mtime_ns, stat_result.st_ino, digest))
+            if len(self._pending) >= self.FLUSH_SIZE:
+                self._flush_locked()
+    
+    def flush(self):
+        """写入缓冲中的哈希值"""
+        with self._lock:
+            self._flush_locked()
+    
+    def _flush_locked(self):
+        if not self._pending:
+            return
+        try:
+            with self._conn:
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO hash_cache (path, algorithm, size, mtime_ns, inode, digest) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    self._pending
+                )
+        except sqlite3.Error as e:
+            print(f"哈希缓存写入失败: {e}")
+        self._pending = []
+    
+    def close(self):
+        """写入缓冲并关闭连接"""
+        with self._lock:
+            self._flush_locked()
+            self._conn.close()
 
 class FileProperties:
     """文件属性管理器"""
     
-    def __init__(self):
+    # 可选的哈希算法
+    HASH_ALGORITHMS = ['md5', 'sha1', 'sha256', 'blake2b']
+    # 流式哈希每次读取的块大小
+    HASH_CHUNK_SIZE = 1024 * 1024
+    
+    def __init__(self, hash_algorithm: str = 'md5', hash_cache: Optional[HashCache] = None):
         self.properties = {}
+        self.hash_algorithm = hash_algorithm
+        self.hash_cache = hash_cache
         
-    def get_file_properties(self, file_path: str) -> Dict[str, Any]:
-        """获取文件属性"""
+    def get_file_properties(self, file_path: str, include_specific: bool = True,
+                            stat_result: Optional[os.stat_result] = None,
+                            include_hash: bool = True) -> Dict[str, Any]:
+        """获取文件属性（include_specific 为 False 时不提取图片/音视频等属性）
+        
+        stat_result 为遍历时已获取的 stat 结果（如 DirEntry.stat()），
+        传入后所有属性都复用它，不再重复调用 os.stat。
+        include_hash 为 False 时不读取文件内容，只返回 stat 能得到的基本属性。
+        """
         try:
-            stat = os.stat(file_path)
+            stat = stat_result or os.stat(file_path)
             properties = {
                 'size': stat.st_size,
-                'size_on_disk': self.get_size_on_disk(file_path),
+                'size_on_disk': self.get_size_on_disk(file_path, stat),
                 'created': datetime.fromtimestamp(stat.st_ctime),
                 'modified': datetime.fromtimestamp(stat.st_mtime),
                 'accessed': datetime.fromtimestamp(stat.st_atime),
+                'mtime_ns': stat.st_mtime_ns,
+                'inode': stat.st_ino,
+                'device': stat.st_dev,
                 'filename_length': len(os.path.basename(file_path)),
                 'path_length': len(file_path),
                 'extension': os.path.splitext(file_path)[1].lower(),
-                'is_hidden': self.is_hidden(file_path),
-                'is_readonly': self.is_readonly(file_path),
-                'is_system': self.is_system(file_path),
-                'attributes': self.get_file_attributes(file_path),
-                'hash': self.calculate_file_hash(file_path),
-                'type': self.get_file_type(file_path)
+                'is_hidden': self.is_hidden(file_path, stat),
+                'is_readonly': self.is_readonly(file_path, stat),
+                'is_system': self.is_system(file_path, stat),
+                'attributes': self.get_file_attributes(file_path, stat),
+                'hash': self.calculate_file_hash(file_path, stat) if include_hash else ''
             }
             
             # 获取特定文件类型的属性
-            properties.update(self.get_specific_properties(file_path))
+            if include_specific:
+                properties.update(self.get_specific_properties(file_path))
             
             return properties
         except Exception as e:
             return {'error': str(e)}
     
-    def get_size_on_disk(self, file_path: str) -> int:
+    def get_size_on_disk(self, file_path: str, stat_result: Optional[os.stat_result] = None) -> int:
         """获取文件在磁盘上的实际大小"""
         try:
-            return os.path.getsize(file_path)
+            return (stat_result or os.stat(file_path)).st_size
         except:
             return 0
     
-    def is_hidden(self, file_path: str) -> bool:
+    def is_hidden(self, file_path: str, stat_result: Optional[os.stat_result] = None) -> bool:
         """检查文件是否隐藏"""
         try:
-            return bool(os.stat(file_path).st_file_attributes & win32con.FILE_ATTRIBUTE_HIDDEN)
+            return bool((stat_result or os.stat(file_path)).st_file_attributes & win32con.FILE_ATTRIBUTE_HIDDEN)
         except:
             return False
     
-    def is_readonly(self, file_path: str) -> bool:
+    def is_readonly(self, file_path: str, stat_result: Optional[os.stat_result] = None) -> bool:
         """检查文件是否只读"""
         try:
-            return bool(os.stat(file_path).st_file_attributes & win32con.FILE_ATTRIBUTE_READONLY)
+            return bool((stat_result or os.stat(file_path)).st_file_attributes & win32con.FILE_ATTRIBUTE_READONLY)
         except:
             return False
     
-    def is_system(self, file_path: str) -> bool:
+    def is_system(self, file_path: str, stat_result: Optional[os.stat_result] = None) -> bool:
         """检查文件是否系统文件"""
         try:
-            return bool(os.stat(file_path).st_file_attributes & win32con.FILE_ATTRIBUTE_SYSTEM)
+            return bool((stat_result or os.stat(file_path)).st_file_attributes & win32con.FILE_ATTRIBUTE_SYSTEM)
         except:
             return False
     
-    def get_file_attributes(self, file_path: str) -> str:
+    def get_file_attributes(self, file_path: str, stat_result: Optional[os.stat_result] = None) -> str:
         """获取文件属性字符串"""
         try:
-            attrs = os.stat(file_path).st_file_attributes
+            attrs = (stat_result or os.stat(file_path)).st_file_attributes
             attr_list = []
             if attrs & win32con.FILE_ATTRIBUTE_READONLY:
                 attr_list.append("R")
@@ -105,13 +229,29 @@ class FileProperties:
         except:
             return ""
     
-    def calculate_file_hash(self, file_path: str) -> str:
-        """计算文件哈希值（仅用于小文件）"""
+    def calculate_file_hash(self, file_path: str, stat_result: Optional[os.stat_result] = None) -> str:
+        """计算文件哈希值
+        
+        按块流式读取，任意大小的文件内存占用固定；文件未变化时直接使用哈希缓存。
+        """
         try:
-            if os.path.getsize(file_path) > 1024 * 1024:  # 大于1MB的文件不计算哈希
-                return ""
+            stat = stat_result or os.stat(file_path)
+            algorithm = self.hash_algorithm
+            
+            if self.hash_cache is not None:
+                cached = self.hash_cache.get(file_path, stat, algorithm)
+                if cached is not None:
+                    return cached
+            
+            file_hash = hashlib.new(algorithm)
             with open(file_path, 'rb') as f:
-                return hashlib.md5(f.read()).hexdigest()
+                for chunk in iter(lambda: f.read(self.HASH_CHUNK_SIZE), b''):
+                    file_hash.update(chunk)
+            digest = file_hash.hexdigest()
+            
+            if self.hash_cache is not None:
+                self.hash_cache.put(file_path, stat, algorithm, digest)
+            return digest
         except:
             return ""
     
@@ -209,6 +349,1124 @@ class FileProperties:
             pass
         return properties
 
+def scan_files(root: str):
+    """基于 os.scandir 遍历目录
+    
+    逐个目录产出 (目录路径, [DirEntry, ...])，只包含普通文件。
+    DirEntry 缓存了目录读取时得到的信息，调用 entry.stat() 在 Windows 上
+    无需额外系统调用，在其他平台上每个文件也只需一次 stat。
+    与 os.walk 一致：不跟随目录符号链接，跳过无权限访问的目录。
+    """
+    pending = [root]
+    while pending:
+        directory = pending.pop()
+        files = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                        elif entry.is_file():
+                            files.append(entry)
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+        yield directory, files
+
+def extract_specific_properties(file_path: str) -> Dict[str, Any]:
+    """提取特定文件类型的属性（模块级函数，供进程池调用）"""
+    return FileProperties().get_specific_properties(file_path)
+
+def lower_process_priority():
+    """降低当前进程的调度优先级（进程池初始化函数）"""
+    try:
+        if hasattr(os, 'nice'):
+            os.nice(10)
+        elif WINDOWS_API_AVAILABLE:
+            import win32process
+            win32process.SetPriorityClass(win32api.GetCurrentProcess(),
+                                          win32process.BELOW_NORMAL_PRIORITY_CLASS)
+    except Exception:
+        pass
+
+class IndexPipeline:
+    """分阶段并行索引流水线
+    
+    遍历线程产生任务 -> 有界任务队列 -> 工作线程池（stat、哈希等I/O操作）
+    -> 进程池（图片/视频解析等CPU密集操作）-> 有界结果队列 -> 调用方单线程写入数据库
+    """
+    
+    # 交给进程池解析的文件类型
+    CPU_HEAVY_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.mp4', '.avi', '.mkv', '.mov'}
+    
+    # 结束标记
+    _DONE = object()
+    
+    def __init__(self, workers: Optional[int] = None, use_processes: bool = True, queue_size: int = 1000,
+                 low_priority: bool = False):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.use_processes = use_processes
+        self.queue_size = queue_size
+        self.low_priority = low_priority
+        self._process_pool = None
+        self._pool_lock = threading.Lock()
+        self._stopped = threading.Event()
+    
+    def extract_specific_properties(self, properties_manager: FileProperties, file_path: str) -> Dict[str, Any]:
+        """提取特定文件类型的属性，CPU密集的类型交给进程池"""
+        ext = os.path.splitext(file_path)[1].lower()
+        if self.use_processes and ext in self.CPU_HEAVY_EXTENSIONS:
+            try:
+                with self._pool_lock:
+                    if self._process_pool is None:
+                        initializer = lower_process_priority if self.low_priority else None
+                        self._process_pool = ProcessPoolExecutor(max_workers=self.workers, initializer=initializer)
+                    future = self._process_pool.submit(extract_specific_properties, file_path)
+                return future.result()
+            except Exception as e:
+                # 进程池不可用时退回到当前线程中解析
+                print(f"进程池不可用: {e}")
+                self.use_processes = False
+        return properties_manager.get_specific_properties(file_path)
+    
+    def _put(self, target: queue.Queue, item) -> bool:
+        """放入有界队列，流水线停止时返回 False"""
+        while not self._stopped.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def run(self, tasks, worker_fn, should_continue=None):
+        """并行处理 tasks，按完成顺序产出 worker_fn 返回的非空结果
+        
+        tasks 在遍历线程中迭代，worker_fn 在工作线程中执行，
+        结果在调用方线程中产出，因此写库只发生在调用方线程。
+        worker_fn 的 OSError 跳过该任务；遍历或 worker_fn 的其他异常停止流水线并在调用方线程中重新抛出。
+        """
+        task_queue = queue.Queue(maxsize=self.queue_size)
+        result_queue = queue.Queue(maxsize=self.queue_size)
+        should_continue = should_continue or (lambda: True)
+        errors = []
+        self._stopped.clear()
+        
+        def walker():
+            try:
+                for task in tasks:
+                    if not self._put(task_queue, task):
+                        return
+            except Exception as e:
+                errors.append(e)
+            finally:
+                # 提前结束时也在遍历线程中关闭生成器，使其清理代码（如关闭本线程的读连接）在这里执行
+                close = getattr(tasks, 'close', None)
+                if close is not None:
+                    close()
+                for _ in range(self.workers):
+                    self._put(task_queue, self._DONE)
+        
+        def worker():
+            try:
+                while not self._stopped.is_set():
+                    try:
+                        task = task_queue.get(timeout=0.1)
+                    except queue.Empty:
+                        continue
+                    if task is self._DONE:
+                        break
+                    if not should_continue():
+                        continue
+                    try:
+                        result = worker_fn(task)
+                    except (PermissionError, OSError):
+                        continue
+                    if result is not None and not self._put(result_queue, result):
+                        return
+            except Exception as e:
+                # 意外的异常（如属性提取的 ValueError）交给调用方重新抛出
+                errors.append(e)
+            finally:
+                # 无论如何都发出结束标记，否则调用方会一直等待这个工作线程
+                self._put(result_queue, self._DONE)
+        
+        threads = [threading.Thread(target=walker, daemon=True)]
+        threads += [threading.Thread(target=worker, daemon=True) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        
+        try:
+            finished = 0
+            while finished < self.workers:
+                result = result_queue.get()
+                if result is self._DONE:
+                    finished += 1
+                    if errors:
+                        break
+                    continue
+                yield result
+            if errors:
+                raise errors[0]
+        finally:
+            self._stopped.set()
+            for thread in threads:
+                thread.join()
+    
+    def close(self):
+        """关闭进程池（进程池在多次 run 之间复用）"""
+        with self._pool_lock:
+            if self._process_pool is not None:
+                self._process_pool.shutdown(cancel_futures=True)
+                self._process_pool = None
+
+class FileIndexer:
+    """文件索引器（第一阶段索引，不依赖图形界面，界面和命令行共用）
+    
+    incremental 为 True 时，按 (大小, 修改时间, inode) 指纹与数据库比对，
+    只对新增或修改过的文件重新提取属性。
+    每轮索引为访问到的文件标记 generation，完整遍历结束后
+    删除目录下未被标记的记录（磁盘上已不存在的文件）。
+    目录遍历、属性提取和数据库写入通过 IndexPipeline 并行执行。
+    这里只写入基本信息，每批提交后文件即可搜索；
+    哈希和特定类型属性由 PropertyEnricher 在后台补全（第二阶段）。
+    """
+    
+    def __init__(self, database: 'LightweightDatabase', properties_manager: FileProperties,
+                 workers: Optional[int] = None, file_types: Optional[Dict[str, List[str]]] = None):
+        self.database = database
+        self.properties_manager = properties_manager
+        self.workers = workers or os.cpu_count() or 1
+        self.file_types = file_types if file_types is not None else FILE_TYPE_FILTERS
+    
+    def get_file_type(self, file_path: str) -> str:
+        """获取文件类型分类"""
+        ext = os.path.splitext(file_path)[1].lower()
+        
+        for category, extensions in self.file_types.items():
+            if ext in extensions:
+                return category
+                
+        return "其他"
+    
+    def build_core_file_info(self, name: str, file_path: str, stat) -> Dict[str, Any]:
+        """第一阶段的文件信息：只获取基本属性，不读取文件内容"""
+        file_info = {
+            'name': name,
+            'path': file_path,
+            'type': self.get_file_type(file_path)
+        }
+        file_info.update(self.properties_manager.get_file_properties(
+            file_path, include_specific=False, stat_result=stat, include_hash=False))
+        return file_info
+    
+    def index(self, directory: str, incremental: bool = False, should_continue=None,
+              progress_callback=None) -> Dict[str, Any]:
+        """索引目录，返回统计 {total, indexed, skipped, removed, completed}
+        
+        should_continue() 返回 False 时提前结束（此时不清理已删除的文件，completed 为 False），
+        progress_callback(统计) 在每批文件写入后调用。
+        """
+        should_continue = should_continue or (lambda: True)
+        stats = {'total': 0, 'indexed': 0, 'skipped': 0, 'removed': 0, 'completed': False}
+        pipeline = IndexPipeline(workers=self.workers, use_processes=False)
+        
+        def iter_tasks():
+            # 遍历线程：产生待处理的文件，未修改的文件直接标记
+            try:
+                for root, entries in scan_files(directory):
+                    if not should_continue():
+                        return
+                    
+                    fingerprints = {}
+                    if incremental and entries:
+                        fingerprints = self.database.get_file_fingerprints([entry.path for entry in entries])
+                        
+                    for entry in entries:
+                        if not should_continue():
+                            return
+                        
+                        # 每个文件只 stat 一次，结果随任务传给属性提取
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue
+                        
+                        if fingerprints.get(entry.path) == (stat.st_size, stat.st_mtime_ns, stat.st_ino):
+                            yield {'path': entry.path, 'unchanged': True, 'device': stat.st_dev}
+                            continue
+                        
+                        yield (entry.name, entry.path, stat)
+            finally:
+                # 每轮索引都是新的遍历线程，查询指纹时打开的读连接随线程结束关闭
+                self.database.connections.close_reader()
+        
+        def build_file_info(task):
+            # 工作线程：提取文件属性
+            if isinstance(task, dict):
+                return task
+            return self.build_core_file_info(*task)
+        
+        def iter_file_infos():
+            # 写入线程（当前线程）：按完成顺序接收结果
+            for file_info in pipeline.run(iter_tasks(), build_file_info, should_continue):
+                stats['total'] += 1
+                if file_info.get('unchanged'):
+                    stats['skipped'] += 1
+                yield file_info
+        
+        def on_batch_written(indexed_files):
+            stats['indexed'] = indexed_files
+            if progress_callback:
+                progress_callback(stats)
+        
+        try:
+            generation = self.database.begin_generation()
+            
+            # 批量写入数据库，每个事务提交一批文件
+            stats['indexed'] = self.database.add_files(iter_file_infos(), progress_callback=on_batch_written,
+                                                       generation=generation)
+            
+            if should_continue():
+                # 只有完整遍历后才能判断哪些文件已被删除
+                stats['removed'] = self.database.sweep_stale_files(directory, generation)
+                stats['completed'] = True
+        finally:
+            pipeline.close()
+            if self.properties_manager.hash_cache is not None:
+                self.properties_manager.hash_cache.flush()
+        
+        return stats
+
+class PropertyEnricher:
+    """后台属性补全器（两阶段索引的第二阶段）
+    
+    索引时只写入名称、路径、大小、时间等基本信息，文件立即可以搜索；
+    哈希和图片/音视频/文档属性由本补全器在后台低优先级线程中批量提取，
+    待处理的文件由数据库中 enriched = 0 的记录决定，程序重启后可继续。
+    """
+    
+    BATCH_SIZE = 200
+    # 没有待处理文件时的轮询间隔（秒）
+    IDLE_INTERVAL = 5
+    
+    def __init__(self, database: 'LightweightDatabase', properties_manager: FileProperties,
+                 workers: int = 1, use_processes: bool = True):
+        self.database = database
+        self.properties_manager = properties_manager
+        self.pipeline = IndexPipeline(workers=workers, use_processes=use_processes, queue_size=self.BATCH_SIZE,
+                                      low_priority=True)
+        self.enriched_count = 0
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        """启动后台线程"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+    
+    def wake(self):
+        """有新的待处理文件时唤醒补全线程"""
+        self._wake.set()
+    
+    def stop(self, timeout: Optional[float] = None):
+        """停止后台线程"""
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.pipeline.close()
+    
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                processed = self.enrich_pending()
+            except Exception as e:
+                print(f"属性补全出错: {e}")
+                processed = 0
+            
+            if not processed:
+                self._wake.wait(self.IDLE_INTERVAL)
+                self._wake.clear()
+    
+    def enrich_pending(self) -> int:
+        """处理一批待补全的文件，返回处理数量"""
+        rows = self.database.get_pending_files(self.BATCH_SIZE)
+        if not rows:
+            return 0
+        
+        results = list(self.pipeline.run(iter(rows), self._enrich_file, lambda: not self._stopped.is_set()))
+        self.database.save_enrichment(results)
+        if self.properties_manager.hash_cache is not None:
+            self.properties_manager.hash_cache.flush()
+        
+        self.enriched_count += len(results)
+        return len(results)
+    
+    def _enrich_file(self, row) -> Dict[str, Any]:
+        """提取单个文件的哈希和特定类型属性（在工作线程中执行）"""
+        file_id, file_path, mtime_ns = row
+        result = {'id': file_id, 'mtime_ns': mtime_ns, 'hash': '', 'properties': {}}
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            # 文件已不存在或无法访问，标记为已处理，留给下次索引清理
+            return result
+        
+        result['hash'] = self.properties_manager.calculate_file_hash(file_path, stat)
+        result['properties'] = self.pipeline.extract_specific_properties(self.properties_manager, file_path)
+        return result
+
+class DuplicateFinder:
+    """分阶段查找重复文件
+    
+    1. 按大小分组：只有大小相同的文件才可能重复，在数据库中用大小索引分组，不读取文件；
+       同一设备上同一 inode 的硬链接是同一个文件，只保留一个。
+    2. 部分哈希：并行读取每个候选文件开头和结尾各一块计算哈希，大小相同但内容不同的文件大多在这里排除；
+       不超过两块的小文件已被完整读取，部分哈希即为完整哈希。
+    3. 完整哈希：只对仍然相同的文件并行流式计算完整哈希（使用哈希缓存），哈希相同即为重复文件。
+    """
+    
+    # 部分哈希在文件开头和结尾各读取的字节数
+    PARTIAL_BLOCK_SIZE = 64 * 1024
+    # 每次并行处理的候选文件数（按大小分组累积），内存占用与候选总数无关
+    BATCH_FILES = 2000
+    
+    def __init__(self, database: 'LightweightDatabase', properties_manager: FileProperties,
+                 workers: Optional[int] = None):
+        self.database = database
+        self.properties_manager = properties_manager
+        self.pipeline = IndexPipeline(workers=workers, use_processes=False)
+    
+    def find(self, root: Optional[str] = None, min_size: int = 1, should_continue=None,
+             progress_callback=None) -> Dict[str, Any]:
+        """查找重复文件，返回 {'groups': [...], 'stats': {...}}
+        
+        groups 中每组为 {'size', 'hash', 'files': [{'id', 'path'}, ...], 'wasted'}，按可释放的空间从大到小排列。
+        stats 为各阶段处理的文件数和字节数（candidate_bytes 为大小相同的候选文件总字节数，
+        partial_bytes、full_bytes 为部分哈希和完整哈希读取的字节数）。
+        root 限定目录，min_size 为最小文件大小（空文件默认不算重复）。
+        """
+        should_continue = should_continue or (lambda: True)
+        stats = {
+            'size_groups': 0, 'candidates': 0, 'candidate_bytes': 0,
+            'partial_hashed': 0, 'partial_bytes': 0, 'full_hashed': 0, 'full_bytes': 0,
+            'groups': 0, 'duplicate_files': 0, 'wasted_bytes': 0, 'completed': False,
+        }
+        groups = []
+        batch = []
+        
+        for size in self.database.get_duplicate_sizes(min_size, root):
+            if not should_continue():
+                break
+            files = self._distinct_files(self.database.get_files_by_size(size, root))
+            if len(files) < 2:
+                continue
+            stats['size_groups'] += 1
+            stats['candidates'] += len(files)
+            stats['candidate_bytes'] += size * len(files)
+            batch.extend(files)
+            
+            if len(batch) >= self.BATCH_FILES:
+                groups.extend(self._process_batch(batch, stats, should_continue))
+                batch = []
+                if progress_callback:
+                    progress_callback(stats)
+        else:
+            stats['completed'] = True
+        
+        if batch and should_continue():
+            groups.extend(self._process_batch(batch, stats, should_continue))
+        stats['completed'] = stats['completed'] and should_continue()
+        if self.properties_manager.hash_cache is not None:
+            self.properties_manager.hash_cache.flush()
+        
+        groups.sort(key=lambda group: group['wasted'], reverse=True)
+        stats['groups'] = len(groups)
+        stats['duplicate_files'] = sum(len(group['files']) - 1 for group in groups)
+        stats['wasted_bytes'] = sum(group['wasted'] for group in groups)
+        if progress_callback:
+            progress_callback(stats)
+        return {'groups': groups, 'stats': stats}
+    
+    @staticmethod
+    def _distinct_files(files: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """去掉硬链接：(设备, inode) 相同的是同一个文件
+        
+        不同的文件系统或驱动器上 inode 可能相同，因此必须连同设备一起比较；
+        没有记录设备或 inode 的文件全部保留。
+        """
+        seen = set()
+        distinct = []
+        for file in files:
+            if file.get('device') is not None and file['inode']:
+                key = (file['device'], file['inode'])
+                if key in seen:
+                    continue
+                seen.add(key)
+            distinct.append(file)
+        return distinct
+    
+    def _process_batch(self, files: List[Dict[str, Any]], stats: Dict[str, Any], should_continue) -> List[dict]:
+        """对一批候选文件计算部分哈希，再对部分哈希相同的文件计算完整哈希，返回重复文件组"""
+        groups = []
+        
+        partial = {}
+        for file, digest in self.pipeline.run(files, self._partial_hash, should_continue):
+            partial.setdefault((file['size'], digest), []).append(file)
+            stats['partial_hashed'] += 1
+            stats['partial_bytes'] += min(file['size'], 2 * self.PARTIAL_BLOCK_SIZE)
+        
+        survivors = []
+        for (size, digest), members in partial.items():
+            if len(members) < 2:
+                continue
+            if size <= 2 * self.PARTIAL_BLOCK_SIZE:
+                groups.append(self._make_group(size, digest, members))
+            else:
+                survivors.extend(members)
+        
+        full = {}
+        for file, digest in self.pipeline.run(survivors, self._full_hash, should_continue):
+            full.setdefault((file['size'], digest), []).append(file)
+            stats['full_hashed'] += 1
+            stats['full_bytes'] += file['size']
+        
+        for (size, digest), members in full.items():
+            if len(members) >= 2:
+                groups.append(self._make_group(size, digest, members))
+        return groups
+    
+    @staticmethod
+    def _make_group(size: int, digest: str, members: List[Dict[str, Any]]) -> Dict[str, Any]:
+        members.sort(key=lambda file: file['path'])
+        return {
+            'size': size,
+            'hash': digest,
+            'files': [{'id': file['id'], 'path': file['path']} for file in members],
+            'wasted': size * (len(members) - 1),
+        }
+    
+    def _partial_hash(self, file: Dict[str, Any]) -> Optional[tuple]:
+        """计算开头和结尾各一块的哈希（在工作线程中执行），文件大小已变化时返回 None"""
+        block = self.PARTIAL_BLOCK_SIZE
+        file_hash = hashlib.new(self.properties_manager.hash_algorithm)
+        with open(file['path'], 'rb') as f:
+            if os.fstat(f.fileno()).st_size != file['size']:
+                return None
+            if file['size'] <= 2 * block:
+                file_hash.update(f.read())
+            else:
+                file_hash.update(f.read(block))
+                f.seek(-block, os.SEEK_END)
+                file_hash.update(f.read(block))
+        return file, file_hash.hexdigest()
+    
+    def _full_hash(self, file: Dict[str, Any]) -> Optional[tuple]:
+        """流式计算完整哈希（在工作线程中执行），文件大小已变化或无法读取时返回 None"""
+        stat = os.stat(file['path'])
+        if stat.st_size != file['size']:
+            return None
+        digest = self.properties_manager.calculate_file_hash(file['path'], stat)
+        return (file, digest) if digest else None
+
+class ResultExporter:
+    """将搜索结果流式导出为 CSV、JSON Lines 或 Parquet（需要 pyarrow）
+    
+    按键集分页从数据库逐批读取（见 LightweightDatabase.iter_files），每批写出后即丢弃，
+    内存占用与结果数量无关。先写入临时文件，完成后才替换目标文件，取消或出错时不留下不完整的文件。
+    图形界面和命令行共用。
+    """
+    
+    # 每批读取和写出的文件数（Parquet 每批为一个行组）
+    BATCH_SIZE = 10000
+    # 导出的列，时间列导出为 ISO 时间（Parquet 为时间戳类型）
+    COLUMNS = ('name', 'path', 'size', 'type', 'modified', 'created', 'accessed', 'attributes', 'hash')
+    FORMATS = ('csv', 'jsonl', 'parquet')
+    # 按扩展名判断导出格式，其他扩展名导出为 CSV
+    EXTENSIONS = {'.csv': 'csv', '.jsonl': 'jsonl', '.json': 'jsonl', '.parquet': 'parquet'}
+    
+    def __init__(self, database: 'LightweightDatabase', batch_size: int = BATCH_SIZE):
+        self.database = database
+        self.batch_size = batch_size
+    
+    @classmethod
+    def detect_format(cls, path: str) -> str:
+        return cls.EXTENSIONS.get(os.path.splitext(str(path))[1].lower(), 'csv')
+    
+    @staticmethod
+    def make_record(file_info: Dict[str, Any]) -> Dict[str, Any]:
+        """将查询结果转换为可输出的记录（去掉游标等内部字段，时间戳转换为 ISO 时间）"""
+        record = {key: value for key, value in file_info.items() if not key.startswith('_')}
+        for column in LightweightDatabase.TIMESTAMP_COLUMNS:
+            if column in record:
+                # 0 表示时间未知
+                record[column] = datetime.fromtimestamp(record[column]).isoformat() if record[column] else None
+        return record
+    
+    def export(self, path: str, output_format: Optional[str] = None, include_properties: bool = False,
+               should_continue=None, progress_callback=None, **search_params) -> Dict[str, Any]:
+        """导出全部搜索结果（search_params 同 search_files），返回 {output, format, files, completed}
+        
+        include_properties 为 True 时增加 properties 列（JSON 文本），
+        should_continue() 返回 False 时停止并删除临时文件（completed 为 False），
+        progress_callback(统计) 在每批写出后调用。
+        """
+        output_format = output_format or self.detect_format(path)
+        if output_format not in self.FORMATS:
+            raise ValueError(f"不支持的导出格式: {output_format}")
+        if output_format == 'parquet' and not PYARROW_AVAILABLE:
+            raise ValueError("导出 Parquet 需要安装 pyarrow")
+        
+        stats = {'output': str(path), 'format': output_format, 'files': 0, 'completed': False}
+        batches = self._iter_batches(stats, include_properties, should_continue or (lambda: True),
+                                     progress_callback, search_params)
+        write = {'csv': self._write_csv, 'jsonl': self._write_jsonl, 'parquet': self._write_parquet}[output_format]
+        temp_path = f"{path}.part"
+        try:
+            write(temp_path, batches, include_properties)
+            if stats['completed']:
+                os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return stats
+    
+    def _iter_batches(self, stats: Dict[str, Any], include_properties: bool, should_continue,
+                      progress_callback, search_params: Dict[str, Any]):
+        """逐批产生搜索结果，调用方写出一批后更新统计；全部产生后 completed 为 True"""
+        batch = []
+        for file_info in self.database.iter_files(page_size=self.batch_size, include_properties=include_properties,
+                                                  **search_params):
+            batch.append(file_info)
+            if len(batch) < self.batch_size:
+                continue
+            if not should_continue():
+                return
+            yield batch
+            stats['files'] += len(batch)
+            batch = []
+            if progress_callback:
+                progress_callback(stats)
+        
+        if batch:
+            yield batch
+            stats['files'] += len(batch)
+        stats['completed'] = True
+        if progress_callback:
+            progress_callback(stats)
+    
+    def _write_csv(self, path: str, batches, include_properties: bool):
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(self.COLUMNS + (('properties',) if include_properties else ()))
+            for batch in batches:
+                for file_info in batch:
+                    record = self.make_record(file_info)
+                    row = [record.get(column, '') for column in self.COLUMNS]
+                    if include_properties:
+                        row.append(json.dumps(record.get('properties', {}), ensure_ascii=False))
+                    writer.writerow(row)
+    
+    def _write_jsonl(self, path: str, batches, include_properties: bool):
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            for batch in batches:
+                f.writelines(json.dumps(self.make_record(file_info), ensure_ascii=False) + '\n'
+                             for file_info in batch)
+    
+    def _write_parquet(self, path: str, batches, include_properties: bool):
+        fields = [(column, pa.int64() if column == 'size' else
+                   pa.timestamp('s') if column in LightweightDatabase.TIMESTAMP_COLUMNS else pa.string())
+                  for column in self.COLUMNS]
+        if include_properties:
+            fields.append(('properties', pa.string()))
+        schema = pa.schema(fields)
+        
+        with pq.ParquetWriter(path, schema) as writer:
+            for batch in batches:
+                columns = {column: [file_info.get(column) for file_info in batch] for column in self.COLUMNS}
+                if include_properties:
+                    columns['properties'] = [json.dumps(file_info.get('properties', {}), ensure_ascii=False)
+                                             for file_info in batch]
+                writer.write_table(pa.table(columns, schema=schema))
+
+class SearchWorker:
+    """后台搜索线程
+    
+    查询在独立线程和只读连接上执行，界面线程不会被 SQL 阻塞。每次提交都会生成新的查询编号，
+    正在执行的旧查询由进度回调检测到编号过期后中止，只有最新查询的结果会交给 on_result(编号, 结果)，
+    最新查询出错时调用 on_error(编号, 异常)。
+    """
+    
+    # 每执行多少条 SQLite 虚拟机指令检查一次查询是否过期
+    PROGRESS_INTERVAL = 1000
+    
+    def __init__(self, database: 'LightweightDatabase', on_result, on_error=None):
+        self.database = database
+        self.on_result = on_result
+        self.on_error = on_error
+        self._generation = 0
+        self._running = 0
+        self._pending = None
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._conn = None
+        self._thread = None
+    
+    def start(self):
+        """启动后台线程"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+    
+    def submit(self, task) -> int:
+        """提交查询 task(连接)，取消尚未完成的旧查询，返回查询编号"""
+        with self._condition:
+            self._generation += 1
+            self._pending = (self._generation, task)
+            self._condition.notify()
+            return self._generation
+    
+    def cancel(self):
+        """取消正在执行和等待执行的查询"""
+        with self._condition:
+            self._generation += 1
+            self._pending = None
+    
+    def is_current(self, generation: int) -> bool:
+        """查询编号是否仍是最新的"""
+        return generation == self._generation
+    
+    def stop(self, timeout: Optional[float] = None):
+        """停止后台线程，中断正在执行的查询"""
+        with self._condition:
+            self._stopped = True
+            self._generation += 1
+            self._pending = None
+            self._condition.notify()
+            if self._conn is not None:
+                self._conn.interrupt()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+    
+    def _is_stale(self) -> int:
+        """进度回调：返回非 0 时 SQLite 中止当前语句"""
+        return int(self._running != self._generation)
+    
+    def _run(self):
+        conn = self.database.get_read_connection()
+        conn.set_progress_handler(self._is_stale, self.PROGRESS_INTERVAL)
+        with self._condition:
+            self._conn = conn
+        try:
+            while True:
+                with self._condition:
+                    while self._pending is None and not self._stopped:
+                        self._condition.wait()
+                    if self._stopped:
+                        return
+                    generation, task = self._pending
+                    self._pending = None
+                    self._running = generation
+                
+                try:
+                    result = task(conn)
+                except Exception as e:
+                    if not self.is_current(generation):
+                        # 被新查询取消
+                        continue
+                    if isinstance(e, sqlite3.OperationalError):
+                        print(f"数据库错误: {e}")
+                    else:
+                        print(f"搜索出错: {e}")
+                    if self.on_error is not None:
+                        self.on_error(generation, e)
+                    continue
+                
+                if self.is_current(generation):
+                    self.on_result(generation, result)
+        finally:
+            with self._condition:
+                self._conn = None
+            self.database.connections.close_reader()
+
+class FileWatcher:
+    """文件系统变化监视器（基类）
+    
+    在后台线程中监视目录树，对每个变化调用 callback(事件类型, 路径)。
+    重命名按“删除旧路径 + 创建新路径”报告；事件丢失（缓冲区溢出）时报告根目录的 MODIFIED，
+    由调用方重新扫描。子类实现 is_available() 和 _watch()，_watch 在 self._stopped 被设置后返回。
+    """
+    
+    CREATED = 'created'
+    MODIFIED = 'modified'
+    DELETED = 'deleted'
+    
+    def __init__(self, root: str, callback):
+        self.root = os.path.abspath(root)
+        self.callback = callback
+        self._stopped = threading.Event()
+        self._thread = None
+    
+    @classmethod
+    def is_available(cls) -> bool:
+        """当前平台是否支持该监视方式"""
+        return False
+    
+    def start(self):
+        """启动监视线程"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+    
+    def stop(self, timeout: Optional[float] = None):
+        """停止监视"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+    
+    def _run(self):
+        try:
+            self._watch()
+        except Exception as e:
+            print(f"目录监视出错: {e}")
+    
+    def _watch(self):
+        raise NotImplementedError
+    
+    def _emit(self, kind: str, path: str):
+        self.callback(kind, path)
+
+class InotifyWatcher(FileWatcher):
+    """基于 Linux inotify 的监视器（通过 ctypes 调用 libc，无需额外依赖）
+    
+    inotify 不支持递归监视，每个子目录单独添加监视，新建的目录在事件到达时补充监视。
+    """
+    
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_DONT_FOLLOW = 0x02000000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    
+    WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+                  IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW)
+    EVENT_HEADER = struct.Struct('iIII')
+    READ_SIZE = 64 * 1024
+    # 检查停止标志的间隔（秒）
+    POLL_INTERVAL = 0.5
+    
+    _libc = None
+    
+    @classmethod
+    def _load_libc(cls):
+        if cls._libc is None:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+            cls._libc = libc
+        return cls._libc
+    
+    @classmethod
+    def is_available(cls) -> bool:
+        if not sys.platform.startswith('linux'):
+            return False
+        try:
+            return hasattr(cls._load_libc(), 'inotify_init1')
+        except OSError:
+            return False
+    
+    def __init__(self, root: str, callback):
+        super().__init__(root, callback)
+        self._fd = -1
+        self._watches = {}
+    
+    def _add_watch(self, directory: str):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), self.WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error == errno.ENOSPC:
+                print(f"目录监视数量达到上限（fs.inotify.max_user_watches），未监视: {directory}")
+            return
+        self._watches[wd] = directory
+    
+    def _add_tree(self, root: str):
+        for directory, _ in scan_files(root):
+            self._add_watch(directory)
+    
+    def _watch(self):
+        libc = self._load_libc()
+        self._fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        try:
+            self._add_tree(self.root)
+            while not self._stopped.is_set():
+                readable, _, _ = select.select([self._fd], [], [], self.POLL_INTERVAL)
+                if not readable:
+                    continue
+                try:
+                    data = os.read(self._fd, self.READ_SIZE)
+                except BlockingIOError:
+                    continue
+                self._handle_events(data)
+        finally:
+            os.close(self._fd)
+            self._fd = -1
+            self._watches.clear()
+    
+    def _handle_events(self, data: bytes):
+        offset = 0
+        while offset + self.EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            
+            if mask & self.IN_Q_OVERFLOW:
+                self._emit(self.MODIFIED, self.root)
+                continue
+            if mask & self.IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            directory = self._watches.get(wd)
+            if directory is None or not name:
+                continue
+            
+            path = os.path.join(directory, os.fsdecode(name))
+            if mask & (self.IN_DELETE | self.IN_MOVED_FROM):
+                self._emit(self.DELETED, path)
+            elif mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                if mask & self.IN_ISDIR:
+                    # 新目录（或移入的目录树）需要补充监视
+                    self._add_tree(path)
+                self._emit(self.CREATED, path)
+            else:
+                self._emit(self.MODIFIED, path)
+
+class WindowsWatcher(FileWatcher):
+    """基于 ReadDirectoryChangesW 的监视器（需要 pywin32），原生支持递归监视"""
+    
+    FILE_LIST_DIRECTORY = 0x0001
+    BUFFER_SIZE = 64 * 1024
+    # 等待事件时检查停止标志的间隔（毫秒）
+    POLL_INTERVAL_MS = 500
+    # FILE_NOTIFY_INFORMATION 中的操作类型
+    ACTIONS = {1: FileWatcher.CREATED, 2: FileWatcher.DELETED, 3: FileWatcher.MODIFIED,
+               4: FileWatcher.DELETED, 5: FileWatcher.CREATED}
+    
+    @classmethod
+    def is_available(cls) -> bool:
+        return WINDOWS_API_AVAILABLE
+    
+    def _watch(self):
+        import pywintypes
+        import win32event
+        
+        handle = win32file.CreateFile(
+            self.root, self.FILE_LIST_DIRECTORY,
+            win32con.FILE_SHARE_READ | win32con.FILE_SHARE_WRITE | win32con.FILE_SHARE_DELETE,
+            None, win32con.OPEN_EXISTING,
+            win32con.FILE_FLAG_BACKUP_SEMANTICS | win32con.FILE_FLAG_OVERLAPPED, None
+        )
+        overlapped = pywintypes.OVERLAPPED()
+        overlapped.hEvent = win32event.CreateEvent(None, True, False, None)
+        buffer = win32file.AllocateReadBuffer(self.BUFFER_SIZE)
+        notify_filter = (win32con.FILE_NOTIFY_CHANGE_FILE_NAME | win32con.FILE_NOTIFY_CHANGE_DIR_NAME |
+                         win32con.FILE_NOTIFY_CHANGE_SIZE | win32con.FILE_NOTIFY_CHANGE_LAST_WRITE)
+        try:
+            while not self._stopped.is_set():
+                win32file.ReadDirectoryChangesW(handle, buffer, True, notify_filter, overlapped)
+                while not self._stopped.is_set():
+                    if win32event.WaitForSingleObject(overlapped.hEvent,
+                                                      self.POLL_INTERVAL_MS) == win32event.WAIT_OBJECT_0:
+                        break
+                if self._stopped.is_set():
+                    win32file.CancelIo(handle)
+                    break
+                
+                size = win32file.GetOverlappedResult(handle, overlapped, True)
+                if not size:
+                    # 缓冲区溢出，事件已丢失
+                    self._emit(self.MODIFIED, self.root)
+                    continue
+                for action, name in win32file.FILE_NOTIFY_INFORMATION(buffer, size):
+                    kind = self.ACTIONS.get(action)
+                    if kind:
+                        self._emit(kind, os.path.join(self.root, name))
+        finally:
+            handle.Close()
+
+# 按顺序尝试的监视方式，新的平台实现加入这里即可
+FILE_WATCHER_BACKENDS = [InotifyWatcher, WindowsWatcher]
+
+def create_file_watcher(root: str, callback) -> Optional[FileWatcher]:
+    """为当前平台创建目录监视器，不支持时返回 None"""
+    for backend in FILE_WATCHER_BACKENDS:
+        if backend.is_available():
+            return backend(root, callback)
+    return None
+
+class LiveIndexUpdater:
+    """监视模式：把文件系统变化增量写入索引
+    
+    同一路径的多次事件合并为一次，在 QUIET_PERIOD 秒内没有新事件（持续有事件时最多等待 MAX_DELAY 秒）
+    后批量处理：按磁盘上的当前状态更新，文件存在则写入基本信息（属性由 PropertyEnricher 补全），
+    目录存在则扫描整个子目录，不存在则从索引中删除该路径及其子路径。
+    """
+    
+    QUIET_PERIOD = 1.0
+    MAX_DELAY = 5.0
+    
+    def __init__(self, database: 'LightweightDatabase', build_file_info, on_update=None,
+                 watcher_factory=create_file_watcher):
+        self.database = database
+        self.build_file_info = build_file_info
+        self.on_update = on_update
+        self.watcher_factory = watcher_factory
+        self.watcher = None
+        self._changes = {}
+        self._first_change = None
+        self._last_change = None
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = None
+    
+    def start(self, root: str) -> bool:
+        """开始监视目录，当前平台不支持时返回 False"""
+        self.stop()
+        self.watcher = self.watcher_factory(root, self.on_event)
+        if self.watcher is None:
+            return False
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self.watcher.start()
+        return True
+    
+    def stop(self, timeout: Optional[float] = None):
+        """停止监视，已收到的变化会先写入索引"""
+        if self.watcher is not None:
+            self.watcher.stop(timeout)
+            self.watcher = None
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+    
+    def on_event(self, kind: str, path: str):
+        """接收监视器的事件（在监视线程中调用）"""
+        with self._condition:
+            now = time.monotonic()
+            if not self._changes:
+                self._first_change = now
+            self._last_change = now
+            self._changes[path] = kind
+            self._condition.notify()
+    
+    def _run(self):
+        try:
+            self._process_changes()
+        finally:
+            # 每次 start() 都是新线程，查询指纹时打开的读连接随线程结束关闭
+            self.database.connections.close_reader()
+    
+    def _process_changes(self):
+        while True:
+            with self._condition:
+                while not self._stopped:
+                    if self._changes:
+                        now = time.monotonic()
+                        deadline = min(self._last_change + self.QUIET_PERIOD, self._first_change + self.MAX_DELAY)
+                        if now >= deadline:
+                            break
+                        self._condition.wait(deadline - now)
+                    else:
+                        self._condition.wait()
+                if self._stopped and not self._changes:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"更新索引出错: {e}")
+    
+    def flush(self) -> tuple:
+        """处理已合并的变化，返回 (写入文件数, 删除文件数)"""
+        with self._condition:
+            changes, self._changes = self._changes, {}
+        if not changes:
+            return 0, 0
+        
+        removed_paths = []
+        scanned_directories = []
+        candidates = []
+        for path in sorted(changes):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                removed_paths.append(path)
+                continue
+            
+            if os.path.isdir(path):
+                if os.path.islink(path):
+                    continue
+                scanned_directories.append(path)
+                for _, entries in scan_files(path):
+                    for entry in entries:
+                        try:
+                            candidates.append((entry.name, entry.path, entry.stat()))
+                        except OSError:
+                            continue
+            else:
+                candidates.append((os.path.basename(path), path, stat))
+        
+        removed = self.database.remove_paths(removed_paths) if removed_paths else 0
+        
+        # 与增量索引相同：指纹未变化的文件（例如只改了访问时间）只标记本轮 generation，
+        # 扫描过的目录中未被标记的记录（事件丢失时已删除的文件）随后清理
+        generation = self.database.begin_generation()
+        file_infos = []
+        for i in range(0, len(candidates), self.database.batch_size):
+            chunk = candidates[i:i + self.database.batch_size]
+            fingerprints = self.database.get_file_fingerprints([path for _, path, _ in chunk])
+            for name, path, stat in chunk:
+                if fingerprints.get(path) == (stat.st_size, stat.st_mtime_ns, stat.st_ino):
+                    file_infos.append({'path': path, 'unchanged': True, 'device': stat.st_dev})
+                else:
+                    file_infos.append(self.build_file_info(name, path, stat))
+        
+        updated = self.database.add_files(file_infos, generation=generation)
+        for directory in scanned_directories:
+            removed += self.database.sweep_stale_files(directory, generation)
+        
+        if self.on_update and (updated or removed):
+            self.on_update(updated, removed)
+        return updated, removed
+
 class PropertySorter:
     """属性排序管理器"""
     
@@ -228,9 +1486,46 @@ class PropertySorter:
             'accessed': '访问时间',
             'is_hidden': '是否隐藏',
             'is_readonly': '是否只读',
-            'is_system': '是否系统文件'
+            'is_system': '是否系统文件',
+            'width': '宽度',
+            'height': '高度',
+            'duration': '时长',
+            'bitrate': '比特率'
+        }
+        
+        # 排序属性对应的 SQL 表达式（files 表别名为 f，dirs 表别名为 d，file_properties 表别名为 fp），
+        # 用于在数据库中排序；路径按 (目录, 文件名) 两列排序，可以沿目录路径索引和 (目录, 文件名) 索引读取。
+        # 媒体属性缺失时取 -1（升序时排在最前），文件表的排序列写入时不保存 NULL，
+        # 使非 NULL 的游标值之后不会再出现 NULL（见 _build_keyset_condition）
+        self.sort_expressions = {
+            'name': 'f.name',
+            'path': ('d.path', 'f.name'),
+            'size': 'f.size',
+            'type': 'f.type',
+            'modified': 'f.modified',
+            'created': 'f.created',
+            'accessed': 'f.accessed',
+            'length': 'length(f.name)',
+            'attributes': 'f.attributes',
+            'hash': 'f.hash',
+            'extension': 'f.extension',
+            'size_on_disk': 'f.size',
+            'is_hidden': "instr(f.attributes, 'H') > 0",
+            'is_readonly': "instr(f.attributes, 'R') > 0",
+            'is_system': "instr(f.attributes, 'S') > 0",
+            'width': 'IFNULL(fp.width, -1)',
+            'height': 'IFNULL(fp.height, -1)',
+            'duration': 'IFNULL(fp.duration, -1)',
+            'bitrate': 'IFNULL(fp.bitrate, -1)'
         }
     
+    def get_sort_expressions(self, property_name: str) -> tuple:
+        """获取排序属性对应的 SQL 表达式（一个或多个）"""
+        if property_name not in self.sort_expressions:
+            raise ValueError(f"不支持的排序属性: {property_name}")
+        expression = self.sort_expressions[property_name]
+        return expression if isinstance(expression, tuple) else (expression,)
+    
     def get_sort_key(self, file_info, property_name):
         """获取排序键值"""
         if property_name == 'size':
@@ -257,186 +1552,2094 @@ class PropertySorter:
             return file_info.get('is_readonly', False)
         elif property_name == 'is_system':
             return file_info.get('is_system', False)
+        elif property_name in ('width', 'height', 'duration', 'bitrate'):
+            value = file_info.get('properties', {}).get(property_name, file_info.get(property_name))
+            return value if value is not None else -1
         else:
             return file_info.get(property_name, '')
     
-    def sort_files(self, files, property_name, reverse=False):
-        """排序文件列表"""
-        return sorted(files, key=lambda x: self.get_sort_key(x, property_name), reverse=reverse)
-
-class LightweightDatabase:
-    """轻量级数据库管理器"""
+    def sort_files(self, files, property_name, reverse=False):
+        """排序文件列表"""
+        return sorted(files, key=lambda x: self.get_sort_key(x, property_name), reverse=reverse)
+
+class ConnectionManager:
+    """SQLite 连接管理器
+    
+    一个长期保持的写入连接（由调用方加锁，多个线程共用），加上每个线程一个只读连接。
+    数据库使用 WAL 模式，读连接可以在索引写入的同时查询；连接长期保持，
+    语句缓存（cached_statements）中预编译的查询可以反复使用。
+    """
+    
+    # 每个连接缓存的预编译语句数
+    CACHED_STATEMENTS = 256
+    # 所有连接的参数：页缓存 64MB（负数单位为 KB），内存映射 256MB，临时表放在内存中
+    CONNECTION_PRAGMAS = (
+        'PRAGMA cache_size = -65536',
+        'PRAGMA mmap_size = 268435456',
+        'PRAGMA temp_store = MEMORY',
+        'PRAGMA busy_timeout = 5000',
+    )
+    
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._writer = None
+        self._readers = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+    
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=self.CACHED_STATEMENTS)
+        for pragma in self.CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+    
+    def writer(self) -> sqlite3.Connection:
+        """获取写入连接（调用方负责加锁）"""
+        if self._writer is None:
+            conn = self._connect()
+            # WAL 模式保存在数据库文件中；WAL 下 synchronous = NORMAL 只在检查点同步磁盘，断电不会损坏数据库
+            try:
+                conn.execute('PRAGMA journal_mode = WAL')
+            except sqlite3.OperationalError as e:
+                print(f"数据库错误: {e}")
+            conn.execute('PRAGMA synchronous = NORMAL')
+            self._writer = conn
+        return self._writer
+    
+    def reader(self) -> sqlite3.Connection:
+        """获取当前线程的只读连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            conn.execute('PRAGMA query_only = ON')
+            self._local.conn = conn
+            with self._lock:
+                self._readers.append(conn)
+        return conn
+    
+    def close_reader(self):
+        """关闭当前线程的只读连接（后台线程退出时调用）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.conn = None
+            with self._lock:
+                self._readers.remove(conn)
+            conn.close()
+    
+    def close(self):
+        """关闭所有连接"""
+        with self._lock:
+            readers, self._readers = self._readers, []
+        for conn in readers:
+            conn.close()
+        # 其他线程下次使用时重新打开
+        self._local = threading.local()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+class NameIndex:
+    """内存中的紧凑文件名索引
+
+    所有文件路径（转为小写）以 UTF-8 拼接成一个 bytearray，以 \\0 分隔（路径中不会出现 \\0），
+    另用整数数组保存每个文件的起始偏移和 id，每个文件只比路径多占二十几个字节，
+    远小于每个文件一个 Python 字符串或字典。搜索直接在整块数据上用 bytearray.find 查找子串，
+    由偏移数组二分找到所在的文件，取够 limit 个结果即停止。
+    路径包含文件名，匹配路径即相当于数据库中“文件名或路径包含关键词”。
+    
+    加载时文件按 (文件名, id) 排序，与数据库的默认排序一致，按顺序找到的前 limit 个就是默认视图的第一页。
+    加载之后新增的文件追加在末尾（不排序），删除的文件用 \\0 覆盖（不会再被匹配）；
+    变化过多时（needs_reload）由数据库重新加载。
+    
+    索引可以保存为快照文件（save），下次启动时直接内存映射（open_snapshot），不需要读取数据库或反序列化，
+    第一次修改时才复制到内存。
+    """
+    
+    SEPARATOR = b'\0'
+    # 新增和删除的文件超过这个数、且超过已排序文件数的一半时重新加载
+    RELOAD_MIN_CHANGES = 50000
+    # 快照文件头：魔数、格式版本、是否小端字节序、末尾 id 是否递增、
+    # 文件数、已排序文件数、路径数据长度、已删除文件数、对应的数据库版本（两项）
+    SNAPSHOT_HEADER = struct.Struct('<4sIII6q')
+    SNAPSHOT_MAGIC = b'EVNI'
+    SNAPSHOT_VERSION = 1
+    # 快照中各部分的对齐（Windows 内存映射的偏移须为 64KB 的倍数）：
+    # 文件头 | 偏移、id、id 顺序三个 int64 数组 | 路径数据
+    SNAPSHOT_ALIGNMENT = 65536
+    
+    def __init__(self):
+        self._blob = bytearray()
+        self._offsets = array('q')
+        self._ids = array('q')
+        # 前 _sorted_count 个文件按文件名排序，_id_order 为它们按 id 递增排列的位置，用于按 id 查找
+        self._sorted_count = 0
+        self._id_order = array('q')
+        # 末尾新增的文件 id 是否递增（AUTOINCREMENT 保证新文件的 id 更大）
+        self._tail_ascending = True
+        self._dead = 0
+        # 内存映射的快照（未修改时直接在快照上搜索），没有时为 None
+        self._snapshot = None
+        self._path_separators = tuple({sep.encode() for sep in (os.sep, os.altsep) if sep})
+        self._lock = threading.Lock()
+    
+    def __len__(self):
+        return len(self._ids) - self._dead
+    
+    @staticmethod
+    def _encode(text: str) -> bytes:
+        return text.lower().encode('utf-8', 'surrogatepass')
+    
+    def load(self, rows):
+        """由 (id, 路径) 行（按文件名、id 排序）重新建立索引，建立期间仍可使用旧索引搜索"""
+        blob, offsets, ids = bytearray(), array('q'), array('q')
+        for file_id, path in rows:
+            offsets.append(len(blob))
+            ids.append(file_id)
+            blob += self._encode(path)
+            blob += self.SEPARATOR
+        id_order = array('q', sorted(range(len(ids)), key=ids.__getitem__))
+        
+        with self._lock:
+            self._blob, self._offsets, self._ids = blob, offsets, ids
+            self._sorted_count = len(ids)
+            self._id_order = id_order
+            self._tail_ascending = True
+            self._dead = 0
+            self._snapshot = None
+    
+    def apply(self, changes: List[tuple]):
+        """应用数据库中文件的增删 [(id, 路径), ...]，路径为 None 表示删除"""
+        with self._lock:
+            self._make_writable()
+            for file_id, path in changes:
+                if path is None:
+                    self._remove(file_id)
+                else:
+                    self._append(file_id, path)
+    
+    def needs_reload(self) -> bool:
+        """加载之后的变化是否多到需要重新加载（末尾未排序的部分过长或删除的文件过多）"""
+        changes = len(self._ids) - self._sorted_count + self._dead
+        return changes >= self.RELOAD_MIN_CHANGES and changes * 2 > self._sorted_count
+    
+    def _make_writable(self):
+        """快照的内存映射是只读的，第一次修改前复制到内存"""
+        if self._snapshot is None:
+            return
+        self._blob = bytearray(self._blob)
+        arrays = []
+        for values in (self._offsets, self._ids, self._id_order):
+            copy = array('q')
+            copy.frombytes(values.cast('B'))
+            arrays.append(copy)
+        self._offsets, self._ids, self._id_order = arrays
+        self._snapshot = None
+    
+    def save(self, path, fingerprint: tuple):
+        """将索引写入快照文件，fingerprint 为对应的数据库版本（见 LightweightDatabase._files_fingerprint）
+        
+        先写临时文件再替换，写入中断不会留下损坏的快照。直接映射自快照且未修改的索引不需要保存。
+        """
+        with self._lock:
+            if self._snapshot is not None:
+                return
+            header = self.SNAPSHOT_HEADER.pack(
+                self.SNAPSHOT_MAGIC, self.SNAPSHOT_VERSION, sys.byteorder == 'little', self._tail_ascending,
+                len(self._ids), self._sorted_count, len(self._blob), self._dead, *fingerprint
+            )
+            temp_path = f"{path}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(header)
+                f.write(bytes(self.SNAPSHOT_ALIGNMENT - len(header)))
+                for values in (self._offsets, self._ids, self._id_order):
+                    values.tofile(f)
+                f.write(bytes(-f.tell() % self.SNAPSHOT_ALIGNMENT))
+                f.write(self._blob)
+            os.replace(temp_path, path)
+    
+    @classmethod
+    def open_snapshot(cls, path) -> Optional[tuple]:
+        """内存映射快照文件，返回 (索引, 数据库版本)；文件不存在或格式不符时返回 None"""
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                header = f.read(cls.SNAPSHOT_HEADER.size)
+                if len(header) < cls.SNAPSHOT_HEADER.size:
+                    return None
+                (magic, version, little_endian, tail_ascending, count, sorted_count, blob_length, dead,
+                 *fingerprint) = cls.SNAPSHOT_HEADER.unpack(header)
+                arrays_length = 8 * (2 * count + sorted_count)
+                blob_offset = cls.SNAPSHOT_ALIGNMENT + -(-arrays_length // cls.SNAPSHOT_ALIGNMENT) * cls.SNAPSHOT_ALIGNMENT
+                if (magic != cls.SNAPSHOT_MAGIC or version != cls.SNAPSHOT_VERSION
+                        or bool(little_endian) != (sys.byteorder == 'little')
+                        or os.fstat(f.fileno()).st_size != blob_offset + blob_length):
+                    return None
+                
+                index = cls()
+                if count:
+                    arrays = mmap.mmap(f.fileno(), arrays_length, access=mmap.ACCESS_READ,
+                                       offset=cls.SNAPSHOT_ALIGNMENT)
+                    blob = mmap.mmap(f.fileno(), blob_length, access=mmap.ACCESS_READ, offset=blob_offset)
+                    view = memoryview(arrays).cast('q')
+                    index._offsets = view[:count]
+                    index._ids = view[count:2 * count]
+                    index._id_order = view[2 * count:]
+                    index._blob = blob
+                    index._snapshot = (arrays, blob)
+        except (OSError, ValueError, struct.error) as e:
+            print(f"读取文件名索引快照失败: {e}")
+            return None
+        
+        index._sorted_count = sorted_count
+        index._tail_ascending = bool(tail_ascending)
+        index._dead = dead
+        return index, tuple(fingerprint)
+    
+    def _append(self, file_id: int, path: str):
+        if len(self._ids) > self._sorted_count and file_id <= self._ids[-1]:
+            self._tail_ascending = False
+        self._offsets.append(len(self._blob))
+        self._ids.append(file_id)
+        self._blob += self._encode(path)
+        self._blob += self.SEPARATOR
+    
+    def _end(self, i: int) -> int:
+        """第 i 个文件的分隔符位置"""
+        return self._offsets[i + 1] - 1 if i + 1 < len(self._offsets) else len(self._blob) - 1
+    
+    def _alive(self, i: int) -> bool:
+        return self._blob[self._offsets[i]] != 0
+    
+    def _find(self, file_id: int) -> int:
+        """返回 id 对应的（未删除的）位置，不存在时返回 -1"""
+        ids, order = self._ids, self._id_order
+        
+        # 已排序部分：按 id 二分查找
+        lo, hi = 0, len(order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if ids[order[mid]] < file_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(order) and ids[order[lo]] == file_id and self._alive(order[lo]):
+            return order[lo]
+        
+        # 末尾新增部分：id 通常递增；路径被修改的文件会重新追加，此时逐个查找
+        if self._tail_ascending:
+            i = bisect.bisect_left(ids, file_id, self._sorted_count)
+            if i < len(ids) and ids[i] == file_id and self._alive(i):
+                return i
+        else:
+            for i in range(len(ids) - 1, self._sorted_count - 1, -1):
+                if ids[i] == file_id and self._alive(i):
+                    return i
+        return -1
+    
+    def _remove(self, file_id: int):
+        i = self._find(file_id)
+        if i < 0:
+            return
+        start, end = self._offsets[i], self._end(i)
+        self._blob[start:end] = bytes(end - start)
+        self._dead += 1
+    
+    def _scan(self, needle: bytes, start: int, end: int, limit: Optional[int], prefix: bool,
+              results: List[int]) -> bool:
+        """在 blob[start:end] 中查找，将匹配的 id 追加到 results，取够 limit 个即停止并返回 True"""
+        blob, offsets, ids = self._blob, self._offsets, self._ids
+        pos = blob.find(needle, start, end)
+        while pos != -1:
+            i = bisect.bisect_right(offsets, pos) - 1
+            entry_start, entry_end = offsets[i], self._end(i)
+            if prefix:
+                # 文件名从最后一个路径分隔符之后开始
+                name_start = max([entry_start] + [blob.rfind(sep, entry_start, entry_end) + 1
+                                                  for sep in self._path_separators])
+                matched = blob[name_start:name_start + len(needle)] == needle
+            else:
+                matched = True
+            if matched:
+                results.append(ids[i])
+                if limit is not None and len(results) >= limit:
+                    return True
+            # 同一个文件只返回一次，从下一个文件继续查找
+            pos = blob.find(needle, entry_end + 1, end)
+        return False
+    
+    def _needle(self, query: str) -> Optional[bytes]:
+        needle = self._encode(query)
+        return needle if needle and self.SEPARATOR not in needle else None
+    
+    def search(self, query: str, limit: Optional[int] = None, prefix: bool = False) -> List[int]:
+        """返回路径包含关键词（不区分大小写）的文件 id，取够 limit 个即停止
+        
+        结果按索引顺序：先是加载时已有的文件（按文件名排序），然后是加载之后新增的文件。
+        prefix 为 True 时只匹配文件名以关键词开头的文件。
+        """
+        needle = self._needle(query)
+        results = []
+        if needle is not None:
+            with self._lock:
+                self._scan(needle, 0, len(self._blob), limit, prefix, results)
+        return results
+    
+    def first_page_candidates(self, query: str, limit: int, prefix: bool = False,
+                              max_scan: Optional[int] = None) -> Optional[List[int]]:
+        """按文件名排序的前 limit 个匹配文件的候选 id
+        
+        包括新增部分中的全部匹配和已排序部分中的前 limit 个匹配，真正的前 limit 个一定在其中。
+        max_scan 限制查找的字节数：匹配很少的关键词需要查找整个索引，不如数据库的全文索引快，
+        超过限制仍未找够 limit 个时返回 None。
+        """
+        needle = self._needle(query)
+        if needle is None:
+            return []
+        
+        results = []
+        with self._lock:
+            tail_start = (self._offsets[self._sorted_count] if self._sorted_count < len(self._offsets)
+                          else len(self._blob))
+            sorted_end = tail_start
+            if max_scan is not None:
+                budget = max_scan - (len(self._blob) - tail_start)
+                if budget < 0:
+                    return None
+                sorted_end = min(tail_start, budget)
+            self._scan(needle, tail_start, len(self._blob), None, prefix, results)
+            if not self._scan(needle, 0, sorted_end, limit, prefix, results) and sorted_end < tail_start:
+                return None
+        return results
+    
+    def memory_usage(self) -> int:
+        """索引占用的内存（字节）"""
+        return len(self._blob) + sum(values.itemsize * len(values)
+                                     for values in (self._offsets, self._ids, self._id_order))
+
+class QueryNode:
+    """搜索语法树的节点
+    
+    kind 为 'and'、'or'、'not' 时 children 为子节点；其余为单个条件，value 为解析后的值：
+    'text'（文件名或路径包含）、'name'（文件名包含）、'wildcard'（通配符）、'ext'（扩展名元组）、
+    'size'（字节范围 [最小, 最大)）、'dm'/'dc'/'da'（修改/创建/访问时间范围 [起, 止)）、
+    'type'（文件类型）、'fuzzy'（按顺序出现的字符）、'regex'（编译后的正则表达式）。
+    """
+    
+    def __init__(self, kind: str, value: Any = None, children: Optional[List['QueryNode']] = None):
+        self.kind = kind
+        self.value = value
+        self.children = children or []
+    
+    def __eq__(self, other):
+        return (isinstance(other, QueryNode)
+                and (self.kind, self.value, self.children) == (other.kind, other.value, other.children))
+    
+    def __repr__(self):
+        if self.kind in ('and', 'or', 'not'):
+            return f"{self.kind.upper()}({', '.join(map(repr, self.children))})"
+        return f"{self.kind}:{self.value!r}"
+
+class QueryParser:
+    """Everything 风格的搜索语法，解析为语法树（QueryNode）
+    
+    空格分隔的各项需同时满足，| 表示或（优先级高于空格：a b|c 即 a 且 (b 或 c)），
+    ! 开头表示排除，<...> 分组，"..." 中的空格和特殊字符按原样匹配。
+    含 * 或 ? 的关键词为通配符，匹配整个文件名（含路径分隔符时匹配完整路径）。
+    函数：ext:mp4;mkv、size:>1gb、dm:thisweek（dc:、da:）、type:视频、path:、name:、regex:、fuzzy:，
+    未知的函数名（如 C:\\）按普通关键词处理。值无效时抛出 ValueError。
+    """
+    
+    # 函数名 -> 条件类型
+    FUNCTIONS = {
+        'ext': 'ext',
+        'size': 'size',
+        'dm': 'dm', 'datemodified': 'dm',
+        'dc': 'dc', 'datecreated': 'dc',
+        'da': 'da', 'dateaccessed': 'da',
+        'type': 'type',
+        'path': 'text',
+        'name': 'name',
+        'regex': 'regex',
+        'fuzzy': 'fuzzy',
+    }
+    # 英文文件类型名
+    TYPE_ALIASES = {
+        'audio': '音频', 'music': '音频',
+        'video': '视频',
+        'picture': '图片', 'image': '图片', 'photo': '图片',
+        'document': '文档', 'doc': '文档',
+        'archive': '压缩文件', 'compressed': '压缩文件', 'zip': '压缩文件',
+        'executable': '可执行文件', 'exe': '可执行文件',
+        'other': '其他',
+    }
+    # 大小关键词对应的范围 [最小, 最大)
+    SIZE_KEYWORDS = {
+        'empty': (0, 1),
+        'tiny': (1, 10 * 1024),
+        'small': (10 * 1024, 100 * 1024),
+        'medium': (100 * 1024, 1024 ** 2),
+        'large': (1024 ** 2, 16 * 1024 ** 2),
+        'huge': (16 * 1024 ** 2, 128 * 1024 ** 2),
+        'gigantic': (128 * 1024 ** 2, None),
+    }
+    SIZE_UNITS = {'': 1, 'b': 1, 'k': 1024, 'kb': 1024, 'm': 1024 ** 2, 'mb': 1024 ** 2,
+                  'g': 1024 ** 3, 'gb': 1024 ** 3, 't': 1024 ** 4, 'tb': 1024 ** 4}
+    
+    def __init__(self, now: Optional[datetime] = None):
+        # today、thisweek 等时间关键词的基准时间，默认为解析时的当前时间
+        self.now = now
+        self._tokens = []
+        self._position = 0
+    
+    def parse(self, text: str) -> Optional[QueryNode]:
+        """解析搜索文本，没有任何条件时返回 None"""
+        self._tokens = self._tokenize(text)
+        self._position = 0
+        return self._parse_and()
+    
+    def _tokenize(self, text: str) -> List[tuple]:
+        """拆分为 ('term', 文本, 是否以引号开头, 是否含引号)、('or',)、('not',)、('open',)、('close',)"""
+        tokens = []
+        chars = []
+        starts_quoted = has_quotes = in_quotes = False
+        depth = 0
+        
+        def end_term():
+            nonlocal starts_quoted, has_quotes
+            if chars:
+                tokens.append(('term', ''.join(chars), starts_quoted, has_quotes))
+            chars.clear()
+            starts_quoted = has_quotes = False
+        
+        for i, char in enumerate(text):
+            at_start = not chars and not has_quotes
+            if char == '"':
+                starts_quoted = starts_quoted or at_start
+                has_quotes = True
+                in_quotes = not in_quotes
+            elif in_quotes:
+                chars.append(char)
+            elif char.isspace():
+                end_term()
+            elif char == '|':
+                end_term()
+                tokens.append(('or',))
+            elif char == '!' and at_start:
+                tokens.append(('not',))
+            elif char == '<' and at_start:
+                depth += 1
+                tokens.append(('open',))
+            elif char == '>' and depth > 0 and (i + 1 == len(text) or text[i + 1].isspace() or text[i + 1] in '|>'):
+                # 只有分组内、位于词尾的 > 才结束分组，size:>1gb 中的 > 是比较运算符
+                end_term()
+                depth -= 1
+                tokens.append(('close',))
+            else:
+                chars.append(char)
+        end_term()
+        return tokens
+    
+    def _peek(self) -> Optional[str]:
+        if self._position < len(self._tokens):
+            return self._tokens[self._position][0]
+        return None
+    
+    @staticmethod
+    def _combine(kind: str, children: List[QueryNode]) -> Optional[QueryNode]:
+        if not children:
+            return None
+        if len(children) == 1:
+            return children[0]
+        return QueryNode(kind, children=children)
+    
+    def _parse_and(self) -> Optional[QueryNode]:
+        children = []
+        while self._peek() not in (None, 'close'):
+            node = self._parse_or()
+            if node is not None:
+                children.append(node)
+        return self._combine('and', children)
+    
+    def _parse_or(self) -> Optional[QueryNode]:
+        children = [self._parse_unary()]
+        while self._peek() == 'or':
+            self._position += 1
+            children.append(self._parse_unary())
+        return self._combine('or', [child for child in children if child is not None])
+    
+    def _parse_unary(self) -> Optional[QueryNode]:
+        kind = self._peek()
+        if kind in (None, 'or', 'close'):
+            # 空的操作数（如 "a|" 结尾），忽略
+            return None
+        token = self._tokens[self._position]
+        self._position += 1
+        if kind == 'not':
+            node = self._parse_unary()
+            return QueryNode('not', children=[node]) if node is not None else None
+        if kind == 'open':
+            node = self._parse_and()
+            if self._peek() == 'close':
+                self._position += 1
+            return node
+        return self._parse_term(*token[1:])
+    
+    def _parse_term(self, text: str, starts_quoted: bool, has_quotes: bool) -> Optional[QueryNode]:
+        function, separator, value = text.partition(':')
+        kind = self.FUNCTIONS.get(function.lower())
+        if starts_quoted or not separator or kind is None:
+            kind, value = 'text', text
+        if not value:
+            return None
+        
+        if kind in ('text', 'name'):
+            if not has_quotes and ('*' in value or '?' in value):
+                return QueryNode('wildcard', value)
+            return QueryNode(kind, value)
+        if kind == 'ext':
+            extensions = tuple('.' + extension.strip().lstrip('.').lower()
+                               for extension in value.split(';') if extension.strip().lstrip('.'))
+            return QueryNode('ext', extensions) if extensions else None
+        if kind == 'size':
+            return QueryNode('size', self._parse_range(value, self._parse_size))
+        if kind in ('dm', 'dc', 'da'):
+            return QueryNode(kind, self._parse_range(value, self._parse_date))
+        if kind == 'type':
+            file_type = self.TYPE_ALIASES.get(value.lower(), value)
+            if file_type not in FILE_TYPE_FILTERS and file_type != '其他':
+                raise ValueError(f"未知的文件类型: {value}")
+            return QueryNode('type', file_type)
+        if kind == 'regex':
+            try:
+                return QueryNode('regex', re.compile(value, re.IGNORECASE))
+            except re.error as e:
+                raise ValueError(f"无效的正则表达式 {value}: {e}")
+        return QueryNode('fuzzy', value)
+    
+    @staticmethod
+    def _parse_range(text: str, parse_value) -> tuple:
+        """解析比较或范围，返回 [下限, 上限)
+        
+        parse_value(值) 返回该值对应的区间 [起, 止)（如 1mb 为 [1048576, 1048577)，today 为今天 0 点到明天 0 点），
+        >、>=、<、<= 分别取区间之后、起点及之后、之前、终点之前，a..b 为 a 的起点到 b 的终点。
+        """
+        if '..' in text:
+            lower_text, _, upper_text = text.partition('..')
+            lower = parse_value(lower_text)[0] if lower_text else None
+            upper = parse_value(upper_text)[1] if upper_text else None
+            return lower, upper
+        for operator in ('>=', '<=', '>', '<', '='):
+            if text.startswith(operator):
+                start, end = parse_value(text[len(operator):])
+                return {
+                    '>=': (start, None),
+                    '<=': (None, end),
+                    '>': (end, None),
+                    '<': (None, start),
+                    '=': (start, end),
+                }[operator]
+        return parse_value(text)
+    
+    def _parse_size(self, text: str) -> tuple:
+        text = text.strip().lower()
+        if text in self.SIZE_KEYWORDS:
+            return self.SIZE_KEYWORDS[text]
+        match = re.fullmatch(r'(\d+(?:\.\d+)?)\s*([kmgt]?b?)', text)
+        if not match or match.group(2) not in self.SIZE_UNITS:
+            raise ValueError(f"无效的大小: {text}")
+        size = int(float(match.group(1)) * self.SIZE_UNITS[match.group(2)])
+        return size, size + 1
+    
+    @staticmethod
+    def _add_months(date: datetime, months: int) -> datetime:
+        """月初日期加减若干个月"""
+        month = date.year * 12 + date.month - 1 + months
+        return date.replace(year=month // 12, month=month % 12 + 1)
+    
+    def _parse_date(self, text: str) -> tuple:
+        text = text.strip().lower()
+        today = (self.now or datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0)
+        week = today - timedelta(days=today.weekday())
+        month = today.replace(day=1)
+        year = today.replace(month=1, day=1)
+        keywords = {
+            'today': (today, today + timedelta(days=1)),
+            'yesterday': (today - timedelta(days=1), today),
+            'thisweek': (week, week + timedelta(days=7)),
+            'lastweek': (week - timedelta(days=7), week),
+            'thismonth': (month, self._add_months(month, 1)),
+            'lastmonth': (self._add_months(month, -1), month),
+            'thisyear': (year, year.replace(year=year.year + 1)),
+            'lastyear': (year.replace(year=year.year - 1), year),
+        }
+        if text in keywords:
+            return keywords[text]
+        
+        try:
+            if re.fullmatch(r'\d{4}', text):
+                start = datetime(int(text), 1, 1)
+                return start, start.replace(year=start.year + 1)
+            if re.fullmatch(r'\d{4}-\d{1,2}', text):
+                start = datetime.strptime(text, '%Y-%m')
+                return start, self._add_months(start, 1)
+            start = datetime.fromisoformat(text)
+        except ValueError:
+            raise ValueError(f"无效的日期: {text}")
+        if len(text) <= 10:
+            return start, start + timedelta(days=1)
+        return start, start + timedelta(seconds=1)
+
+class LightweightDatabase:
+    """轻量级数据库管理器"""
+    
+    # 批量写入时每个事务包含的文件数
+    DEFAULT_BATCH_SIZE = 1000
+    # 数据库结构版本（保存在 PRAGMA user_version 中）
+    SCHEMA_VERSION = 9
+    # 目录表结构：每个目录一行，path 为以路径分隔符结尾的完整路径（文件路径 = 目录 path + 文件名）
+    DIRS_TABLE_SCHEMA = '''
+        id INTEGER PRIMARY KEY,
+        parent_id INTEGER REFERENCES dirs (id),
+        name TEXT NOT NULL,
+        path TEXT UNIQUE NOT NULL
+    '''
+    # 文件表结构，时间列为 Unix 时间戳（秒）；不保存完整路径，只保存所在目录和文件名
+    FILES_TABLE_SCHEMA = '''
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        dir_id INTEGER NOT NULL REFERENCES dirs (id),
+        size INTEGER,
+        type TEXT,
+        created INTEGER,
+        modified INTEGER,
+        accessed INTEGER,
+        attributes TEXT,
+        hash TEXT,
+        indexed_at INTEGER,
+        mtime_ns INTEGER,
+        inode INTEGER,
+        generation INTEGER DEFAULT 0,
+        enriched INTEGER DEFAULT 0,
+        extension TEXT,
+        device INTEGER,
+        UNIQUE (dir_id, name)
+    '''
+    # 以时间戳存储的列
+    TIMESTAMP_COLUMNS = ('created', 'modified', 'accessed', 'indexed_at')
+    # 常用的媒体属性：从 JSON 中生成带索引的列，可直接用于排序和筛选
+    INDEXED_PROPERTIES = {'width': 'INTEGER', 'height': 'INTEGER', 'duration': 'REAL', 'bitrate': 'INTEGER'}
+    # 由目录路径和文件名拼出文件完整路径（目录表别名为 d）
+    PATH_EXPRESSION = "d.path || f.name"
+    # 搜索的数据来源；查询未用到属性表时 SQLite 会省略这个 LEFT JOIN
+    SEARCH_FROM = "FROM files f JOIN dirs d ON d.id = f.dir_id LEFT JOIN file_properties fp ON fp.file_id = f.id"
+    # trigram 分词至少需要3个字符，更短的关键词退回 LIKE 扫描
+    FTS_MIN_QUERY_LENGTH = 3
+    # 内存文件名索引给出的候选文件不超过这个数时，直接以 id 列表交给 SQLite，否则仍走全文索引
+    NAME_INDEX_MAX_IDS = 10000
+    # 内存文件名索引每次最多查找的字节数（约几毫秒），找不够一页的少见关键词交给全文索引
+    NAME_INDEX_MAX_SCAN = 4 * 1024 * 1024
+    # 内存文件名索引的数据：按文件名排序的 (id, 完整路径)
+    NAME_INDEX_QUERY = ("SELECT f.id, d.path || f.name FROM files f JOIN dirs d ON d.id = f.dir_id "
+                        "ORDER BY f.name, f.id")
+    # 界面“大小”筛选项对应的范围 [最小, 最大)，单位字节
+    SIZE_FILTERS = {
+        "小于1MB": (None, 1024 ** 2),
+        "1MB-10MB": (1024 ** 2, 10 * 1024 ** 2),
+        "10MB-100MB": (10 * 1024 ** 2, 100 * 1024 ** 2),
+        "大于100MB": (100 * 1024 ** 2, None),
+        "大于1GB": (1024 ** 3, None),
+    }
+    # 搜索语法中大小和时间条件对应的列
+    QUERY_RANGE_COLUMNS = {'size': 'size', 'dm': 'modified', 'dc': 'created', 'da': 'accessed'}
+    # 搜索结果的列（_make_file_info 的前 11 列）
+    RESULT_COLUMNS = (f"f.id, f.name, {PATH_EXPRESSION}, f.size, f.type, f.created, f.modified, f.accessed, "
+                      "f.attributes, f.hash, f.indexed_at")
+    # 含正则表达式等后过滤条件时，每次从数据库读取的行数
+    POST_FILTER_BATCH_SIZE = 2000
+    
+    def __init__(self, data_dir: str, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.data_dir = Path(data_dir)
+        self.sorter = PropertySorter()
+        self.data_dir.mkdir(exist_ok=True)
+        self.db_path = self.data_dir / "files.db"
+        # 内存文件名索引的快照，启动时直接内存映射
+        self.name_index_path = self.data_dir / "name_index.bin"
+        self.batch_size = batch_size
+        self.connections = ConnectionManager(self.db_path)
+        self._write_lock = threading.Lock()
+        self.fts_enabled = False
+        # 内存文件名索引（见 load_name_index），未加载时为 None
+        self.name_index = None
+        self._name_index_conn = None
+        # 从快照打开、尚未与数据库核对的索引对应的数据库版本
+        self._snapshot_fingerprint = None
+        # 升级重建了文件表时，初始化后压缩数据库文件
+        self._vacuum_after_init = False
+        self.init_database()
+    
+    def init_database(self):
+        """初始化数据库"""
+        with self._write_lock:
+            conn = self.get_write_connection()
+            with conn:
+                self._init_database(conn)
+            if self._vacuum_after_init:
+                self._vacuum_after_init = False
+                conn.execute('VACUUM')
+                conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    
+    def _init_database(self, conn: sqlite3.Connection):
+        cursor = conn.cursor()
+        
+        # 创建目录表和文件表
+        cursor.execute(f'CREATE TABLE IF NOT EXISTS dirs ({self.DIRS_TABLE_SCHEMA})')
+        cursor.execute(f'CREATE TABLE IF NOT EXISTS files ({self.FILES_TABLE_SCHEMA})')
+        
+        # 创建属性表：每个文件一行 JSON，常用属性为生成列
+        generated_columns = ''.join(
+            f",\n                {name} {column_type} GENERATED ALWAYS AS (json_extract(data, '$.{name}')) VIRTUAL"
+            for name, column_type in self.INDEXED_PROPERTIES.items()
+        )
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS file_properties (
+                file_id INTEGER PRIMARY KEY REFERENCES files (id),
+                data TEXT NOT NULL{generated_columns}
+            )
+        ''')
+        
+        self.migrate_database(conn)
+        
+        # 创建索引（升级时文件表可能被重建，索引在升级之后创建）
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_dirs_parent ON dirs (parent_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_name ON files (name)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_type ON files (type)')
+        for name in self.INDEXED_PROPERTIES:
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_file_properties_{name} ON file_properties ({name})')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_generation ON files (generation)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_pending ON files (id) WHERE enriched = 0')
+        # 排序常用列的索引
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_size ON files (size)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_modified ON files (modified)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_created ON files (created)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_extension ON files (extension)')
+        
+        self.fts_enabled = self.init_fts(conn)
+        self.init_property_stats(conn)
+    
+    def init_property_stats(self, conn: sqlite3.Connection):
+        """创建属性统计表，并用触发器随属性表增量更新
+        
+        property_stats 保存每个 (属性名, 属性值) 的文件数，property_keys 保存每个属性名的文件数，
+        属性查看器直接分页读取，不必每次对全部属性 JSON 做 GROUP BY。
+        """
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'property_stats'"
+        ).fetchone()
+        
+        if not exists:
+            conn.execute('''
+                CREATE TABLE property_stats (
+                    key TEXT NOT NULL,
+                    value NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (key, value)
+                ) WITHOUT ROWID
+            ''')
+            conn.execute('''
+                CREATE TABLE property_keys (
+                    key TEXT PRIMARY KEY,
+                    count INTEGER NOT NULL
+                ) WITHOUT ROWID
+            ''')
+            # 查看器按数量降序分页
+            conn.execute('CREATE INDEX idx_property_stats_count ON property_stats (key, count DESC, value)')
+        
+        # 条件同时用于区分 UPSERT 与连接语法
+        increment = '''
+            INSERT INTO property_stats (key, value, count)
+            SELECT key, value, 1 FROM json_each(new.data) WHERE value IS NOT NULL
+            ON CONFLICT (key, value) DO UPDATE SET count = count + 1;
+            INSERT INTO property_keys (key, count)
+            SELECT key, 1 FROM json_each(new.data) WHERE value IS NOT NULL
+            ON CONFLICT (key) DO UPDATE SET count = count + 1;
+        '''
+        decrement = '''
+            UPDATE property_stats SET count = count - 1
+            WHERE (key, value) IN (SELECT key, value FROM json_each(old.data));
+            DELETE FROM property_stats
+            WHERE count <= 0 AND (key, value) IN (SELECT key, value FROM json_each(old.data));
+            UPDATE property_keys SET count = count - 1
+            WHERE key IN (SELECT key FROM json_each(old.data));
+            DELETE FROM property_keys
+            WHERE count <= 0 AND key IN (SELECT key FROM json_each(old.data));
+        '''
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS property_stats_insert AFTER INSERT ON file_properties BEGIN
+                {increment}
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS property_stats_delete AFTER DELETE ON file_properties BEGIN
+                {decrement}
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS property_stats_update AFTER UPDATE OF data ON file_properties
+            WHEN old.data IS NOT new.data BEGIN
+                {decrement}
+                {increment}
+            END
+        ''')
+        
+        # 为已有属性建立统计
+        if not exists:
+            conn.execute('''
+                INSERT INTO property_stats (key, value, count)
+                SELECT p.key, p.value, COUNT(*) FROM file_properties fp, json_each(fp.data) p
+                WHERE p.value IS NOT NULL
+                GROUP BY p.key, p.value
+            ''')
+            conn.execute('''
+                INSERT INTO property_keys (key, count)
+                SELECT p.key, COUNT(*) FROM file_properties fp, json_each(fp.data) p
+                WHERE p.value IS NOT NULL
+                GROUP BY p.key
+            ''')
+    
+    def init_fts(self, conn: sqlite3.Connection) -> bool:
+        """创建文件名和目录路径的 FTS5 trigram 全文索引，并用触发器与 files、dirs 表保持同步
+        
+        文件名和目录路径分别索引，同一目录的路径只索引一次（见 _build_query_condition）。
+        SQLite 不支持 FTS5 或 trigram 分词（3.34 之前）时返回 False，搜索退回 LIKE。
+        """
+        created = []
+        for table, column, content in (('files_fts', 'name', 'files'), ('dirs_fts', 'path', 'dirs')):
+            exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+            ).fetchone()
+            if exists:
+                continue
+            try:
+                conn.execute(f'''
+                    CREATE VIRTUAL TABLE {table} USING fts5(
+                        {column}, content='{content}', content_rowid='id', tokenize='trigram'
+                    )
+                ''')
+            except sqlite3.OperationalError as e:
+                print(f"全文索引不可用: {e}")
+                return False
+            created.append(table)
+        
+        # 触发器随文件表一起删除（升级时重建文件表），每次都确保存在
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS files_fts_insert AFTER INSERT ON files BEGIN
+                INSERT INTO files_fts (rowid, name) VALUES (new.id, new.name);
+            END
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS files_fts_delete AFTER DELETE ON files BEGIN
+                INSERT INTO files_fts (files_fts, rowid, name) VALUES ('delete', old.id, old.name);
+            END
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS files_fts_update AFTER UPDATE OF name ON files
+            WHEN old.name IS NOT new.name BEGIN
+                INSERT INTO files_fts (files_fts, rowid, name) VALUES ('delete', old.id, old.name);
+                INSERT INTO files_fts (rowid, name) VALUES (new.id, new.name);
+            END
+        ''')
+        # 目录只会新增和删除，不会修改
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS dirs_fts_insert AFTER INSERT ON dirs BEGIN
+                INSERT INTO dirs_fts (rowid, path) VALUES (new.id, new.path);
+            END
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS dirs_fts_delete AFTER DELETE ON dirs BEGIN
+                INSERT INTO dirs_fts (dirs_fts, rowid, path) VALUES ('delete', old.id, old.path);
+            END
+        ''')
+        
+        # 为已有数据建立全文索引
+        for table in created:
+            conn.execute(f"INSERT INTO {table} ({table}) VALUES ('rebuild')")
+        return True
+    
+    def migrate_database(self, conn: sqlite3.Connection):
+        """升级旧版本数据库结构"""
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        
+        if version < 1:
+            # v1: 增加文件指纹列，用于增量索引
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(files)')}
+            if 'mtime_ns' not in columns:
+                conn.execute('ALTER TABLE files ADD COLUMN mtime_ns INTEGER')
+            if 'inode' not in columns:
+                conn.execute('ALTER TABLE files ADD COLUMN inode INTEGER')
+        
+        if version < 2:
+            # v2: 增加索引轮次列，用于清理已删除的文件
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(files)')}
+            if 'generation' not in columns:
+                conn.execute('ALTER TABLE files ADD COLUMN generation INTEGER DEFAULT 0')
+        
+        if version < 3:
+            # v3: 增加属性补全状态列，已有文件全部交给后台补全（包括以前未计算哈希的大文件）
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(files)')}
+            if 'enriched' not in columns:
+                conn.execute('ALTER TABLE files ADD COLUMN enriched INTEGER DEFAULT 0')
+        
+        if version < 4:
+            # v4: 增加扩展名列，用于在数据库中按扩展名排序
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(files)')}
+            if 'extension' not in columns:
+                conn.execute('ALTER TABLE files ADD COLUMN extension TEXT')
+            conn.create_function('file_extension', 1, lambda name: os.path.splitext(name)[1].lower())
+            conn.execute('UPDATE files SET extension = file_extension(name)')
+        
+        convert_timestamps = False
+        if version < 5:
+            # v5: 时间列由 ISO 字符串改为整数时间戳。旧表的列类型为 TEXT（整数会被转成字符串保存），
+            # 需要重建文件表，与 v7 的重建一起进行
+            column_types = {row[1]: row[2].upper() for row in conn.execute('PRAGMA table_info(files)')}
+            convert_timestamps = column_types.get('created') != 'INTEGER'
+        
+        if version < 6:
+            # v6: 属性由 (file_id, 名称, 文本值) 表改为每个文件一行 JSON，值恢复为数字类型
+            old_table = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'properties'"
+            ).fetchone()
+            if old_table:
+                properties = {}
+                for file_id, name, value in conn.execute(
+                        'SELECT file_id, property_name, property_value FROM properties ORDER BY file_id'):
+                    properties.setdefault(file_id, {})[name] = self._parse_property_value(value)
+                conn.executemany(
+                    'INSERT OR REPLACE INTO file_properties (file_id, data) VALUES (?, ?)',
+                    [(file_id, data) for file_id, data in
+                     ((file_id, self.encode_properties(props)) for file_id, props in properties.items()) if data]
+                )
+                conn.execute('DROP TABLE properties')
+        
+        if version < 7:
+            # v7: 文件表不再保存完整路径，改为目录 id 加文件名，重复的目录前缀只在目录表中保存一次；
+            # 重建文件表（保留 id，属性表无需改动），全文索引改为分别索引文件名和目录路径（由 init_fts 重建）
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(files)')]
+            if 'path' in columns:
+                dir_ids = self._get_dir_ids(conn, {self._split_path(path)[0]
+                                                   for path, in conn.execute('SELECT path FROM files')})
+                conn.create_function('dir_id_of', 1, lambda path: dir_ids[self._split_path(path)[0]])
+                conn.create_function('name_of', 1, lambda path: self._split_path(path)[1])
+                conn.create_function('iso_to_timestamp', 1, self._iso_to_timestamp)
+                
+                conn.execute(f'CREATE TABLE files_new ({self.FILES_TABLE_SCHEMA})')
+                new_columns = [row[1] for row in conn.execute('PRAGMA table_info(files_new)')]
+                select = []
+                for column in new_columns:
+                    if column == 'dir_id':
+                        select.append('dir_id_of(path)')
+                    elif column == 'name':
+                        select.append('name_of(path)')
+                    elif convert_timestamps and column in self.TIMESTAMP_COLUMNS:
+                        select.append(f'iso_to_timestamp({column})')
+                    elif column not in columns:
+                        # 之后版本增加的列
+                        select.append('NULL')
+                    else:
+                        select.append(column)
+                conn.execute(f'INSERT INTO files_new ({", ".join(new_columns)}) SELECT {", ".join(select)} FROM files')
+                conn.execute('DROP TABLE files')
+                conn.execute('ALTER TABLE files_new RENAME TO files')
+                conn.execute('DROP TABLE IF EXISTS files_fts')
+                self._vacuum_after_init = True
+        
+        if version < 8:
+            # v8: 增加设备号列，查找重复文件时按 (设备, inode) 识别硬链接；
+            # 已有文件的设备号在下次增量索引标记未修改文件时补上
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(files)')}
+            if 'device' not in columns:
+                conn.execute('ALTER TABLE files ADD COLUMN device INTEGER')
+        
+        if version < 9:
+            # v9: 可排序的列不再保存 NULL（旧版本中缺失或无法识别的时间、空的哈希值等），
+            # 否则按这些列排序时键集分页会漏掉 NULL 所在的行
+            conn.execute('''
+                UPDATE files SET
+                    size = IFNULL(size, 0), type = IFNULL(type, ''),
+                    created = IFNULL(created, 0), modified = IFNULL(modified, 0), accessed = IFNULL(accessed, 0),
+                    attributes = IFNULL(attributes, ''), hash = IFNULL(hash, ''), extension = IFNULL(extension, '')
+                WHERE size IS NULL OR type IS NULL OR created IS NULL OR modified IS NULL OR accessed IS NULL
+                   OR attributes IS NULL OR hash IS NULL OR extension IS NULL
+            ''')
+        
+        conn.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
     
-    def __init__(self, data_dir: str):
-        self.data_dir = Path(data_dir)
-        self.data_dir.mkdir(exist_ok=True)
-        self.db_path = self.data_dir / "files.db"
-        self.index_path = self.data_dir / "file_index.pkl"
-        self.properties_path = self.data_dir / "properties.pkl"
-        self.init_database()
+    @staticmethod
+    def _parse_property_value(value):
+        """将旧版本以文本保存的属性值还原为数字"""
+        for convert in (int, float):
+            try:
+                number = convert(value)
+            except (TypeError, ValueError):
+                continue
+            if math.isfinite(number):
+                return number
+        return value
     
-    def init_database(self):
-        """初始化数据库"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    @staticmethod
+    def encode_properties(properties: Dict[str, Any]) -> Optional[str]:
+        """将属性编码为 JSON 保存，去掉空值和 NaN/无穷大（SQLite 的 JSON 不支持）；没有属性时返回 None"""
+        values = {
+            name: value for name, value in properties.items()
+            if value is not None and not (isinstance(value, float) and not math.isfinite(value))
+        }
+        if not values:
+            return None
+        return json.dumps(values, ensure_ascii=False, default=str)
+    
+    @staticmethod
+    def decode_properties(data: Optional[str]) -> Dict[str, Any]:
+        """解析数据库中保存的属性 JSON"""
+        return json.loads(data) if data else {}
+    
+    @staticmethod
+    def _iso_to_timestamp(value) -> int:
+        """将旧版本保存的 ISO 时间字符串转换为时间戳，缺失或无法识别的时间记为 0"""
+        if isinstance(value, int):
+            return value
+        try:
+            return int(datetime.fromisoformat(value).timestamp())
+        except (TypeError, ValueError):
+            return 0
+    
+    @staticmethod
+    def to_timestamp(value) -> Optional[int]:
+        """将 datetime 转换为数据库中保存的时间戳（秒）"""
+        if isinstance(value, datetime):
+            return int(value.timestamp())
+        return value
+    
+    @classmethod
+    def _stored_timestamp(cls, value) -> int:
+        """写入数据库的时间戳：缺失的时间记为 0，排序列中不保存 NULL（键集分页无法跳过 NULL）"""
+        timestamp = cls.to_timestamp(value)
+        return 0 if timestamp is None else timestamp
+    
+    def get_write_connection(self) -> sqlite3.Connection:
+        """获取长连接（写入专用，索引线程与界面线程共用，使用时需持有 _write_lock）"""
+        conn = self.connections.writer()
+        if self.name_index is not None and conn is not self._name_index_conn:
+            # 写入连接重新打开后，临时触发器需要重新创建
+            self._install_name_index_journal(conn)
+        return conn
+    
+    def get_read_connection(self) -> sqlite3.Connection:
+        """获取当前线程的只读连接，可与写入并发"""
+        return self.connections.reader()
+    
+    def close(self):
+        """关闭所有连接"""
+        with self._write_lock:
+            self.connections.close()
+    
+    def load_name_index(self) -> NameIndex:
+        """建立内存文件名索引，之后默认视图第一页的关键词搜索先查内存索引（见 _name_index_candidates）
         
-        # 创建文件表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS files (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                path TEXT UNIQUE NOT NULL,
-                size INTEGER,
-                type TEXT,
-                created TEXT,
-                modified TEXT,
-                accessed TEXT,
-                attributes TEXT,
-                hash TEXT,
-                indexed_at TEXT
-            )
-        ''')
+        写入连接上的临时触发器把文件的增删记录到 temp.name_index_changes，
+        每次写入提交后应用到内存索引（见 _sync_name_index），与数据库保持一致。
+        已从快照打开索引时（open_name_index_snapshot），快照与数据库一致则直接使用，否则重新读取。
+        """
+        with self._write_lock:
+            conn = self.get_write_connection()
+            index = self.name_index
+            if index is None or (self._snapshot_fingerprint is not None
+                                 and self._snapshot_fingerprint != self._files_fingerprint(conn)):
+                index = NameIndex()
+                index.load(conn.execute(self.NAME_INDEX_QUERY))
+            self._snapshot_fingerprint = None
+            self._install_name_index_journal(conn)
+            self.name_index = index
+        return index
+    
+    def open_name_index_snapshot(self) -> Optional[NameIndex]:
+        """从快照文件打开内存文件名索引（内存映射，几乎不需要时间），没有可用的快照时返回 None
         
-        # 创建属性表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS properties (
-                file_id INTEGER,
-                property_name TEXT,
-                property_value TEXT,
-                FOREIGN KEY (file_id) REFERENCES files (id),
-                PRIMARY KEY (file_id, property_name)
-            )
-        ''')
+        快照尚未与数据库核对，可能缺少其他程序（如命令行）写入的文件，核对前搜索不使用它；
+        之后应在后台调用 load_name_index 核对（只比较文件表的版本），快照过期时重新读取。
+        """
+        snapshot = NameIndex.open_snapshot(self.name_index_path)
+        if snapshot is None:
+            return None
+        with self._write_lock:
+            if self.name_index is None:
+                self.name_index, self._snapshot_fingerprint = snapshot
+            return self.name_index
+    
+    def save_name_index(self):
+        """保存内存文件名索引的快照，下次启动时直接内存映射（退出时调用）"""
+        with self._write_lock:
+            if self.name_index is None or self._snapshot_fingerprint is not None:
+                # 未加载或尚未核对的索引不保存
+                return
+            try:
+                self.name_index.save(self.name_index_path, self._files_fingerprint(self.get_write_connection()))
+            except (OSError, sqlite3.Error) as e:
+                print(f"保存文件名索引失败: {e}")
+    
+    @staticmethod
+    def _files_fingerprint(conn: sqlite3.Connection) -> tuple:
+        """文件表的版本 (已分配的最大 id, 文件数)
         
-        # 创建索引
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_path ON files (path)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_name ON files (name)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_type ON files (type)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_properties_name ON properties (property_name)')
+        新增文件总是分配更大的 id（AUTOINCREMENT，sqlite_sequence 只增不减），删除文件会改变文件数，
+        用于判断快照是否过期。
+        """
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'files'").fetchone()
+        count = conn.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+        return (row[0] if row else 0, count)
+    
+    def unload_name_index(self):
+        """释放内存文件名索引，搜索恢复直接查询数据库"""
+        with self._write_lock:
+            if self.name_index is None:
+                return
+            self.name_index = None
+            self._snapshot_fingerprint = None
+            conn, self._name_index_conn = self._name_index_conn, None
+            try:
+                with conn:
+                    for trigger in ('insert', 'delete', 'update'):
+                        conn.execute(f'DROP TRIGGER IF EXISTS temp.name_index_{trigger}')
+                    conn.execute('DROP TABLE IF EXISTS temp.name_index_changes')
+            except sqlite3.ProgrammingError:
+                # 连接已关闭，临时表和触发器已随之删除
+                pass
+    
+    def _install_name_index_journal(self, conn: sqlite3.Connection):
+        """在写入连接上创建记录文件增删的临时表和触发器（UPSERT 更新已有文件时不触发）"""
+        with conn:
+            conn.execute('CREATE TEMP TABLE IF NOT EXISTS name_index_changes (id INTEGER, path TEXT)')
+            conn.execute('DELETE FROM temp.name_index_changes')
+            conn.execute('''
+                CREATE TEMP TRIGGER IF NOT EXISTS name_index_insert AFTER INSERT ON main.files BEGIN
+                    INSERT INTO name_index_changes (id, path)
+                    VALUES (new.id, (SELECT path FROM main.dirs WHERE id = new.dir_id) || new.name);
+                END
+            ''')
+            conn.execute('''
+                CREATE TEMP TRIGGER IF NOT EXISTS name_index_delete AFTER DELETE ON main.files BEGIN
+                    INSERT INTO name_index_changes (id, path) VALUES (old.id, NULL);
+                END
+            ''')
+            conn.execute('''
+                CREATE TEMP TRIGGER IF NOT EXISTS name_index_update AFTER UPDATE OF dir_id, name ON main.files
+                WHEN old.dir_id IS NOT new.dir_id OR old.name IS NOT new.name BEGIN
+                    INSERT INTO name_index_changes (id, path) VALUES (old.id, NULL);
+                    INSERT INTO name_index_changes (id, path)
+                    VALUES (new.id, (SELECT path FROM main.dirs WHERE id = new.dir_id) || new.name);
+                END
+            ''')
+        self._name_index_conn = conn
+    
+    def _sync_name_index(self, conn: sqlite3.Connection):
+        """将已提交的文件增删应用到内存文件名索引（调用方持有 _write_lock）"""
+        if self.name_index is None:
+            return
+        changes = conn.execute('SELECT id, path FROM temp.name_index_changes ORDER BY rowid').fetchall()
+        if changes:
+            with conn:
+                conn.execute('DELETE FROM temp.name_index_changes')
+            self.name_index.apply(changes)
+            if self.name_index.needs_reload():
+                self.name_index.load(conn.execute(self.NAME_INDEX_QUERY))
+    
+    def _name_index_candidates(self, query: str, limit: int, order_by: List[tuple], filters: Dict[str, Any],
+                               after: Optional[tuple]) -> Optional[List[int]]:
+        """默认视图（按文件名排序、只有一个关键词、第一页）的候选 id，由内存文件名索引得到
         
-        conn.commit()
-        conn.close()
+        其他情况、未加载索引、快照尚未与数据库核对（见 open_name_index_snapshot）或候选过多时返回 None，
+        由数据库完成搜索。
+        """
+        if (self.name_index is None or self._snapshot_fingerprint is not None
+                or not query or limit is None or after is not None
+                or [(name, bool(reverse)) for name, reverse in order_by] != [('name', False)]
+                or any(value not in (None, '', '全部', {}) for value in filters.values())):
+            return None
+        node = QueryParser().parse(query)
+        if node is None or node.kind != 'text':
+            return None
+        candidates = self.name_index.first_page_candidates(node.value, limit, max_scan=self.NAME_INDEX_MAX_SCAN)
+        if candidates is None or len(candidates) > self.NAME_INDEX_MAX_IDS:
+            return None
+        return candidates
     
     def add_file(self, file_info: Dict[str, Any]):
         """添加文件到数据库"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        return self.add_files([file_info]) == 1
+    
+    def add_files(self, file_infos, batch_size: Optional[int] = None, progress_callback=None,
+                  generation: Optional[int] = None) -> int:
+        """批量添加文件到数据库
         
-        try:
-            # 插入文件记录
-            cursor.execute('''
-                INSERT OR REPLACE INTO files 
-                (name, path, size, type, created, modified, accessed, attributes, hash, indexed_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                file_info['name'],
-                file_info['path'],
-                file_info['size'],
-                file_info['type'],
-                file_info['created'].isoformat(),
-                file_info['modified'].isoformat(),
-                file_info['accessed'].isoformat(),
-                file_info.get('attributes', ''),
-                file_info.get('hash', ''),
-                datetime.now().isoformat()
-            ))
-            
-            file_id = cursor.lastrowid
+        使用同一个长连接，每 batch_size 个文件提交一次事务，
+        返回成功写入的文件数。progress_callback(已写入数) 在每个事务提交后调用。
+        带 'unchanged' 标记的记录只更新索引轮次 generation，不重写文件信息。
+        """
+        batch_size = batch_size or self.batch_size
+        added = 0
+        batch = []
+        
+        for file_info in file_infos:
+            batch.append(file_info)
+            if len(batch) >= batch_size:
+                added += self._write_batch(batch, generation)
+                batch = []
+                if progress_callback:
+                    progress_callback(added)
+        
+        if batch:
+            added += self._write_batch(batch, generation)
+            if progress_callback:
+                progress_callback(added)
+        
+        return added
+    
+    def _write_batch(self, batch: List[Dict[str, Any]], generation: Optional[int] = None) -> int:
+        """在一个事务中写入一批文件"""
+        indexed_at = int(time.time())
+        generation = generation or 0
+        file_rows = []
+        property_rows = []
+        touched_rows = []
+        
+        for file_info in batch:
+            if file_info.get('unchanged'):
+                # 旧版本数据库没有设备号，未修改的文件顺便补上
+                touched_rows.append((generation, file_info.get('device')) + self._split_path(file_info['path']))
+                continue
             
-            # 插入属性
-            for prop_name, prop_value in file_info.get('properties', {}).items():
-                if prop_value is not None:
-                    cursor.execute('''
-                        INSERT OR REPLACE INTO properties (file_id, property_name, property_value)
-                        VALUES (?, ?, ?)
-                    ''', (file_id, prop_name, str(prop_value)))
+            try:
+                # 路径拆分为目录和文件名，目录在事务中转换为目录 id
+                directory, name = self._split_path(file_info['path'])
+                file_rows.append((
+                    name,
+                    directory,
+                    file_info['size'] or 0,
+                    file_info['type'] or '',
+                    self._stored_timestamp(file_info['created']),
+                    self._stored_timestamp(file_info['modified']),
+                    self._stored_timestamp(file_info['accessed']),
+                    file_info.get('attributes') or '',
+                    file_info.get('hash') or '',
+                    indexed_at,
+                    file_info.get('mtime_ns'),
+                    file_info.get('inode'),
+                    file_info.get('device'),
+                    generation,
+                    1 if file_info.get('enriched') else 0,
+                    os.path.splitext(name)[1].lower()
+                ))
+            except (KeyError, AttributeError, TypeError):
+                # 属性获取失败的文件（如无权限）直接跳过
+                continue
             
-            conn.commit()
-            return True
-        except Exception as e:
-            print(f"数据库错误: {e}")
-            return False
-        finally:
-            conn.close()
+            data = self.encode_properties(file_info.get('properties', {}))
+            if data:
+                property_rows.append((directory, name, data))
+        
+        if not file_rows and not touched_rows:
+            return 0
+        
+        with self._write_lock:
+            conn = self.get_write_connection()
+            try:
+                with conn:
+                    dir_ids = self._get_dir_ids(conn, {row[1] for row in file_rows})
+                    file_rows = [(row[0], dir_ids[row[1]]) + row[2:] for row in file_rows]
+                    
+                    # 使用 UPSERT 保留原有 id，避免旧属性成为孤儿记录
+                    conn.executemany('''
+                        INSERT INTO files
+                        (name, dir_id, size, type, created, modified, accessed, attributes, hash, indexed_at,
+                         mtime_ns, inode, device, generation, enriched, extension)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(dir_id, name) DO UPDATE SET
+                            size = excluded.size,
+                            type = excluded.type,
+                            created = excluded.created,
+                            modified = excluded.modified,
+                            accessed = excluded.accessed,
+                            attributes = excluded.attributes,
+                            hash = excluded.hash,
+                            indexed_at = excluded.indexed_at,
+                            mtime_ns = excluded.mtime_ns,
+                            inode = excluded.inode,
+                            device = excluded.device,
+                            generation = excluded.generation,
+                            enriched = excluded.enriched,
+                            extension = excluded.extension
+                    ''', file_rows)
+                    
+                    conn.executemany('''
+                        DELETE FROM file_properties
+                        WHERE file_id = (SELECT id FROM files WHERE dir_id = ? AND name = ?)
+                    ''', [(row[1], row[0]) for row in file_rows])
+                    
+                    conn.executemany('''
+                        INSERT OR REPLACE INTO file_properties (file_id, data)
+                        VALUES ((SELECT id FROM files WHERE dir_id = ? AND name = ?), ?)
+                    ''', [(dir_ids[directory], name, data) for directory, name, data in property_rows])
+                    
+                    conn.executemany('''
+                        UPDATE files SET generation = ?, device = COALESCE(?, device)
+                        WHERE dir_id = (SELECT id FROM dirs WHERE path = ?) AND name = ?
+                    ''', touched_rows)
+                self._sync_name_index(conn)
+                return len(file_rows)
+            except sqlite3.Error as e:
+                print(f"数据库错误: {e}")
+                return 0
     
-    def search_files(self, query: str = "", file_type: str = "", size_filter: str = "") -> List[Dict[str, Any]]:
-        """搜索文件"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    @staticmethod
+    def _split_path(path: str) -> tuple:
+        """文件路径 -> (目录路径（以分隔符结尾）, 文件名)，两者拼接即为原路径"""
+        directory, name = os.path.split(path)
+        return os.path.join(directory, '') if directory else '', name
+    
+    def _get_dir_ids(self, conn: sqlite3.Connection, directories) -> Dict[str, int]:
+        """目录路径（以分隔符结尾）对应的目录 id，不存在的目录及其上级目录在写入连接上创建（调用方持有 _write_lock）"""
+        dir_ids = {}
+        
+        def resolve(directory: str) -> int:
+            if directory in dir_ids:
+                return dir_ids[directory]
+            row = conn.execute('SELECT id FROM dirs WHERE path = ?', (directory,)).fetchone()
+            if row:
+                dir_id = row[0]
+            else:
+                # 根目录（如 / 或 C:\）没有上级目录，名称为路径本身
+                parent, name = self._split_path(os.path.dirname(directory))
+                parent_id = resolve(parent) if name else None
+                dir_id = conn.execute('INSERT INTO dirs (parent_id, name, path) VALUES (?, ?, ?)',
+                                      (parent_id, name or directory, directory)).lastrowid
+            dir_ids[directory] = dir_id
+            return dir_id
+        
+        for directory in directories:
+            resolve(directory)
+        return dir_ids
+    
+    def _subtree_condition(self, root: str, column: str = 'dir_id') -> tuple:
+        """文件位于目录 root 及其子目录中的条件：先用目录路径索引找出子树中的目录 id，再按目录 id 查文件"""
+        return f"{column} IN (SELECT id FROM dirs WHERE path >= ? AND path < ?)", list(self._path_range(root))
+    
+    @staticmethod
+    def _path_range(root: str) -> tuple:
+        """返回目录下所有路径的范围 [lower, upper)，可以使用路径索引"""
+        prefix = os.path.join(root, '')
+        return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    
+    def begin_generation(self) -> int:
+        """开始新一轮索引，返回本轮的 generation"""
+        with self._write_lock:
+            conn = self.get_write_connection()
+            return conn.execute('SELECT COALESCE(MAX(generation), 0) + 1 FROM files').fetchone()[0]
+    
+    def sweep_stale_files(self, root: str, generation: int) -> int:
+        """删除目录下本轮索引未访问到的文件（已从磁盘删除），返回删除数量"""
+        subtree, params = self._subtree_condition(root)
+        stale = f'{subtree} AND generation < ?'
+        params.append(generation)
+        
+        with self._write_lock:
+            conn = self.get_write_connection()
+            with conn:
+                conn.execute(f'DELETE FROM file_properties WHERE file_id IN (SELECT id FROM files WHERE {stale})',
+                             params)
+                removed = conn.execute(f'DELETE FROM files WHERE {stale}', params).rowcount
+                if removed:
+                    self._prune_empty_dirs(conn, root)
+            self._sync_name_index(conn)
+            return removed
+    
+    def _prune_empty_dirs(self, conn: sqlite3.Connection, root: str):
+        """删除目录 root 下已经没有任何文件的目录记录
         
-        sql = '''
-            SELECT f.*, GROUP_CONCAT(p.property_name || ':' || p.property_value) as properties
-            FROM files f
-            LEFT JOIN properties p ON f.id = p.file_id
-        '''
+        按路径降序遍历时子目录总在上级目录之前，一次遍历即可判断整棵子树是否为空。
+        """
+        lower, upper = self._path_range(root)
+        kept_parents = set()
+        empty = []
+        for dir_id, parent_id, has_files in conn.execute('''
+            SELECT d.id, d.parent_id, EXISTS (SELECT 1 FROM files WHERE dir_id = d.id)
+            FROM dirs d WHERE d.path >= ? AND d.path < ? ORDER BY d.path DESC
+        ''', (lower, upper)):
+            if has_files or dir_id in kept_parents:
+                kept_parents.add(parent_id)
+            else:
+                empty.append((dir_id,))
+        conn.executemany('DELETE FROM dirs WHERE id = ?', empty)
+    
+    def remove_paths(self, paths: List[str]) -> int:
+        """删除路径对应的文件及其下的所有文件（路径为已删除的目录时），返回删除数量"""
+        removed = 0
+        with self._write_lock:
+            conn = self.get_write_connection()
+            with conn:
+                for path in paths:
+                    directory, name = self._split_path(path)
+                    subtree, subtree_params = self._subtree_condition(path)
+                    condition = f'(dir_id = (SELECT id FROM dirs WHERE path = ?) AND name = ?) OR {subtree}'
+                    params = [directory, name] + subtree_params
+                    conn.execute(f'DELETE FROM file_properties WHERE file_id IN (SELECT id FROM files WHERE {condition})',
+                                 params)
+                    removed += conn.execute(f'DELETE FROM files WHERE {condition}', params).rowcount
+                    # 路径为目录时，其下的目录记录随之删除
+                    conn.execute('DELETE FROM dirs WHERE path >= ? AND path < ?', subtree_params)
+            self._sync_name_index(conn)
+        return removed
+    
+    def get_pending_files(self, limit: int) -> List[tuple]:
+        """获取待补全属性的文件 [(id, 路径, 修改时间ns), ...]"""
+        with self._write_lock:
+            conn = self.get_write_connection()
+            return conn.execute(
+                'SELECT f.id, d.path || f.name, f.mtime_ns FROM files f JOIN dirs d ON d.id = f.dir_id '
+                'WHERE f.enriched = 0 ORDER BY f.id LIMIT ?', (limit,)
+            ).fetchall()
+    
+    def save_enrichment(self, results: List[Dict[str, Any]]):
+        """写入后台补全得到的哈希和属性
+        
+        只有文件在补全期间没有被重新索引（修改时间未变）时才写入，
+        否则保留 enriched = 0，由下一批重新处理。
+        """
+        if not results:
+            return
+        
+        with self._write_lock:
+            conn = self.get_write_connection()
+            try:
+                with conn:
+                    for result in results:
+                        updated = conn.execute(
+                            'UPDATE files SET hash = ?, enriched = 1 WHERE id = ? AND mtime_ns IS ?',
+                            (result['hash'], result['id'], result['mtime_ns'])
+                        ).rowcount
+                        if not updated:
+                            continue
+                        
+                        conn.execute('DELETE FROM file_properties WHERE file_id = ?', (result['id'],))
+                        data = self.encode_properties(result['properties'])
+                        if data:
+                            conn.execute('INSERT INTO file_properties (file_id, data) VALUES (?, ?)',
+                                         (result['id'], data))
+            except sqlite3.Error as e:
+                print(f"数据库错误: {e}")
+    
+    def get_file_fingerprints(self, paths: List[str]) -> Dict[str, tuple]:
+        """批量获取已索引文件的指纹 {路径: (大小, 修改时间ns, inode)}"""
+        fingerprints = {}
+        chunk_size = 500  # 低于 SQLite 变量个数上限
+        
+        # 按目录分组（索引时每次传入同一目录下的文件），每组先找到目录 id 再按文件名查询
+        names_by_dir = {}
+        for path in paths:
+            directory, name = self._split_path(path)
+            names_by_dir.setdefault(directory, []).append(name)
+        
+        conn = self.get_read_connection()
+        for directory, names in names_by_dir.items():
+            for i in range(0, len(names), chunk_size):
+                chunk = names[i:i + chunk_size]
+                placeholders = ','.join('?' * len(chunk))
+                cursor = conn.execute(f'''
+                    SELECT f.name, f.size, f.mtime_ns, f.inode FROM dirs d JOIN files f ON f.dir_id = d.id
+                    WHERE d.path = ? AND f.name IN ({placeholders})
+                ''', [directory] + chunk)
+                for name, size, mtime_ns, inode in cursor:
+                    fingerprints[directory + name] = (size, mtime_ns, inode)
+        
+        return fingerprints
+    
+    def _build_query_condition(self, query: str) -> tuple:
+        """文件名或完整路径包含关键词的条件，返回 (条件, 参数列表)
         
+        文件名和目录路径分别建有全文索引，关键词在文件名中或在所在目录的路径中即匹配。
+        关键词含路径分隔符时还可能跨越目录和文件名（如 "docs/rep"）：
+        目录路径以最后一个分隔符及之前的部分结尾，且文件名以之后的部分开头。
+        """
+        use_fts = self.fts_enabled and len(query) >= self.FTS_MIN_QUERY_LENGTH
+        # trigram 全文索引中关键词整体作为短语
+        phrase = '"' + query.replace('"', '""') + '"'
+        clauses, params = [], []
+        
+        if use_fts:
+            clauses.append("f.dir_id IN (SELECT rowid FROM dirs_fts WHERE dirs_fts MATCH ?)")
+            params.append(phrase)
+        else:
+            clauses.append("f.dir_id IN (SELECT id FROM dirs WHERE path LIKE ? ESCAPE '\\')")
+            params.append(f"%{self._escape_like(query)}%")
+        
+        split = max(query.rfind(separator) for separator in {os.sep, '/'})
+        if split < 0:
+            if use_fts:
+                clauses.append("f.id IN (SELECT rowid FROM files_fts WHERE files_fts MATCH ?)")
+                params.append(phrase)
+            else:
+                clauses.append("f.name LIKE ? ESCAPE '\\'")
+                params.append(f"%{self._escape_like(query)}%")
+        elif split < len(query) - 1:
+            clauses.append("(f.dir_id IN (SELECT id FROM dirs WHERE path LIKE ? ESCAPE '\\') "
+                           "AND f.name LIKE ? ESCAPE '\\')")
+            params.extend([f"%{self._escape_like(query[:split + 1])}", f"{self._escape_like(query[split + 1:])}%"])
+        
+        return "(" + " OR ".join(clauses) + ")", params
+    
+    @staticmethod
+    def _escape_like(text: str) -> str:
+        """转义 LIKE 的特殊字符（配合 ESCAPE '\\' 使用）"""
+        return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    
+    @staticmethod
+    def _has_separator(text: str) -> bool:
+        return os.sep in text or '/' in text
+    
+    def _build_name_condition(self, texts: List[str]) -> tuple:
+        """文件名同时包含各个 texts 的条件，返回 (条件, 参数列表)
+        
+        足够长的部分合并为一次全文索引查询（FTS5 的 AND），其余在候选行上用 LIKE 判断。
+        """
+        use_fts = [self.fts_enabled and len(text) >= self.FTS_MIN_QUERY_LENGTH for text in texts]
+        clauses, params = [], []
+        phrases = ['"' + text.replace('"', '""') + '"' for text, fts in zip(texts, use_fts) if fts]
+        if phrases:
+            clauses.append("f.id IN (SELECT rowid FROM files_fts WHERE files_fts MATCH ?)")
+            params.append(" AND ".join(phrases))
+        for text, fts in zip(texts, use_fts):
+            if not fts:
+                clauses.append("f.name LIKE ? ESCAPE '\\'")
+                params.append(f"%{self._escape_like(text)}%")
+        return "(" + " AND ".join(clauses) + ")", params
+    
+    @staticmethod
+    def _regex_literals(pattern: str) -> List[str]:
+        """正则表达式匹配的文本中一定出现的字面量（从长到短），用于先以索引缩小范围；无法确定时返回空列表"""
+        if '(' in pattern or '|' in pattern:
+            # 分组和分支中的内容不一定出现
+            return []
+        runs, current, i = [], [], 0
+        while i < len(pattern):
+            char = pattern[i]
+            literal = None
+            if char == '\\' and i + 1 < len(pattern):
+                escaped = pattern[i + 1]
+                if escaped.isdigit() or escaped in 'xuUN':
+                    return []
+                if not escaped.isalnum():
+                    literal = escaped
+                i += 2
+            elif char == '[':
+                # 跳过字符集，] 紧跟在 [ 或 [^ 之后时是字符集中的普通字符
+                i += 2 if pattern[i + 1:i + 2] == '^' else 1
+                i += 1 if pattern[i + 1:i + 2] == ']' else 0
+                while i < len(pattern) and pattern[i] != ']':
+                    i += 2 if pattern[i] == '\\' else 1
+                i += 1
+            elif char == '{':
+                i = pattern.find('}', i) + 1 or len(pattern)
+            else:
+                if char not in '.^$*+?}]':
+                    literal = char
+                i += 1
+            if literal is not None and i < len(pattern) and pattern[i] in '*?{':
+                # 后面带可省略的量词
+                literal = None
+            if literal is None:
+                runs.append(''.join(current))
+                current = []
+            else:
+                current.append(literal)
+        runs.append(''.join(current))
+        return sorted((run for run in runs if run), key=len, reverse=True)
+    
+    def _compile_query(self, node: QueryNode) -> tuple:
+        """将搜索语法树编译为 (SQL 条件, 参数列表, 后过滤函数)
+        
+        数据库能判断的条件编译为可以使用索引的 SQL：关键词走全文索引，扩展名、大小、时间、类型走对应列的索引，
+        由 SQLite 从最有选择性的条件开始缩小范围。正则表达式只能逐行判断，作为后过滤函数 file_info -> bool
+        在 SQL 的结果上流式执行（SQL 中仍用其中一定出现的字面量先缩小范围）。
+        SQL 条件为 None 表示不限；后过滤函数为 None 表示 SQL 条件已经精确。
+        或、非的子树含有后过滤条件时，SQL 条件放宽为包含全部匹配行的范围，整个子树由后过滤函数重新判断。
+        """
+        if node.kind == 'and':
+            sql_parts, params, filters = [], [], []
+            for child in node.children:
+                child_sql, child_params, child_filter = self._compile_query(child)
+                if child_sql is not None:
+                    sql_parts.append(child_sql)
+                    params.extend(child_params)
+                if child_filter is not None:
+                    filters.append(child_filter)
+            sql = "(" + " AND ".join(sql_parts) + ")" if sql_parts else None
+            if len(filters) > 1:
+                return sql, params, lambda file_info: all(match(file_info) for match in filters)
+            return sql, params, filters[0] if filters else None
+        
+        if node.kind == 'or':
+            compiled = [self._compile_query(child) for child in node.children]
+            if any(child_sql is None for child_sql, _, _ in compiled):
+                sql, params = None, []
+            else:
+                sql = "(" + " OR ".join(child_sql for child_sql, _, _ in compiled) + ")"
+                params = [param for _, child_params, _ in compiled for param in child_params]
+            if all(child_filter is None for _, _, child_filter in compiled):
+                return sql, params, None
+            return sql, params, self._query_matcher(node)
+        
+        if node.kind == 'not':
+            child_sql, child_params, child_filter = self._compile_query(node.children[0])
+            if child_filter is None:
+                return f"NOT {child_sql}", child_params, None
+            return None, [], self._query_matcher(node)
+        
+        kind, value = node.kind, node.value
+        if kind == 'text':
+            sql, params = self._build_query_condition(value)
+        elif kind == 'name':
+            sql, params = self._build_name_condition([value])
+        elif kind == 'wildcard':
+            column = self.PATH_EXPRESSION if self._has_separator(value) else 'f.name'
+            pattern = self._escape_like(value).replace('*', '%').replace('?', '_')
+            sql, params = f"{column} LIKE ? ESCAPE '\\'", [pattern]
+        elif kind == 'ext':
+            sql, params = f"f.extension IN ({','.join('?' * len(value))})", list(value)
+        elif kind in ('size', 'dm', 'dc', 'da'):
+            column = 'f.' + self.QUERY_RANGE_COLUMNS[kind]
+            lower, upper = (self.to_timestamp(bound) for bound in value)
+            parts, params = [f"{column} IS NOT NULL"], []
+            if lower is not None:
+                parts.append(f"{column} >= ?")
+                params.append(lower)
+            if upper is not None:
+                parts.append(f"{column} < ?")
+                params.append(upper)
+            sql = "(" + " AND ".join(parts[1:] or parts) + ")"
+        elif kind == 'type':
+            sql, params = "f.type = ?", [value]
+        elif kind == 'fuzzy':
+            # 按顺序包含各字符正是 LIKE '%a%b%c%'
+            sql = "f.name LIKE ? ESCAPE '\\'"
+            params = ['%' + '%'.join(self._escape_like(char) for char in value) + '%']
+        else:
+            literals = self._regex_literals(value.pattern)
+            if not literals:
+                return None, [], self._query_matcher(node)
+            if self._regex_matches_path(value):
+                sql, params = self._build_query_condition(literals[0])
+            else:
+                sql, params = self._build_name_condition(literals)
+            return sql, params, self._query_matcher(node)
+        return sql, params, None
+    
+    @staticmethod
+    def _regex_matches_path(pattern) -> bool:
+        """正则表达式含路径分隔符时匹配完整路径，否则匹配文件名"""
+        return '/' in pattern.pattern or '\\\\' in pattern.pattern
+    
+    def _query_matcher(self, node: QueryNode):
+        """语法树在 Python 中的判断函数 file_info -> bool（与编译的 SQL 条件含义相同）"""
+        kind, value = node.kind, node.value
+        if kind in ('and', 'or'):
+            matchers = [self._query_matcher(child) for child in node.children]
+            combine = all if kind == 'and' else any
+            return lambda file_info: combine(match(file_info) for match in matchers)
+        if kind == 'not':
+            match = self._query_matcher(node.children[0])
+            return lambda file_info: not match(file_info)
+        
+        if kind == 'text':
+            text = value.lower()
+            return lambda file_info: text in file_info['path'].lower()
+        if kind == 'name':
+            text = value.lower()
+            return lambda file_info: text in file_info['name'].lower()
+        if kind == 'ext':
+            extensions = set(value)
+            return lambda file_info: os.path.splitext(file_info['name'])[1].lower() in extensions
+        if kind in ('size', 'dm', 'dc', 'da'):
+            column = self.QUERY_RANGE_COLUMNS[kind]
+            lower, upper = (self.to_timestamp(bound) for bound in value)
+            return lambda file_info: (file_info[column] is not None
+                                      and (lower is None or file_info[column] >= lower)
+                                      and (upper is None or file_info[column] < upper))
+        if kind == 'type':
+            return lambda file_info: file_info['type'] == value
+        
+        if kind == 'wildcard':
+            pattern = re.compile(''.join('.*' if char == '*' else '.' if char == '?' else re.escape(char)
+                                         for char in value), re.IGNORECASE | re.DOTALL)
+            field = 'path' if self._has_separator(value) else 'name'
+            return lambda file_info: pattern.fullmatch(file_info[field]) is not None
+        if kind == 'fuzzy':
+            pattern = re.compile('.*?'.join(map(re.escape, value)), re.IGNORECASE | re.DOTALL)
+            return lambda file_info: pattern.search(file_info['name']) is not None
+        field = 'path' if self._regex_matches_path(value) else 'name'
+        return lambda file_info: value.search(file_info[field]) is not None
+    
+    def _build_search_conditions(self, query: str = "", file_type: str = "", size_filter: str = "",
+                                 min_size: Optional[int] = None, max_size: Optional[int] = None,
+                                 modified_after: Optional[datetime] = None,
+                                 modified_before: Optional[datetime] = None,
+                                 created_after: Optional[datetime] = None,
+                                 created_before: Optional[datetime] = None,
+                                 property_ranges: Optional[Dict[str, tuple]] = None) -> tuple:
+        """构造搜索条件，返回 (条件列表, 参数列表, 后过滤函数)
+        
+        query 按搜索语法（见 QueryParser）解析，能在数据库中判断的部分编译为 SQL，
+        正则表达式等只能逐行判断的部分返回为后过滤函数（没有时为 None，见 _compile_query）。
+        size_filter 为界面上的大小筛选项（见 SIZE_FILTERS），min_size/max_size 为字节范围 [min, max)，
+        modified_*/created_* 为时间范围 [after, before)。范围条件都可以使用对应列的索引。
+        property_ranges 为 {属性名: (最小值, 最大值)}，常用媒体属性（INDEXED_PROPERTIES）使用生成列的索引，
+        其余属性从 JSON 中读取。
+        """
         conditions = []
         params = []
+        post_filter = None
         
-        if query:
-            conditions.append("(f.name LIKE ? OR f.path LIKE ?)")
-            params.extend([f"%{query}%", f"%{query}%"])
+        node = QueryParser().parse(query) if query else None
+        if node is not None:
+            condition, query_params, post_filter = self._compile_query(node)
+            if condition is not None:
+                conditions.append(condition)
+                params.extend(query_params)
         
         if file_type and file_type != "全部":
             conditions.append("f.type = ?")
             params.append(file_type)
         
-        if conditions:
-            sql += " WHERE " + " AND ".join(conditions)
-        
-        sql += " GROUP BY f.id ORDER BY f.name"
+        if size_filter in self.SIZE_FILTERS:
+            filter_min, filter_max = self.SIZE_FILTERS[size_filter]
+            min_size = filter_min if min_size is None else max(min_size, filter_min or 0)
+            if filter_max is not None:
+                max_size = filter_max if max_size is None else min(max_size, filter_max)
+        
+        # (列表达式, 表达式参数, 下限, 上限)
+        ranges = [
+            ('f.size', [], min_size, max_size),
+            ('f.modified', [], modified_after, modified_before),
+            ('f.created', [], created_after, created_before),
+        ]
+        for name, (lower, upper) in (property_ranges or {}).items():
+            if name in self.INDEXED_PROPERTIES:
+                ranges.append((f'fp.{name}', [], lower, upper))
+            else:
+                ranges.append(('json_extract(fp.data, ?)', ['$.' + json.dumps(name)], lower, upper))
+        for column, column_params, lower, upper in ranges:
+            if lower is not None:
+                conditions.append(f"{column} >= ?")
+                params.extend(column_params + [self._range_param(lower)])
+            if upper is not None:
+                conditions.append(f"{column} < ?")
+                params.extend(column_params + [self._range_param(upper)])
+        
+        return conditions, params, post_filter
+    
+    @classmethod
+    def _range_param(cls, value):
+        """范围条件的参数：时间转换为数据库中的存储格式"""
+        return cls.to_timestamp(value)
+    
+    def search_files(self, query: str = "", file_type: str = "", size_filter: str = "",
+                     limit: Optional[int] = None, after: Optional[tuple] = None,
+                     order_by: Optional[List[tuple]] = None, include_properties: bool = False,
+                     conn: Optional[sqlite3.Connection] = None, **filters) -> List[Dict[str, Any]]:
+        """搜索文件
+        
+        filters 为大小和时间范围条件（min_size、modified_after 等，见 _build_search_conditions）。
+        返回的时间字段为时间戳，不在这里转换为 datetime，由界面只为显示的行转换（见 FileSearchApp.format_time）。
+        order_by 为 [(属性名, 是否降序), ...]，支持多列排序，在数据库中用 ORDER BY 完成，
+        默认按文件名升序，最后总以 id 作为唯一的次序键。
+        limit 为每页数量，after 为上一页最后一行的游标（见 get_cursor），
+        使用键集分页，翻页代价与页码无关。
+        include_properties 为 True 时同时返回详细属性（file_info['properties']），列表显示不需要。
+        conn 为调用方的连接（如后台搜索线程的连接），不指定时使用当前线程的只读连接。
+        """
+        cursor = (conn or self.get_read_connection()).cursor()
+        
+        # id 的方向与最后一个排序键一致，单列排序时可以直接按索引顺序（或逆序）读取
+        order_by = list(order_by or [('name', False)])
+        sort_keys = [(expression, bool(reverse)) for name, reverse in order_by
+                     for expression in self.sorter.get_sort_expressions(name)]
+        sort_keys.append(('f.id', sort_keys[-1][1]))
+        
+        sort_columns = ''.join(f", {expression} AS sort_{i}" for i, (expression, _) in enumerate(sort_keys[:-1]))
+        select = f'''
+            SELECT {self.RESULT_COLUMNS}, {'fp.data' if include_properties else 'NULL'}
+                   {sort_columns}
+            {self.SEARCH_FROM}
+        '''
+        order = " ORDER BY " + ", ".join(f"{expression} {'DESC' if reverse else 'ASC'}"
+                                         for expression, reverse in sort_keys)
+        
+        candidates = self._name_index_candidates(query, limit, order_by, dict(filters, file_type=file_type,
+                                                                              size_filter=size_filter), after)
+        if candidates is not None:
+            # 按文件名排序的前 limit 个结果一定在内存索引给出的候选中，数据库只需排序取前 limit 个
+            conditions, params = ["f.id IN (SELECT value FROM json_each(?))"], [json.dumps(candidates)]
+            post_filter = None
+        else:
+            conditions, params, post_filter = self._build_search_conditions(query, file_type, size_filter, **filters)
         
-        cursor.execute(sql, params)
+        # 有后过滤条件时按排序分批读取并过滤，直到凑够 limit 个结果或没有更多的行
+        batch_size = limit if post_filter is None else self.POST_FILTER_BATCH_SIZE
         results = []
-        
-        for row in cursor.fetchall():
-            file_info = {
-                'id': row[0],
-                'name': row[1],
-                'path': row[2],
-                'size': row[3],
-                'type': row[4],
-                'created': datetime.fromisoformat(row[5]),
-                'modified': datetime.fromisoformat(row[6]),
-                'accessed': datetime.fromisoformat(row[7]),
-                'attributes': row[8],
-                'hash': row[9],
-                'indexed_at': datetime.fromisoformat(row[10])
-            }
+        while True:
+            page_conditions, page_params = list(conditions), list(params)
+            if after is not None:
+                keyset_condition, keyset_params = self._build_keyset_condition(sort_keys, after)
+                page_conditions.append(keyset_condition)
+                page_params.extend(keyset_params)
             
-            # 解析属性
-            if row[11]:
-                properties = {}
-                for prop in row[11].split(','):
-                    if ':' in prop:
-                        name, value = prop.split(':', 1)
-                        properties[name] = value
-                file_info['properties'] = properties
+            sql = select
+            if page_conditions:
+                sql += " WHERE " + " AND ".join(page_conditions)
+            sql += order
+            if batch_size is not None:
+                sql += " LIMIT ?"
+                page_params.append(batch_size)
+            
+            cursor.execute(sql, page_params)
+            rows = cursor.fetchall()
             
-            results.append(file_info)
+            for row in rows:
+                file_info = self._make_file_info(row)
+                # 排序键的原始值，作为下一页的游标
+                file_info['_cursor'] = tuple(row[12:]) + (row[0],)
+                if post_filter is not None and not post_filter(file_info):
+                    continue
+                if include_properties:
+                    file_info['properties'] = self.decode_properties(row[11])
+                results.append(file_info)
+                if limit is not None and len(results) >= limit:
+                    return results
+            
+            if post_filter is None or len(rows) < batch_size:
+                return results
+            after = tuple(rows[-1][12:]) + (rows[-1][0],)
+    
+    def iter_files(self, page_size: int = 1000, **search_params):
+        """逐页遍历全部搜索结果（参数同 search_files），内存占用与结果数量无关"""
+        cursor = None
+        while True:
+            page = self.search_files(**search_params, limit=page_size, after=cursor)
+            yield from page
+            if len(page) < page_size:
+                return
+            cursor = self.get_cursor(page[-1])
+    
+    @staticmethod
+    def _make_file_info(row: tuple) -> Dict[str, Any]:
+        """将查询结果的前 11 列转换为文件信息"""
+        return {
+            'id': row[0],
+            'name': row[1],
+            'path': row[2],
+            'size': row[3],
+            'type': row[4],
+            'created': row[5],
+            'modified': row[6],
+            'accessed': row[7],
+            'attributes': row[8],
+            'hash': row[9],
+            'indexed_at': row[10],
+        }
+    
+    def get_file_details(self, file_id: int) -> Optional[Dict[str, Any]]:
+        """获取单个文件的全部信息和详细属性（属性面板使用）"""
+        row = self.get_read_connection().execute(f'''
+            SELECT {self.RESULT_COLUMNS}, fp.data
+            {self.SEARCH_FROM}
+            WHERE f.id = ?
+        ''', (file_id,)).fetchone()
+        if row is None:
+            return None
         
-        conn.close()
-        return results
+        file_info = self._make_file_info(row)
+        file_info['properties'] = self.decode_properties(row[11])
+        return file_info
+    
+    def get_property_keys(self) -> List[tuple]:
+        """属性名及含有该属性的文件数量 [(属性名, 数量), ...]，按属性名排序"""
+        return self.get_read_connection().execute(
+            'SELECT key, count FROM property_keys ORDER BY key'
+        ).fetchall()
+    
+    def get_property_statistics(self, key: Optional[str] = None, limit: Optional[int] = None,
+                                after: Optional[tuple] = None) -> List[tuple]:
+        """各属性值的文件数量 [(属性名, 属性值, 数量), ...]，按属性名、数量降序排列
+        
+        读取随属性表增量更新的统计表（见 init_property_stats）。key 只返回该属性的值；
+        after 为上一页的最后一行，与 limit 一起用于分页。
+        """
+        conditions, params = [], []
+        if key is not None:
+            conditions.append('key = ?')
+            params.append(key)
+        if after is not None:
+            # 排序键 (属性名, 数量降序, 属性值)，游标取自上一页最后一行 (属性名, 属性值, 数量)
+            after_key, after_value, after_count = after
+            condition, condition_params = self._build_keyset_condition(
+                [('key', False), ('count', True), ('value', False)], (after_key, after_count, after_value))
+            conditions.append(condition)
+            params.extend(condition_params)
+        
+        sql = 'SELECT key, value, count FROM property_stats'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY key, count DESC, value'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        return self.get_read_connection().execute(sql, params).fetchall()
+    
+    @staticmethod
+    def _build_keyset_condition(sort_keys: List[tuple], after: tuple) -> tuple:
+        """构造键集分页条件：排序键元组严格位于游标之后
+        
+        各列方向可以不同，因此展开为
+        (k1 > v1) OR (k1 = v1 AND k2 > v2) OR ...（降序列使用 <），
+        并额外加上 k1 >= v1，使第一列的索引可以直接定位到游标处。
+        
+        游标值为 NULL 时按 SQLite 的排序规则（NULL 最小）改用 IS NULL / IS NOT NULL，
+        否则 NULL 参与比较的条件恒为假，之后的行会全部丢失。排序列中的非 NULL 游标值之后
+        不会再出现 NULL：文件表的排序列不保存 NULL，属性列的排序表达式带 IFNULL。
+        """
+        clauses = []
+        params = []
+        for i, (expression, reverse) in enumerate(sort_keys):
+            if after[i] is None and reverse:
+                # 降序时 NULL 排在最后，没有严格位于其后的值
+                continue
+            parts = []
+            for j in range(i):
+                if after[j] is None:
+                    parts.append(f"{sort_keys[j][0]} IS NULL")
+                else:
+                    parts.append(f"{sort_keys[j][0]} = ?")
+                    params.append(after[j])
+            if after[i] is None:
+                parts.append(f"{expression} IS NOT NULL")
+            else:
+                parts.append(f"{expression} {'<' if reverse else '>'} ?")
+                params.append(after[i])
+            clauses.append("(" + " AND ".join(parts) + ")")
+        if not clauses:
+            return "0", []
+        
+        first_expression, first_reverse = sort_keys[0]
+        if after[0] is None:
+            # 升序时 NULL 位于最前，不限制；降序时只剩 NULL
+            hint, hint_params = ("1", []) if not first_reverse else (f"{first_expression} IS NULL", [])
+        else:
+            hint, hint_params = f"{first_expression} {'<=' if first_reverse else '>='} ?", [after[0]]
+        condition = f"{hint} AND ({' OR '.join(clauses)})"
+        return "(" + condition + ")", hint_params + params
+    
+    @staticmethod
+    def get_cursor(file_info: Dict[str, Any]) -> tuple:
+        """返回一行结果对应的分页游标（需与查询时的 order_by 一致）"""
+        return file_info['_cursor']
+    
+    def count_files(self, query: str = "", file_type: str = "", size_filter: str = "",
+                    conn: Optional[sqlite3.Connection] = None, **filters) -> int:
+        """统计匹配的文件数量"""
+        conditions, params, post_filter = self._build_search_conditions(query, file_type, size_filter, **filters)
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        conn = conn or self.get_read_connection()
+        if post_filter is None:
+            return conn.execute("SELECT COUNT(*) " + self.SEARCH_FROM + where, params).fetchone()[0]
+        # 有后过滤条件时逐行判断 SQL 筛选出的文件
+        rows = conn.execute(f"SELECT {self.RESULT_COLUMNS} {self.SEARCH_FROM}{where}", params)
+        return sum(1 for row in rows if post_filter(self._make_file_info(row)))
+    
+    def get_duplicate_sizes(self, min_size: int = 1, root: Optional[str] = None) -> List[int]:
+        """返回至少有两个文件的大小（从大到小），root 限定目录"""
+        conditions, params = self._duplicate_conditions(min_size, root)
+        return [size for size, in self.get_read_connection().execute(f'''
+            SELECT size FROM files WHERE {conditions}
+            GROUP BY size HAVING COUNT(*) > 1
+            ORDER BY size DESC
+        ''', params)]
+    
+    def get_files_by_size(self, size: int, root: Optional[str] = None) -> List[Dict[str, Any]]:
+        """返回指定大小的文件 [{'id', 'path', 'size', 'inode', 'device'}, ...]"""
+        conditions, params = self._duplicate_conditions(size, root)
+        return [
+            {'id': file_id, 'path': path, 'size': size, 'inode': inode, 'device': device}
+            for file_id, path, inode, device in self.get_read_connection().execute(f'''
+                SELECT f.id, {self.PATH_EXPRESSION}, f.inode, f.device FROM files f JOIN dirs d ON d.id = f.dir_id
+                WHERE {conditions} AND f.size = ? ORDER BY f.id
+            ''', params + [size])
+        ]
+    
+    def _duplicate_conditions(self, min_size: int, root: Optional[str]) -> tuple:
+        conditions = ['size >= ?']
+        params = [min_size]
+        if root:
+            subtree, subtree_params = self._subtree_condition(root)
+            conditions.append(subtree)
+            params.extend(subtree_params)
+        return ' AND '.join(conditions), params
     
     def get_file_count(self) -> int:
         """获取文件总数"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM files")
-        count = cursor.fetchone()[0]
-        conn.close()
-        return count
+        return self.get_read_connection().execute("SELECT COUNT(*) FROM files").fetchone()[0]
+    
+    def get_statistics(self) -> Dict[str, Any]:
+        """索引统计：文件数、总大小、各类型数量、待补全数量、数据库大小等"""
+        conn = self.get_read_connection()
+        total_files, total_size = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM files').fetchone()
+        by_type = {
+            file_type: {'count': count, 'size': size}
+            for file_type, count, size in conn.execute(
+                'SELECT type, COUNT(*), COALESCE(SUM(size), 0) FROM files GROUP BY type ORDER BY COUNT(*) DESC'
+            )
+        }
+        pending = conn.execute('SELECT COUNT(*) FROM files WHERE enriched = 0').fetchone()[0]
+        database_size = sum(os.path.getsize(path) for path in
+                            (self.db_path, Path(f"{self.db_path}-wal")) if os.path.exists(path))
+        return {
+            'files': total_files,
+            'directories': conn.execute('SELECT COUNT(*) FROM dirs').fetchone()[0],
+            'total_size': total_size,
+            'types': by_type,
+            'pending_enrichment': pending,
+            'schema_version': conn.execute('PRAGMA user_version').fetchone()[0],
+            'fts_enabled': self.fts_enabled,
+            'database_size': database_size,
+        }
     
     def clear_database(self):
         """清空数据库"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM files")
-        cursor.execute("DELETE FROM properties")
-        conn.commit()
-        conn.close()
+        with self._write_lock:
+            conn = self.get_write_connection()
+            with conn:
+                conn.execute("DELETE FROM files")
+                conn.execute("DELETE FROM file_properties")
+                conn.execute("DELETE FROM dirs")
+            self._sync_name_index(conn)
 
 class FileSearchApp:
+    # 每次从数据库加载的结果数量
+    PAGE_SIZE = 500
+    # 滚动到列表该位置（比例）时加载下一页
+    PAGE_LOAD_THRESHOLD = 0.9
+    # 修改时间筛选项
+    DATE_FILTERS = ["今天", "最近7天", "本月", "今年"]
+    # 输入停止多久（毫秒）后才开始搜索
+    SEARCH_DEBOUNCE_MS = 250
+    
     def __init__(self, root):
         self.root = root
         self.root.title("文件搜索工具 - Everything (增强版)")
@@ -447,31 +3650,57 @@ class FileSearchApp:
         self.data_dir.mkdir(exist_ok=True)
         
         # 初始化组件
-        self.properties_manager = FileProperties()
+        self.hash_cache = HashCache(self.data_dir / "hash_cache.db")
+        self.properties_manager = FileProperties(hash_cache=self.hash_cache)
         self.database = LightweightDatabase(self.data_dir)
         self.property_sorter = PropertySorter()
         
-        # 文件索引数据
+        # 文件索引数据（filtered_data 只保存已加载的结果页）
         self.files_data = []
         self.filtered_data = []
+        self.search_params = {}
+        self.sort_order = [('name', False)]
+        self.search_cursor = None
+        self.has_more_results = False
+        self.loading_page = False
+        self.search_after_id = None
         self.is_indexing = False
         self.index_thread = None
         
+        # 索引并行度
+        self.index_workers = os.cpu_count() or 1
+        self.use_process_pool = True
+        # 是否监视索引目录的变化并实时更新索引
+        self.watch_changes = False
+        # 是否在内存中保存文件名索引（默认视图的搜索更快，每个文件多占约路径长度的内存）
+        self.use_name_index = True
+        
         # 筛选器配置
-        self.filters = {
-            "音频": ['.mp3', '.wav', '.flac', '.aac', '.ogg', '.wma', '.m4a', '.aiff'],
-            "压缩文件": ['.zip', '.rar', '.7z', '.tar', '.gz', '.bz2', '.xz', '.lzma'],
-            "文档": ['.txt', '.doc', '.docx', '.pdf', '.rtf', '.odt', '.xls', '.xlsx', '.ppt', '.pptx'],
-            "可执行文件": ['.exe', '.msi', '.bat', '.cmd', '.com', '.scr'],
-            "图片": ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.svg', '.webp', '.ico'],
-            "视频": ['.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm', '.m4v', '.3gp']
-        }
+        self.filters = FILE_TYPE_FILTERS
+        self.indexer = FileIndexer(self.database, self.properties_manager, file_types=self.filters)
+        
+        # 后台搜索线程，界面线程只负责显示结果
+        self.search_worker = SearchWorker(self.database, self.on_search_result, self.on_search_error)
+        self.search_worker.start()
+        # 结果总数在单独的线程中统计，不推迟第一页的显示，翻页也不会打断统计
+        self.count_worker = SearchWorker(self.database, self.on_count_result, self.on_count_error)
+        self.count_worker.start()
         
         self.setup_ui()
         self.load_settings()
         
         # 加载现有索引
         self.load_existing_index()
+        self.update_name_index()
+        
+        # 后台属性补全（继续上次未完成的文件）
+        self.enricher = None
+        self.start_enricher()
+        
+        # 监视模式：目录变化实时写入索引
+        self.live_updater = LiveIndexUpdater(self.database, self.indexer.build_core_file_info,
+                                             on_update=self.on_live_update)
+        self.update_watcher()
         
     def setup_ui(self):
         # 创建主框架
@@ -520,6 +3749,7 @@ class FileSearchApp:
         tools_menu.add_command(label="高级排序", command=self.show_advanced_sort)
         tools_menu.add_command(label="数据库管理", command=self.show_database_manager)
         tools_menu.add_command(label="属性查看器", command=self.show_properties_viewer)
+        tools_menu.add_command(label="查找重复文件", command=self.show_duplicate_finder)
         tools_menu.add_separator()
         tools_menu.add_command(label="设置", command=self.show_settings)
         tools_menu.add_command(label="关于", command=self.show_about)
@@ -575,11 +3805,20 @@ class FileSearchApp:
         ttk.Label(filter_frame, text="大小:").pack(side=tk.LEFT, padx=(20, 0))
         self.size_var = tk.StringVar(value="全部")
         size_combo = ttk.Combobox(filter_frame, textvariable=self.size_var,
-                                 values=["全部", "小于1MB", "1MB-10MB", "10MB-100MB", "大于100MB"],
+                                 values=["全部"] + list(LightweightDatabase.SIZE_FILTERS.keys()),
                                  state="readonly", width=12)
         size_combo.pack(side=tk.LEFT, padx=(5, 0))
         size_combo.bind('<<ComboboxSelected>>', self.on_filter_change)
         
+        # 修改时间筛选
+        ttk.Label(filter_frame, text="修改时间:").pack(side=tk.LEFT, padx=(20, 0))
+        self.date_var = tk.StringVar(value="全部")
+        date_combo = ttk.Combobox(filter_frame, textvariable=self.date_var,
+                                 values=["全部"] + self.DATE_FILTERS,
+                                 state="readonly", width=10)
+        date_combo.pack(side=tk.LEFT, padx=(5, 0))
+        date_combo.bind('<<ComboboxSelected>>', self.on_filter_change)
+        
     def create_file_list(self, parent):
         # 创建左侧文件列表框架
         list_frame = ttk.Frame(parent)
@@ -614,7 +3853,8 @@ class FileSearchApp:
         # 添加滚动条
         scrollbar_y = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.tree.yview)
         scrollbar_x = ttk.Scrollbar(list_frame, orient=tk.HORIZONTAL, command=self.tree.xview)
-        self.tree.configure(yscrollcommand=scrollbar_y.set, xscrollcommand=scrollbar_x.set)
+        self.tree.configure(yscrollcommand=lambda first, last: self.on_tree_scroll(scrollbar_y, first, last),
+                            xscrollcommand=scrollbar_x.set)
         
         # 布局
         self.tree.grid(row=0, column=0, sticky='nsew')
@@ -626,6 +3866,7 @@ class FileSearchApp:
         
         # 绑定双击事件
         self.tree.bind('<Double-1>', self.on_file_double_click)
+        self.tree.bind('<Shift-Button-1>', self.on_heading_shift_click)
         self.tree.bind('<<TreeviewSelect>>', self.on_file_select)
         
     def create_properties_panel(self, parent):
@@ -643,10 +3884,22 @@ class FileSearchApp:
         
     def load_existing_index(self):
         """加载现有索引"""
-        count = self.database.get_file_count()
+        # 有文件名索引快照时直接使用其中的文件数，启动时不需要统计数据库
+        index = self.database.open_name_index_snapshot() if self.use_name_index else None
+        count = len(index) if index is not None else self.database.get_file_count()
         self.update_db_info(count)
         self.update_status(f"已加载 {count} 个文件的索引")
         
+    def update_name_index(self):
+        """按设置加载或释放内存文件名索引
+        
+        在后台读取数据库（或核对启动时打开的快照），完成之前搜索直接查询数据库（或使用快照）。
+        """
+        if self.use_name_index:
+            threading.Thread(target=self.database.load_name_index, daemon=True).start()
+        elif self.database.name_index is not None:
+            self.database.unload_name_index()
+        
     def update_db_info(self, count: int):
         """更新数据库信息显示"""
         self.db_info_label.config(text=f"数据库: {count} 个文件")
@@ -657,8 +3910,9 @@ class FileSearchApp:
             self.index_directory = directory
             self.save_settings()
             self.update_status(f"已选择索引目录: {directory}")
+            self.update_watcher()
             
-    def start_indexing(self):
+    def start_indexing(self, incremental: bool = False):
         if not hasattr(self, 'index_directory'):
             messagebox.showwarning("警告", "请先选择索引目录")
             return
@@ -671,7 +3925,7 @@ class FileSearchApp:
         self.stop_btn.config(state=tk.NORMAL)
         self.progress.start()
         
-        self.index_thread = threading.Thread(target=self.index_files)
+        self.index_thread = threading.Thread(target=self.index_files, args=(incremental,))
         self.index_thread.daemon = True
         self.index_thread.start()
         
@@ -682,83 +3936,215 @@ class FileSearchApp:
         self.progress.stop()
         self.update_status("索引已停止")
         
-    def index_files(self):
-        total_files = 0
-        indexed_files = 0
+    def start_enricher(self):
+        """按当前设置（工作线程数、是否使用多进程）创建并启动属性补全器，替换正在运行的补全器"""
+        if self.enricher is not None:
+            # 未完成的文件仍标记为待补全，由新的补全器继续处理
+            self.enricher.stop(timeout=5)
+        self.enricher = PropertyEnricher(self.database, self.properties_manager,
+                                         workers=max(1, self.index_workers // 2),
+                                         use_processes=self.use_process_pool)
+        self.enricher.start()
+        
+    def index_files(self, incremental: bool = False):
+        """索引文件（在索引线程中执行，见 FileIndexer.index）"""
+        def on_progress(stats):
+            self.enricher.wake()
+            self.update_status(f"已处理 {stats['total']} 个文件，索引 {stats['indexed']} 个，"
+                               f"跳过未修改 {stats['skipped']} 个...")
         
         try:
-            for root, dirs, files in os.walk(self.index_directory):
-                if not self.is_indexing:
-                    break
-                    
-                for file in files:
-                    if not self.is_indexing:
-                        break
-                        
-                    try:
-                        file_path = os.path.join(root, file)
-                        
-                        # 获取文件信息
-                        file_info = {
-                            'name': file,
-                            'path': file_path,
-                            'type': self.get_file_type(file_path)
-                        }
-                        
-                        # 获取详细属性
-                        properties = self.properties_manager.get_file_properties(file_path)
-                        file_info.update(properties)
+            self.indexer.workers = self.index_workers
+            stats = self.indexer.index(self.index_directory, incremental, lambda: self.is_indexing, on_progress)
                         
-                        # 添加到数据库
-                        if self.database.add_file(file_info):
-                            indexed_files += 1
-                        
-                        total_files += 1
-                        
-                        if total_files % 100 == 0:
-                            self.update_status(f"已处理 {total_files} 个文件，索引 {indexed_files} 个...")
-                            
-                    except (PermissionError, OSError) as e:
-                        continue
-                        
-            if self.is_indexing:
-                self.update_status(f"索引完成，共处理 {total_files} 个文件，成功索引 {indexed_files} 个")
+            if stats['completed']:
+                self.update_status(f"索引完成，共处理 {stats['total']} 个文件，成功索引 {stats['indexed']} 个，"
+                                   f"跳过未修改 {stats['skipped']} 个，移除已删除 {stats['removed']} 个")
                 self.update_db_info(self.database.get_file_count())
-                self.apply_filters()
+                self.root.after(0, self.apply_filters)
                 
         except Exception as e:
             self.update_status(f"索引出错: {str(e)}")
             
         finally:
+            self.database.connections.close_reader()
             self.is_indexing = False
             self.root.after(0, self.stop_indexing)
             
+    def update_watcher(self):
+        """按设置开始或停止监视索引目录"""
+        directory = getattr(self, 'index_directory', '')
+        if self.watch_changes and directory and os.path.isdir(directory):
+            if self.live_updater.start(directory):
+                self.update_status(f"正在监视目录变化: {directory}")
+            else:
+                self.update_status("当前系统不支持目录监视")
+        else:
+            self.live_updater.stop()
+            
+    def on_live_update(self, updated, removed):
+        """监视模式写入一批变化后调用（在监视线程中）"""
+        self.enricher.wake()
+        self.update_status(f"目录变化已更新: 写入 {updated} 个文件，移除 {removed} 个")
+        self.root.after(0, self.refresh_after_live_update)
+        
+    def refresh_after_live_update(self):
+        """刷新文件数量；只加载了第一页时重新查询，避免打断浏览长列表"""
+        self.update_db_info(self.database.get_file_count())
+        if not self.is_indexing and len(self.filtered_data) <= self.PAGE_SIZE:
+            self.start_search(count_total=True)
+            
     def get_file_type(self, file_path):
         """获取文件类型分类"""
-        ext = os.path.splitext(file_path)[1].lower()
-        
-        for category, extensions in self.filters.items():
-            if ext in extensions:
-                return category
-                
-        return "其他"
+        return self.indexer.get_file_type(file_path)
         
     def on_search_change(self, *args):
-        self.apply_filters()
+        """输入变化时延迟搜索，连续输入只执行最后一次"""
+        if self.search_after_id is not None:
+            self.root.after_cancel(self.search_after_id)
+        self.search_after_id = self.root.after(self.SEARCH_DEBOUNCE_MS, self.apply_filters)
         
     def on_filter_change(self, *args):
         self.apply_filters()
         
     def apply_filters(self):
+        if self.search_after_id is not None:
+            self.root.after_cancel(self.search_after_id)
+            self.search_after_id = None
+        
         search_term = self.search_var.get()
         filter_type = self.filter_var.get()
         size_filter = self.size_var.get()
         
-        # 从数据库搜索
-        self.filtered_data = self.database.search_files(search_term, filter_type, size_filter)
+        try:
+            QueryParser().parse(search_term)
+        except ValueError as e:
+            # 输入到一半的语法（如未写完的正则表达式）只提示，不搜索
+            self.update_status(f"搜索语法错误: {e}")
+            return
         
+        # 从数据库搜索第一页，其余结果在滚动到底部时再加载
+        self.search_params = {
+            'query': search_term,
+            'file_type': filter_type,
+            'size_filter': size_filter,
+            'modified_after': self.get_date_filter_start(self.date_var.get())
+        }
+        self.update_status("正在搜索...")
+        self.start_search(count_total=True)
+        
+    def get_date_filter_start(self, date_filter: str) -> Optional[datetime]:
+        """修改时间筛选项对应的起始时间"""
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        if date_filter == "今天":
+            return today
+        elif date_filter == "最近7天":
+            return today - timedelta(days=7)
+        elif date_filter == "本月":
+            return today.replace(day=1)
+        elif date_filter == "今年":
+            return today.replace(month=1, day=1)
+        return None
+        
+    def start_search(self, count_total=False):
+        """清空列表并在后台查询第一页，之前未完成的查询被取消"""
+        self.filtered_data = []
+        self.search_cursor = None
+        self.has_more_results = False
         self.update_file_list()
-        self.update_status(f"找到 {len(self.filtered_data)} 个文件")
+        self.request_page(count_total)
+        
+    def load_next_page(self):
+        """加载下一页搜索结果并追加到列表"""
+        if not self.has_more_results or self.loading_page:
+            return
+        self.request_page()
+        
+    def request_page(self, count_total=False):
+        """提交一页查询到后台搜索线程"""
+        database = self.database
+        search_params = dict(self.search_params)
+        sort_order = list(self.sort_order)
+        after = self.search_cursor
+        
+        def task(conn):
+            page = database.search_files(**search_params, limit=self.PAGE_SIZE, after=after,
+                                         order_by=sort_order, conn=conn)
+            return page, count_total
+        
+        if count_total:
+            # 条件变化，之前的统计已经过期
+            self.count_worker.cancel()
+        self.loading_page = True
+        self.search_worker.submit(task)
+        
+    def request_count(self):
+        """第一页显示后在后台统计结果总数，完成后只更新状态栏"""
+        database = self.database
+        search_params = dict(self.search_params)
+        
+        def task(conn):
+            return database.count_files(**search_params, conn=conn)
+        
+        self.count_worker.submit(task)
+        
+    def on_count_result(self, generation, total):
+        """结果总数统计完成（在统计线程中调用），转到界面线程显示"""
+        self.root.after(0, lambda: self.show_count_result(generation, total))
+        
+    def show_count_result(self, generation, total):
+        if self.count_worker.is_current(generation):
+            self.update_status(f"找到 {total} 个文件")
+        
+    def on_count_error(self, generation, error):
+        """结果总数统计出错（在统计线程中调用），转到界面线程显示"""
+        self.root.after(0, lambda: self.show_count_error(generation, error))
+        
+    def show_count_error(self, generation, error):
+        if self.count_worker.is_current(generation):
+            self.update_status(f"已显示 {len(self.filtered_data)} 个文件，统计总数出错: {error}")
+        
+    def on_search_result(self, generation, result):
+        """后台查询完成（在搜索线程中调用），转到界面线程显示"""
+        self.root.after(0, lambda: self.show_search_result(generation, result))
+        
+    def on_search_error(self, generation, error):
+        """后台查询出错（在搜索线程中调用），转到界面线程显示"""
+        self.root.after(0, lambda: self.show_search_error(generation, error))
+        
+    def show_search_error(self, generation, error):
+        """查询出错：结束加载状态并在状态栏显示错误，已显示的结果保留"""
+        if not self.search_worker.is_current(generation):
+            return
+        self.loading_page = False
+        self.has_more_results = False
+        self.update_status(f"搜索出错: {error}")
+        
+    def show_search_result(self, generation, result):
+        """显示一页查询结果，过期查询的结果直接丢弃"""
+        if not self.search_worker.is_current(generation):
+            return
+        
+        page, count_total = result
+        self.loading_page = False
+        self.has_more_results = len(page) == self.PAGE_SIZE
+        if page:
+            self.search_cursor = self.database.get_cursor(page[-1])
+            self.filtered_data.extend(page)
+            self.insert_file_rows(page)
+        if count_total:
+            if self.has_more_results:
+                self.update_status(f"已显示 {len(page)} 个文件，正在统计总数...")
+                self.request_count()
+            else:
+                # 第一页不满一页时结果总数就是这一页的数量
+                self.update_status(f"找到 {len(page)} 个文件")
+        
+    def on_tree_scroll(self, scrollbar, first, last):
+        """列表滚动时更新滚动条，接近底部时加载下一页"""
+        scrollbar.set(first, last)
+        if self.has_more_results and not self.loading_page and float(last) >= self.PAGE_LOAD_THRESHOLD:
+            self.root.after_idle(self.load_next_page)
         
     def update_file_list(self):
         # 清空现有项目
@@ -766,10 +4152,14 @@ class FileSearchApp:
             self.tree.delete(item)
             
         # 添加过滤后的文件
-        for file_info in self.filtered_data:
+        self.insert_file_rows(self.filtered_data)
+        
+    def insert_file_rows(self, rows):
+        """向列表末尾追加文件"""
+        for file_info in rows:
             size_str = self.format_size(file_info['size'])
-            modified_str = file_info['modified'].strftime('%Y-%m-%d %H:%M')
-            created_str = file_info['created'].strftime('%Y-%m-%d %H:%M')
+            modified_str = self.format_time(file_info['modified'])
+            created_str = self.format_time(file_info['created'])
             
             # 获取文件名长度
             filename_length = len(file_info['name'])
@@ -793,6 +4183,13 @@ class FileSearchApp:
                 hash_display
             ), tags=(file_info['id'],))
             
+    def format_time(self, timestamp, fmt='%Y-%m-%d %H:%M'):
+        """格式化数据库中的时间戳"""
+        if not timestamp:
+            # 0 表示时间未知
+            return ''
+        return datetime.fromtimestamp(timestamp).strftime(fmt)
+        
     def format_size(self, size_bytes):
         """格式化文件大小"""
         if size_bytes < 1024:
@@ -814,30 +4211,53 @@ class FileSearchApp:
         current_sort[column] = not reverse
         self.current_sort = current_sort
         
-        # 使用属性排序管理器进行排序
-        self.filtered_data = self.property_sorter.sort_files(self.filtered_data, column, reverse)
-            
-        self.update_file_list()
+        self.apply_sort([(column, reverse)])
+        
+    def on_heading_shift_click(self, event):
+        """按住 Shift 点击列标题，追加为次要排序列（再次点击切换方向）"""
+        if self.tree.identify_region(event.x, event.y) != 'heading':
+            return None
+        
+        column_index = int(self.tree.identify_column(event.x)[1:]) - 1
+        column = self.tree['columns'][column_index]
+        
+        sort_order = list(self.sort_order)
+        for i, (name, reverse) in enumerate(sort_order):
+            if name == column:
+                sort_order[i] = (name, not reverse)
+                break
+        else:
+            sort_order.append((column, False))
+        
+        self.apply_sort(sort_order)
+        return "break"
+        
+    def apply_sort(self, sort_order):
+        """在数据库中按 sort_order 重新查询第一页"""
+        self.sort_order = sort_order
+        self.start_search()
         
         # 显示排序方向指示器
-        self.update_sort_indicators(column, reverse)
+        self.update_sort_indicators()
         
-    def update_sort_indicators(self, current_column, reverse):
+    def update_sort_indicators(self):
         """更新排序方向指示器"""
         # 清除所有列的排序指示器
-        for col in ['name', 'path', 'size', 'type', 'modified', 'created', 'length', 'attributes', 'hash']:
+        for col in self.tree['columns']:
             current_text = self.tree.heading(col)['text']
             # 移除现有的排序指示器
-            if current_text.endswith(' ↑') or current_text.endswith(' ↓'):
-                base_text = current_text[:-2]
-            else:
-                base_text = current_text
+            base_text = current_text.split(' ↑')[0].split(' ↓')[0]
             self.tree.heading(col, text=base_text)
         
-        # 为当前排序列添加指示器
-        current_text = self.tree.heading(current_column)['text']
-        indicator = ' ↓' if reverse else ' ↑'
-        self.tree.heading(current_column, text=current_text + indicator)
+        # 为排序列添加指示器，多列排序时标出顺序
+        for i, (column, reverse) in enumerate(self.sort_order):
+            if column not in self.tree['columns']:
+                continue
+            current_text = self.tree.heading(column)['text']
+            indicator = ' ↓' if reverse else ' ↑'
+            if len(self.sort_order) > 1:
+                indicator += str(i + 1)
+            self.tree.heading(column, text=current_text + indicator)
         
     def on_file_double_click(self, event):
         """双击文件打开"""
@@ -865,95 +4285,85 @@ class FileSearchApp:
     def show_file_properties(self, file_id):
         """显示文件属性"""
         # 从数据库获取文件详细信息
-        conn = sqlite3.connect(self.database.db_path)
-        cursor = conn.cursor()
+        file_info = self.database.get_file_details(file_id)
         
-        cursor.execute('''
-            SELECT f.*, GROUP_CONCAT(p.property_name || ':' || p.property_value) as properties
-            FROM files f
-            LEFT JOIN properties p ON f.id = p.file_id
-            WHERE f.id = ?
-            GROUP BY f.id
-        ''', (file_id,))
-        
-        row = cursor.fetchone()
-        conn.close()
-        
-        if row:
+        if file_info:
             # 清空属性显示
             self.props_text.delete(1.0, tk.END)
             
             # 基本信息
             basic_info = f"""
 基本信息:
-  文件名: {row[1]}
-  路径: {row[2]}
-  大小: {self.format_size(row[3])}
-  类型: {row[4]}
-  创建时间: {row[5]}
-  修改时间: {row[6]}
-  访问时间: {row[7]}
-  属性: {row[8]}
-  哈希值: {row[9] if row[9] else '未计算'}
+  文件名: {file_info['name']}
+  路径: {file_info['path']}
+  大小: {self.format_size(file_info['size'])}
+  类型: {file_info['type']}
+  创建时间: {self.format_time(file_info['created'], '%Y-%m-%d %H:%M:%S')}
+  修改时间: {self.format_time(file_info['modified'], '%Y-%m-%d %H:%M:%S')}
+  访问时间: {self.format_time(file_info['accessed'], '%Y-%m-%d %H:%M:%S')}
+  属性: {file_info['attributes']}
+  哈希值: {file_info['hash'] if file_info['hash'] else '未计算'}
 
 """
             self.props_text.insert(tk.END, basic_info)
             
             # 详细属性
-            if row[11]:
+            properties = file_info['properties']
+            if properties:
                 self.props_text.insert(tk.END, "详细属性:\n")
-                properties = row[11].split(',')
-                for prop in properties:
-                    if ':' in prop:
-                        name, value = prop.split(':', 1)
-                        self.props_text.insert(tk.END, f"  {name}: {value}\n")
+                for name, value in properties.items():
+                    self.props_text.insert(tk.END, f"  {name}: {value}\n")
                         
     def update_status(self, message):
         """更新状态栏"""
         self.root.after(0, lambda: self.status_bar.config(text=message))
         
     def reindex_files(self):
-        """重新索引文件"""
+        """重新索引文件（增量模式，跳过未修改的文件）"""
         if hasattr(self, 'index_directory'):
-            self.start_indexing()
+            self.start_indexing(incremental=True)
         else:
             messagebox.showwarning("警告", "请先选择索引目录")
             
     def export_results(self):
-        """导出搜索结果"""
+        """导出全部搜索结果，在后台线程中流式写出"""
         if not self.filtered_data:
             messagebox.showinfo("提示", "没有搜索结果可导出")
             return
-            
-        filename = filedialog.asksaveasfilename(
-            defaultextension=".csv",
-            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")]
-        )
         
-        if filename:
+        filetypes = [("CSV files", "*.csv"), ("JSON Lines", "*.jsonl")]
+        if PYARROW_AVAILABLE:
+            filetypes.append(("Parquet", "*.parquet"))
+        filename = filedialog.asksaveasfilename(defaultextension=".csv",
+                                                filetypes=filetypes + [("All files", "*.*")])
+        if not filename:
+            return
+        
+        # 列表中只有已加载的结果页，导出时按当前条件和排序查询全部结果
+        search_params = dict(self.search_params, order_by=list(self.sort_order))
+        exporter = ResultExporter(self.database)
+        
+        def on_progress(stats):
+            self.root.after(0, lambda count=stats['files']: self.update_status(f"已导出 {count} 个文件..."))
+        
+        def on_done(stats):
+            self.update_status(f"已导出 {stats['files']} 个文件")
+            messagebox.showinfo("成功", f"结果已导出到: {filename}")
+        
+        def run():
             try:
-                with open(filename, 'w', encoding='utf-8') as f:
-                    f.write("文件名,路径,大小,类型,修改时间,创建时间,属性\n")
-                    for file_info in self.filtered_data:
-                        size_str = self.format_size(file_info['size'])
-                        modified_str = file_info['modified'].strftime('%Y-%m-%d %H:%M')
-                        created_str = file_info['created'].strftime('%Y-%m-%d %H:%M')
-                        
-                        # 属性字符串
-                        props_str = ""
-                        if 'properties' in file_info:
-                            props = []
-                            for k, v in file_info['properties'].items():
-                                props.append(f"{k}={v}")
-                            props_str = "; ".join(props)
-                        
-                        f.write(f"{file_info['name']},{file_info['path']},{size_str},"
-                               f"{file_info['type']},{modified_str},{created_str},{props_str}\n")
-                               
-                messagebox.showinfo("成功", f"结果已导出到: {filename}")
+                stats = exporter.export(filename, include_properties=True, progress_callback=on_progress,
+                                        **search_params)
             except Exception as e:
-                messagebox.showerror("错误", f"导出失败: {str(e)}")
-                
+                self.root.after(0, lambda error=str(e): messagebox.showerror("错误", f"导出失败: {error}"))
+                return
+            finally:
+                self.database.connections.close_reader()
+            self.root.after(0, lambda: on_done(stats))
+        
+        self.update_status("正在导出...")
+        threading.Thread(target=run, daemon=True).start()
+        
     def show_database_manager(self):
         """显示数据库管理器"""
         db_window = tk.Toplevel(self.root)
@@ -1062,11 +4472,7 @@ class FileSearchApp:
         reverse = self.sort_direction.get() == "descending"
         
         # 应用排序
-        self.filtered_data = self.property_sorter.sort_files(self.filtered_data, property_name, reverse)
-        self.update_file_list()
-        
-        # 更新排序指示器
-        self.update_sort_indicators(property_name, reverse)
+        self.apply_sort([(property_name, reverse)])
         
         # 显示排序信息
         direction_text = "降序" if reverse else "升序"
@@ -1074,17 +4480,34 @@ class FileSearchApp:
         
         window.destroy()
         
+    # 属性查看器每次加载的行数
+    PROPERTY_PAGE_SIZE = 500
+    # 属性查看器中表示不限属性名的选项
+    ALL_PROPERTIES = "全部属性"
+    
     def show_properties_viewer(self):
-        """显示属性查看器"""
+        """显示属性查看器，统计从属性统计表分页读取，滚动到底部时加载下一页"""
         props_window = tk.Toplevel(self.root)
         props_window.title("属性查看器")
         props_window.geometry("800x600")
         props_window.transient(self.root)
         props_window.grab_set()
         
+        # 属性名选择（括号中为含该属性的文件数）
+        key_frame = ttk.Frame(props_window)
+        key_frame.pack(fill=tk.X, padx=10, pady=(10, 0))
+        ttk.Label(key_frame, text="属性名:").pack(side=tk.LEFT)
+        keys = {f"{key} ({count})": key for key, count in self.database.get_property_keys()}
+        key_var = tk.StringVar(value=self.ALL_PROPERTIES)
+        key_combo = ttk.Combobox(key_frame, textvariable=key_var, values=[self.ALL_PROPERTIES] + list(keys),
+                                 state='readonly', width=40)
+        key_combo.pack(side=tk.LEFT, padx=5)
+        
         # 属性列表
+        list_frame = ttk.Frame(props_window)
+        list_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         columns = ('property', 'value', 'count')
-        tree = ttk.Treeview(props_window, columns=columns, show='headings', height=20)
+        tree = ttk.Treeview(list_frame, columns=columns, show='headings', height=20)
         
         tree.heading('property', text='属性名')
         tree.heading('value', text='属性值')
@@ -1094,33 +4517,137 @@ class FileSearchApp:
         tree.column('value', width=400)
         tree.column('count', width=100)
         
-        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        # 分页状态：当前属性名、上一页最后一行、是否还有更多、是否已安排加载下一页
+        state = {'key': None, 'after': None, 'has_more': True, 'loading': False}
         
-        # 加载属性统计
-        self.load_property_statistics(tree)
+        def on_scroll(first, last):
+            scrollbar.set(first, last)
+            if state['has_more'] and not state['loading'] and float(last) >= self.PAGE_LOAD_THRESHOLD:
+                state['loading'] = True
+                props_window.after_idle(lambda: self.load_property_statistics(tree, state))
         
-    def load_property_statistics(self, tree):
-        """加载属性统计"""
-        conn = sqlite3.connect(self.database.db_path)
-        cursor = conn.cursor()
+        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscrollcommand=on_scroll)
+        tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
-        cursor.execute('''
-            SELECT property_name, property_value, COUNT(*) as count
-            FROM properties
-            GROUP BY property_name, property_value
-            ORDER BY property_name, count DESC
-        ''')
+        def on_key_selected(event=None):
+            tree.delete(*tree.get_children())
+            state.update(key=keys.get(key_var.get()), after=None, has_more=True)
+            self.load_property_statistics(tree, state)
+        
+        key_combo.bind('<<ComboboxSelected>>', on_key_selected)
         
-        for row in cursor.fetchall():
+        # 加载第一页属性统计
+        self.load_property_statistics(tree, state)
+        
+    def load_property_statistics(self, tree, state):
+        """加载下一页属性统计"""
+        state['loading'] = False
+        if not state['has_more']:
+            return
+        rows = self.database.get_property_statistics(key=state['key'], limit=self.PROPERTY_PAGE_SIZE,
+                                                     after=state['after'])
+        for row in rows:
             tree.insert('', 'end', values=row)
+        state['has_more'] = len(rows) == self.PROPERTY_PAGE_SIZE
+        if rows:
+            state['after'] = rows[-1]
+        
+    # 重复文件窗口最多显示的组数（按可释放空间排序）
+    MAX_DUPLICATE_GROUPS_SHOWN = 1000
+    
+    def show_duplicate_finder(self):
+        """显示重复文件查找窗口，查找在后台线程中进行"""
+        dup_window = tk.Toplevel(self.root)
+        dup_window.title("查找重复文件")
+        dup_window.geometry("900x600")
+        dup_window.transient(self.root)
+        
+        status_label = ttk.Label(dup_window, text="正在按大小分组...")
+        status_label.pack(anchor=tk.W, padx=10, pady=(10, 0))
+        
+        # 每组一个父节点，展开为各个文件的路径
+        tree_frame = ttk.Frame(dup_window)
+        tree_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        tree = ttk.Treeview(tree_frame, columns=('size', 'wasted'), show='tree headings')
+        tree.heading('#0', text='文件')
+        tree.heading('size', text='大小')
+        tree.heading('wasted', text='可释放')
+        tree.column('#0', width=600)
+        tree.column('size', width=100)
+        tree.column('wasted', width=100)
+        
+        scrollbar = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        stop_event = threading.Event()
+        finder = DuplicateFinder(self.database, self.properties_manager, workers=self.index_workers)
+        
+        def set_status(text):
+            if dup_window.winfo_exists():
+                status_label.config(text=text)
+        
+        def on_progress(stats):
+            text = f"已检查 {stats['candidates']} 个大小相同的文件，完整哈希 {stats['full_hashed']} 个..."
+            self.root.after(0, lambda: set_status(text))
+        
+        def show_report(report):
+            if not dup_window.winfo_exists():
+                return
+            for group in report['groups'][:self.MAX_DUPLICATE_GROUPS_SHOWN]:
+                parent = tree.insert('', 'end', text=f"{len(group['files'])} 个相同文件  {group['hash']}",
+                                     values=(self.format_size(group['size']), self.format_size(group['wasted'])),
+                                     open=True)
+                for file in group['files']:
+                    tree.insert(parent, 'end', text=file['path'], values=('', ''))
             
-        conn.close()
+            stats = report['stats']
+            text = (f"找到 {stats['groups']} 组重复文件，可释放 {self.format_size(stats['wasted_bytes'])}；"
+                    f"完整哈希读取 {self.format_size(stats['full_bytes'])}，"
+                    f"候选文件共 {self.format_size(stats['candidate_bytes'])}")
+            if stats['groups'] > self.MAX_DUPLICATE_GROUPS_SHOWN:
+                text += f"（显示前 {self.MAX_DUPLICATE_GROUPS_SHOWN} 组）"
+            if not stats['completed']:
+                text += "（已停止）"
+            status_label.config(text=text)
+        
+        def run():
+            try:
+                report = finder.find(should_continue=lambda: not stop_event.is_set(), progress_callback=on_progress)
+            except Exception as e:
+                print(f"查找重复文件出错: {e}")
+                self.root.after(0, lambda: set_status(f"查找重复文件出错: {e}"))
+                return
+            finally:
+                self.database.connections.close_reader()
+            self.root.after(0, lambda: show_report(report))
+        
+        def on_close():
+            stop_event.set()
+            dup_window.destroy()
+        
+        dup_window.protocol("WM_DELETE_WINDOW", on_close)
+        tree.bind('<Double-1>', lambda e: self.open_duplicate_file(tree))
+        threading.Thread(target=run, daemon=True).start()
+        
+    def open_duplicate_file(self, tree):
+        """打开重复文件窗口中选中的文件"""
+        selection = tree.selection()
+        if selection and tree.parent(selection[0]):
+            try:
+                os.startfile(tree.item(selection[0], 'text'))
+            except Exception as e:
+                messagebox.showerror("错误", f"无法打开文件: {str(e)}")
         
     def show_settings(self):
         """显示设置对话框"""
         settings_window = tk.Toplevel(self.root)
         settings_window.title("设置")
-        settings_window.geometry("400x300")
+        settings_window.geometry("400x370")
         settings_window.transient(self.root)
         settings_window.grab_set()
         
@@ -1141,6 +4668,36 @@ class FileSearchApp:
         ttk.Label(settings_window, text="数据目录:").pack(anchor=tk.W, padx=10, pady=5)
         ttk.Label(settings_window, text=str(self.data_dir), foreground='gray').pack(anchor=tk.W, padx=10)
         
+        # 索引并行度设置
+        workers_frame = ttk.Frame(settings_window)
+        workers_frame.pack(fill=tk.X, padx=10, pady=5)
+        
+        ttk.Label(workers_frame, text="索引工作线程数:").pack(side=tk.LEFT)
+        self.settings_workers_var = tk.IntVar(value=self.index_workers)
+        ttk.Spinbox(workers_frame, from_=1, to=64, textvariable=self.settings_workers_var,
+                    width=5).pack(side=tk.LEFT, padx=(5, 0))
+        
+        self.settings_process_var = tk.BooleanVar(value=self.use_process_pool)
+        ttk.Checkbutton(settings_window, text="使用多进程解析图片和视频",
+                        variable=self.settings_process_var).pack(anchor=tk.W, padx=10)
+        
+        self.settings_watch_var = tk.BooleanVar(value=self.watch_changes)
+        ttk.Checkbutton(settings_window, text="监视目录变化，自动更新索引",
+                        variable=self.settings_watch_var).pack(anchor=tk.W, padx=10)
+        
+        self.settings_name_index_var = tk.BooleanVar(value=self.use_name_index)
+        ttk.Checkbutton(settings_window, text="在内存中保存文件名索引（搜索更快）",
+                        variable=self.settings_name_index_var).pack(anchor=tk.W, padx=10)
+        
+        # 哈希算法设置
+        hash_frame = ttk.Frame(settings_window)
+        hash_frame.pack(fill=tk.X, padx=10, pady=5)
+        
+        ttk.Label(hash_frame, text="哈希算法:").pack(side=tk.LEFT)
+        self.settings_hash_var = tk.StringVar(value=self.properties_manager.hash_algorithm)
+        ttk.Combobox(hash_frame, textvariable=self.settings_hash_var, values=FileProperties.HASH_ALGORITHMS,
+                     state="readonly", width=10).pack(side=tk.LEFT, padx=(5, 0))
+        
         # 保存按钮
         ttk.Button(settings_window, text="保存", 
                   command=lambda: self.save_settings_from_dialog(settings_window)).pack(pady=20)
@@ -1148,7 +4705,20 @@ class FileSearchApp:
     def save_settings_from_dialog(self, dialog):
         """从设置对话框保存设置"""
         self.index_directory = self.settings_dir_var.get()
+        enricher_settings = (self.index_workers, self.use_process_pool)
+        try:
+            self.index_workers = max(1, int(self.settings_workers_var.get()))
+        except (tk.TclError, ValueError):
+            pass
+        self.use_process_pool = self.settings_process_var.get()
+        self.properties_manager.hash_algorithm = self.settings_hash_var.get()
+        self.watch_changes = self.settings_watch_var.get()
+        self.use_name_index = self.settings_name_index_var.get()
         self.save_settings()
+        self.update_watcher()
+        self.update_name_index()
+        if (self.index_workers, self.use_process_pool) != enricher_settings:
+            self.start_enricher()
         dialog.destroy()
         messagebox.showinfo("成功", "设置已保存")
         
@@ -1178,6 +4748,13 @@ class FileSearchApp:
                 with open('everything_settings.json', 'r', encoding='utf-8') as f:
                     settings = json.load(f)
                     self.index_directory = settings.get('index_directory', '')
+                    self.index_workers = int(settings.get('index_workers', self.index_workers))
+                    self.use_process_pool = bool(settings.get('use_process_pool', self.use_process_pool))
+                    self.watch_changes = bool(settings.get('watch_changes', self.watch_changes))
+                    self.use_name_index = bool(settings.get('use_name_index', self.use_name_index))
+                    hash_algorithm = settings.get('hash_algorithm', self.properties_manager.hash_algorithm)
+                    if hash_algorithm in FileProperties.HASH_ALGORITHMS:
+                        self.properties_manager.hash_algorithm = hash_algorithm
         except:
             pass
             
@@ -1185,7 +4762,12 @@ class FileSearchApp:
         """保存设置"""
         try:
             settings = {
-                'index_directory': getattr(self, 'index_directory', '')
+                'index_directory': getattr(self, 'index_directory', ''),
+                'index_workers': self.index_workers,
+                'use_process_pool': self.use_process_pool,
+                'watch_changes': self.watch_changes,
+                'use_name_index': self.use_name_index,
+                'hash_algorithm': self.properties_manager.hash_algorithm
             }
             with open('everything_settings.json', 'w', encoding='utf-8') as f:
                 json.dump(settings, f, ensure_ascii=False, indent=2)
@@ -1196,6 +4778,13 @@ def main():
     root = tk.Tk()
     app = FileSearchApp(root)
     root.mainloop()
+    app.search_worker.stop(timeout=5)
+    app.count_worker.stop(timeout=5)
+    app.live_updater.stop(timeout=5)
+    app.enricher.stop(timeout=5)
+    app.database.save_name_index()
+    app.database.close()
+    app.hash_cache.close()
 
 if __name__ == "__main__":
     main()
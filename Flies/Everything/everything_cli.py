@@ -0,0 +1,229 @@
+"""
+文件搜索工具 - 命令行接口
+
+不依赖图形界面，可在服务器或计划任务中建立索引、搜索和导出，
+使用与图形界面相同的数据库格式（data/files.db），索引结果可以直接拷贝给图形界面使用。
+输出均为 JSON（搜索结果为每行一个 JSON 对象），便于脚本处理。
+
+用法示例:
+    python everything_cli.py index D:\\Share --incremental --enrich
+    python everything_cli.py search report --type 文档 --sort modified:desc --limit 20
+    python everything_cli.py search "ext:mp4;mkv size:>1gb dm:thisweek regex:^IMG_\\d+"
+    python everything_cli.py stats
+    python everything_cli.py export results.csv --query .mp4 --min-size 1048576
+    python everything_cli.py export all.parquet --properties
+    python everything_cli.py duplicates D:\\Share --min-size 1048576 --limit 50
+"""
+
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+
+from everything import (HashCache, FileProperties, LightweightDatabase, FileIndexer, PropertyEnricher,
+                        DuplicateFinder, ResultExporter, FILE_TYPE_FILTERS)
+
+QUERY_HELP = ("搜索文本：空格分隔的关键词同时满足，| 为或，! 为排除，<> 分组，支持 * ? 通配符和函数 "
+              "ext:mp4;mkv size:>1gb dm:thisweek type:视频 path: name: regex: fuzzy:")
+
+def open_database(args):
+    """按命令行参数打开数据库、哈希缓存和属性管理器"""
+    data_dir = Path(args.data_dir)
+    data_dir.mkdir(parents=True, exist_ok=True)
+    hash_cache = HashCache(data_dir / "hash_cache.db")
+    properties_manager = FileProperties(hash_algorithm=getattr(args, 'hash_algorithm', 'md5'),
+                                        hash_cache=hash_cache)
+    database = LightweightDatabase(data_dir)
+    return database, properties_manager, hash_cache
+
+def parse_datetime(value: str) -> datetime:
+    """解析 ISO 格式的日期时间（如 2024-01-31 或 2024-01-31T08:00）"""
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的时间: {value}")
+
+def parse_sort(value: str) -> list:
+    """解析排序参数，如 "size:desc,name" -> [('size', True), ('name', False)]"""
+    sort_order = []
+    for part in value.split(','):
+        name, _, direction = part.strip().partition(':')
+        if direction not in ('', 'asc', 'desc'):
+            raise argparse.ArgumentTypeError(f"无效的排序方向: {direction}")
+        sort_order.append((name, direction == 'desc'))
+    return sort_order
+
+def print_json(data):
+    print(json.dumps(data, ensure_ascii=False))
+
+def add_query_arguments(parser):
+    """搜索和导出共用的查询参数"""
+    parser.add_argument('--type', dest='file_type', default='',
+                        help=f"文件类型: {', '.join(list(FILE_TYPE_FILTERS) + ['其他'])}")
+    parser.add_argument('--size', dest='size_filter', default='',
+                        choices=list(LightweightDatabase.SIZE_FILTERS), help="大小范围")
+    parser.add_argument('--min-size', type=int, help="最小大小（字节）")
+    parser.add_argument('--max-size', type=int, help="最大大小（字节，不含）")
+    parser.add_argument('--modified-after', type=parse_datetime, help="修改时间不早于")
+    parser.add_argument('--modified-before', type=parse_datetime, help="修改时间早于")
+    parser.add_argument('--created-after', type=parse_datetime, help="创建时间不早于")
+    parser.add_argument('--created-before', type=parse_datetime, help="创建时间早于")
+    parser.add_argument('--sort', type=parse_sort, default=[('name', False)],
+                        help="排序，如 size:desc,name（默认按文件名升序）")
+    parser.add_argument('--properties', action='store_true', help="同时输出详细属性")
+
+def get_search_params(args) -> dict:
+    """从命令行参数构造 search_files 的参数"""
+    params = {
+        'query': args.query or '',
+        'file_type': args.file_type,
+        'size_filter': args.size_filter,
+        'order_by': args.sort,
+        'include_properties': args.properties,
+    }
+    for name in ('min_size', 'max_size', 'modified_after', 'modified_before', 'created_after', 'created_before'):
+        value = getattr(args, name)
+        if value is not None:
+            params[name] = value
+    return params
+
+def command_index(args, database, properties_manager):
+    """建立或更新索引"""
+    indexer = FileIndexer(database, properties_manager, workers=args.workers)
+
+    def on_progress(stats):
+        if args.verbose:
+            print(f"已处理 {stats['total']} 个文件，索引 {stats['indexed']} 个...", file=sys.stderr)
+
+    # 保存绝对路径，数据库拷贝到其他机器或交给图形界面后路径仍然有效
+    directory = os.path.abspath(args.directory)
+    stats = indexer.index(directory, incremental=args.incremental, progress_callback=on_progress)
+
+    if args.enrich:
+        # 不在后台运行，直接补全所有待处理文件的哈希和属性
+        enricher = PropertyEnricher(database, properties_manager, workers=args.workers,
+                                    use_processes=not args.no_processes)
+        try:
+            while enricher.enrich_pending():
+                pass
+        finally:
+            enricher.stop()
+        stats['enriched'] = enricher.enriched_count
+
+    print_json(stats)
+    return 0
+
+def command_search(args, database, properties_manager):
+    """搜索并输出结果"""
+    params = get_search_params(args)
+    if args.limit is not None:
+        results = database.search_files(**params, limit=args.limit)
+    else:
+        results = database.iter_files(**params)
+
+    if args.format == 'json':
+        print_json([ResultExporter.make_record(file_info) for file_info in results])
+    else:
+        for file_info in results:
+            print_json(ResultExporter.make_record(file_info))
+    return 0
+
+def command_stats(args, database, properties_manager):
+    """输出索引统计"""
+    print_json(database.get_statistics())
+    return 0
+
+def command_export(args, database, properties_manager):
+    """流式导出全部搜索结果到 CSV、JSON Lines 或 Parquet 文件"""
+    params = get_search_params(args)
+
+    def on_progress(stats):
+        if args.verbose:
+            print(f"已导出 {stats['files']} 个文件...", file=sys.stderr)
+
+    exporter = ResultExporter(database, batch_size=args.batch_size)
+    stats = exporter.export(args.output, output_format=args.format, progress_callback=on_progress, **params)
+    del stats['completed']
+    print_json(stats)
+    return 0
+
+def command_duplicates(args, database, properties_manager):
+    """查找重复文件，输出重复文件组和各阶段的统计"""
+    def on_progress(stats):
+        if args.verbose:
+            print(f"已检查 {stats['candidates']} 个候选文件，完整哈希 {stats['full_hashed']} 个...", file=sys.stderr)
+    
+    finder = DuplicateFinder(database, properties_manager, workers=args.workers)
+    root = os.path.abspath(args.directory) if args.directory else None
+    report = finder.find(root=root, min_size=args.min_size, progress_callback=on_progress)
+    if args.limit is not None:
+        report['groups'] = report['groups'][:args.limit]
+    print_json(report)
+    return 0
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="文件搜索工具命令行接口")
+    parser.add_argument('--data-dir', default='data', help="数据目录（默认 data，与图形界面相同）")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    index_parser = subparsers.add_parser('index', help="建立或更新索引")
+    index_parser.add_argument('directory', help="要索引的目录")
+    index_parser.add_argument('--incremental', action='store_true', help="增量索引，跳过未修改的文件")
+    index_parser.add_argument('--enrich', action='store_true', help="索引后立即计算哈希和详细属性")
+    index_parser.add_argument('--workers', type=int, default=None, help="工作线程数（默认 CPU 核数）")
+    index_parser.add_argument('--no-processes', action='store_true', help="不使用多进程解析图片和视频")
+    index_parser.add_argument('--hash-algorithm', default='md5', choices=FileProperties.HASH_ALGORITHMS,
+                              help="哈希算法")
+    index_parser.add_argument('--verbose', action='store_true', help="在标准错误输出中显示进度")
+    index_parser.set_defaults(handler=command_index)
+
+    search_parser = subparsers.add_parser('search', help="搜索文件")
+    search_parser.add_argument('query', nargs='?', default='', help=QUERY_HELP)
+    add_query_arguments(search_parser)
+    search_parser.add_argument('--limit', type=int, help="最多输出的结果数")
+    search_parser.add_argument('--format', choices=['jsonl', 'json'], default='jsonl',
+                               help="jsonl: 每行一个文件（默认）；json: 一个数组")
+    search_parser.set_defaults(handler=command_search)
+
+    stats_parser = subparsers.add_parser('stats', help="索引统计")
+    stats_parser.set_defaults(handler=command_stats)
+
+    export_parser = subparsers.add_parser('export', help="导出搜索结果")
+    export_parser.add_argument('output', help="输出文件")
+    export_parser.add_argument('--query', default='', help=QUERY_HELP)
+    add_query_arguments(export_parser)
+    export_parser.add_argument('--format', choices=ResultExporter.FORMATS,
+                               help="输出格式（默认按扩展名判断，parquet 需要 pyarrow）")
+    export_parser.add_argument('--batch-size', type=int, default=ResultExporter.BATCH_SIZE,
+                               help=f"每批读取和写出的文件数（默认 {ResultExporter.BATCH_SIZE}）")
+    export_parser.add_argument('--verbose', action='store_true', help="在标准错误输出中显示进度")
+    export_parser.set_defaults(handler=command_export)
+    
+    duplicates_parser = subparsers.add_parser('duplicates', help="查找重复文件（大小 -> 部分哈希 -> 完整哈希）")
+    duplicates_parser.add_argument('directory', nargs='?', help="只查找该目录下的文件（默认整个索引）")
+    duplicates_parser.add_argument('--min-size', type=int, default=1, help="最小文件大小（字节，默认 1）")
+    duplicates_parser.add_argument('--limit', type=int, help="最多输出的重复文件组数（按可释放空间排序）")
+    duplicates_parser.add_argument('--workers', type=int, default=None, help="哈希工作线程数（默认 CPU 核数）")
+    duplicates_parser.add_argument('--hash-algorithm', default='md5', choices=FileProperties.HASH_ALGORITHMS,
+                                   help="哈希算法")
+    duplicates_parser.add_argument('--verbose', action='store_true', help="在标准错误输出中显示进度")
+    duplicates_parser.set_defaults(handler=command_duplicates)
+
+    return parser
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    database, properties_manager, hash_cache = open_database(args)
+    try:
+        return args.handler(args, database, properties_manager)
+    except ValueError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return 2
+    finally:
+        database.close()
+        hash_cache.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
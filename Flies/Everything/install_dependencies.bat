@@ -35,6 +35,10 @@ echo.
 echo 4. 安装 opencv-python (视频文件属性)...
 pip install opencv-python
 
+echo.
+echo 5. 安装 pyarrow (导出 Parquet)...
+pip install pyarrow
+
 echo.
 echo ========================================
 echo 依赖包安装完成！
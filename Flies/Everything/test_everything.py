@@ -6,10 +6,9 @@
 """
 
 import os
-import sys
 import tempfile
 import shutil
-from datetime import datetime
+from datetime import datetime, timedelta
 
 def create_test_files():
     """创建测试文件"""
@@ -96,6 +95,1265 @@ def test_file_search_app():
         traceback.print_exc()
         return False
 
+def make_test_file_info(path, size=100, **extra):
+    """构造测试用文件信息"""
+    now = datetime.now()
+    file_info = {
+        'name': os.path.basename(path),
+        'path': path,
+        'size': size,
+        'type': '文档',
+        'created': now,
+        'modified': now,
+        'accessed': now,
+        'attributes': '',
+        'hash': '',
+    }
+    file_info.update(extra)
+    return file_info
+
+def test_batch_add_files():
+    """测试批量写入"""
+    from everything import LightweightDatabase
+    
+    temp_dir = tempfile.mkdtemp()
+    try:
+        db = LightweightDatabase(temp_dir, batch_size=7)
+        file_infos = [make_test_file_info(f"/tmp/batch/file_{i}.txt", size=i) for i in range(50)]
+        # 属性获取失败的记录应被跳过
+        file_infos.append({'error': 'permission denied'})
+        
+        progress = []
+        added = db.add_files(iter(file_infos), progress_callback=progress.append)
+        assert added == 50
+        assert progress[-1] == 50
+        assert db.get_file_count() == 50
+        print(f"✓ 批量写入 {added} 个文件，{len(progress)} 个事务")
+        
+        # 重复写入同一路径不会产生重复记录
+        assert db.add_file(make_test_file_info("/tmp/batch/file_0.txt", size=999))
+        assert db.get_file_count() == 50
+        results = db.search_files("file_0.txt")
+        assert results[0]['size'] == 999
+        print("✓ 重复路径更新成功")
+        
+        db.close()
+    finally:
+        shutil.rmtree(temp_dir)
+
+def test_file_fingerprints():
+    """测试增量索引使用的文件指纹"""
+    from everything import LightweightDatabase, FileProperties
+    
+    temp_dir = tempfile.mkdtemp()
+    try:
+        db = LightweightDatabase(temp_dir)
+        file_path = os.path.join(temp_dir, "fingerprint.txt")
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write("指纹测试")
+        
+        file_info = {'name': "fingerprint.txt", 'path': file_path, 'type': '文档'}
+        file_info.update(FileProperties().get_file_properties(file_path))
+        assert db.add_file(file_info)
+        
+        stat = os.stat(file_path)
+        fingerprints = db.get_file_fingerprints([file_path, "/not/indexed"])
+        assert fingerprints == {file_path: (stat.st_size, stat.st_mtime_ns, stat.st_ino)}
+        print("✓ 文件指纹读取成功")
+        
+        db.close()
+    finally:
+        shutil.rmtree(temp_dir)
+
+def test_sweep_stale_files():
+    """测试清理本轮索引未访问到的文件"""
+    from everything import LightweightDatabase
+    
+    temp_dir = tempfile.mkdtemp()
+    try:
+        db = LightweightDatabase(temp_dir)
+        root = os.path.join(temp_dir, "root")
+        other = os.path.join(temp_dir, "root_other")
+        
+        first = db.begin_generation()
+        db.add_files([make_test_file_info(os.path.join(root, f"f{i}.txt")) for i in range(5)] +
+                     [make_test_file_info(os.path.join(other, "keep.txt"))], generation=first)
+        
+        # 第二轮只访问到部分文件
+        second = db.begin_generation()
+        assert second == first + 1
+        db.add_files([{'path': os.path.join(root, "f0.txt"), 'unchanged': True},
+                      make_test_file_info(os.path.join(root, "f1.txt"))], generation=second)
+        
+        removed = db.sweep_stale_files(root, second)
+        assert removed == 3
+        # 其他目录（即使前缀相同）不受影响
+        assert db.get_file_count() == 3
+        print(f"✓ 清理已删除文件 {removed} 个")
+        
+        db.close()
+    finally:
+        shutil.rmtree(temp_dir)
+
+def test_index_pipeline():
+    """测试并行索引流水线"""
+    import threading
+    from everything import IndexPipeline
+    
+    pipeline = IndexPipeline(workers=4, use_processes=False, queue_size=8)
+    results = list(pipeline.run(iter(range(1000)), lambda x: x * 2 if x % 10 else None))
+    assert sorted(results) == [x * 2 for x in range(1000) if x % 10]
+    print(f"✓ 流水线处理 {len(results)} 个任务")
+    
+    # 调用方提前结束时流水线线程能够退出
+    results = pipeline.run(iter(range(100000)), lambda x: x)
+    for i, _ in enumerate(results):
+        if i == 10:
+            break
+    results.close()
+    print("✓ 流水线提前停止成功")
+    
+    # 工作线程中的意外异常在调用方重新抛出，而不是让调用方一直等待
+    def fail_on_13(x):
+        if x == 13:
+            raise ValueError("属性解析失败")
+        return x
+    
+    outcome = []
+    
+    def consume():
+        try:
+            list(pipeline.run(iter(range(1000)), fail_on_13))
+        except ValueError as e:
+            outcome.append(e)
+    
+    thread = threading.Thread(target=consume, daemon=True)
+    thread.start()
+    thread.join(10)
+    assert not thread.is_alive() and len(outcome) == 1
+    print("✓ 工作线程的异常传给调用方")
+
+def test_scan_files_reuses_stat():
+    """测试 scandir 遍历与 stat 结果复用"""
+    from everything import scan_files, FileProperties
+    import everything
+    
+    temp_dir = tempfile.mkdtemp()
+    try:
+        os.makedirs(os.path.join(temp_dir, "sub", "deep"))
+        for relative in ["a.txt", os.path.join("sub", "b.txt"), os.path.join("sub", "deep", "c.txt")]:
+            with open(os.path.join(temp_dir, relative), 'w', encoding='utf-8') as f:
+                f.write("内容")
+        
+        entries = [entry for _, files in scan_files(temp_dir) for entry in files]
+        assert sorted(entry.name for entry in entries) == ["a.txt", "b.txt", "c.txt"]
+        print(f"✓ scandir 遍历到 {len(entries)} 个文件")
+        
+        # 传入 stat 结果后不再调用 os.stat
+        entry = entries[0]
+        stat_result = entry.stat()
+        original_stat = everything.os.stat
+        calls = []
+        everything.os.stat = lambda *args, **kwargs: calls.append(args) or original_stat(*args, **kwargs)
+        try:
+            properties = FileProperties().get_file_properties(entry.path, stat_result=stat_result)
+        finally:
+            everything.os.stat = original_stat
+        assert calls == []
+        assert properties['size'] == stat_result.st_size
+        print("✓ 属性提取复用 stat 结果")
+    finally:
+        shutil.rmtree(temp_dir)
+
+def test_fts_search():
+    """测试 trigram 全文索引搜索"""
+    from everything import LightweightDatabase
+    
+    temp_dir = tempfile.mkdtemp()
+    try:
+        db = LightweightDatabase(temp_dir)
+        if not db.fts_enabled:
+            print("- 当前 SQLite 不支持 FTS5 trigram，跳过")
+            return
+        
+        root = os.path.join(temp_dir, "项目资料")
+        generation = db.begin_generation()
+        db.add_files([make_test_file_info(os.path.join(root, name))
+                      for name in ["Report_2024.docx", "报告草稿.txt", "photo.jpg", "50%_done.txt"]],
+                     generation=generation)
+        
+        assert [r['name'] for r in db.search_files("port_20")] == ["Report_2024.docx"]
+        assert [r['name'] for r in db.search_files("REPORT")] == ["Report_2024.docx"]
+        assert [r['name'] for r in db.search_files("报告草")] == ["报告草稿.txt"]
+        # 关键词中的特殊字符按字面匹配
+        assert [r['name'] for r in db.search_files('50%_')] == ["50%_done.txt"]
+        # 路径中的目录名同样可以搜索
+        assert len(db.search_files("项目资料")) == 4
+        print("✓ 全文索引子串搜索成功")
+        
+        # 删除后全文索引同步更新
+        db.add_files([{'path': os.path.join(root, "photo.jpg"), 'unchanged': True}],
+                     generation=db.begin_generation())
+        db.sweep_stale_files(root, generation + 1)
+        assert db.search_files("port_20") == []
+        assert [r['name'] for r in db.search_files("photo")] == ["photo.jpg"]
+        conn = db.get_write_connection()
+        conn.execute("INSERT INTO files_fts (files_fts, rank) VALUES ('integrity-check', 1)")
+        print("✓ 全文索引与文件表保持同步")
+        
+        db.close()
+    finally:
+        shutil.rmtree(temp_dir)
+
+def test_streaming_hash_cache():
+    """测试流式哈希与哈希缓存"""
+    from everything import FileProperties, HashCache
+    import hashlib
+    
+    temp_dir = tempfile.mkdtemp()
+    try:
+        file_path = os.path.join(temp_dir, "large.bin")
+        content = os.urandom(1024 * 1024 * 3 + 17)  # 超过旧的 1MB 限制且不是块大小的整数倍
+        with open(file_path, 'wb') as f:
+            f.write(content)
+        
+        cache = HashCache(os.path.join(temp_dir, "hash_cache.db"))
+        props = FileProperties(hash_algorithm='blake2b', hash_cache=cache)
+        assert props.calculate_file_hash(file_path) == hashlib.blake2b(content).hexdigest()
+        print("✓ 大文件流式哈希成功")
+        
+        # 文件未变化时使用缓存（包括重新打开缓存之后）
+        cache.close()
+        cache = HashCache(os.path.join(temp_dir, "hash_cache.db"))
+        props = FileProperties(hash_algorithm='blake2b', hash_cache=cache)
+        stat = os.stat(file_path)
+        assert cache.get(file_path, stat, 'blake2b') == hashlib.blake2b(content).hexdigest()
+        assert cache.get(file_path, stat, 'md5') is None
+        print("✓ 哈希缓存命中")
+        
+        # 文件修改后缓存失效
+        with open(file_path, 'ab') as f:
+            f.write(b"x")
+        assert cache.get(file_path, os.stat(file_path), 'blake2b') is None
+        assert props.calculate_file_hash(file_path) == hashlib.blake2b(content + b"x").hexdigest()
+        print("✓ 文件修改后重新计算哈希")
+        cache.close()
+    finally:
+        shutil.rmtree(temp_dir)
+
+def test_property_enricher():
+    """测试两阶段索引的后台属性补全"""
+    from everything import LightweightDatabase, FileProperties, PropertyEnricher
+    import hashlib
+    
+    temp_dir = tempfile.mkdtemp()
+    try:
+        db = LightweightDatabase(temp_dir)
+        file_path = os.path.join(temp_dir, "notes.txt")
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write("第一行 hello\n第二行 world\n")
+        
+        # 第一阶段：只写入基本信息，立即可以搜索
+        props = FileProperties()
+        file_info = {'name': "notes.txt", 'path': file_path, 'type': '文档'}
+        file_info.update(props.get_file_properties(file_path, include_specific=False, include_hash=False))
+        assert db.add_file(file_info)
+        assert db.search_files("notes")[0]['hash'] == ''
+        assert len(db.get_pending_files(10)) == 1
+        print("✓ 基本信息写入后即可搜索")
+        
+        # 第二阶段：后台补全哈希和文档属性
+        enricher = PropertyEnricher(db, props, workers=2, use_processes=False)
+        assert enricher.enrich_pending() == 1
+        assert enricher.enrich_pending() == 0
+        result = db.search_files("notes", include_properties=True)[0]
+        with open(file_path, 'rb') as f:
+            assert result['hash'] == hashlib.md5(f.read()).hexdigest()
+        assert result['properties']['line_count'] == 2
+        print("✓ 后台补全哈希和属性")
+        
+        # 补全期间文件被重新索引时，不写入过期结果
+        db.add_file(file_info)
+        file_id, _, mtime_ns = db.get_pending_files(10)[0]
+        db.save_enrichment([{'id': file_id, 'mtime_ns': (mtime_ns or 0) - 1, 'hash': 'stale', 'properties': {}}])
+        assert len(db.get_pending_files(10)) == 1
+        print("✓ 过期的补全结果被忽略")
+        
+        enricher.stop()
+        db.close()
+    finally:
+        shutil.rmtree(temp_dir)
+
+def test_keyset_pagination():
+    """测试搜索结果键集分页"""
+    from everything import LightweightDatabase
+    
+    temp_dir = tempfile.mkdtemp()
+    try:
+        db = LightweightDatabase(temp_dir)
+        # 同名文件位于不同目录，游标需要用 id 区分
+        db.add_files([make_test_file_info(f"/data/d{i % 3}/page_{i // 3:03d}.txt") for i in range(95)])
+        
+        expected = db.search_files("page_")
+        assert len(expected) == db.count_files("page_") == 95
+        
+        pages = []
+        cursor = None
+        while True:
+            page = db.search_files("page_", limit=20, after=cursor)
+            if not page:
+                break
+            pages.append(page)
+            cursor = db.get_cursor(page[-1])
+        
+        assert [len(page) for page in pages] == [20, 20, 20, 20, 15]
+        assert [r['id'] for page in pages for r in page] == [r['id'] for r in expected]
+        print(f"✓ 分页读取 {len(pages)} 页，结果与一次查询一致")
+        
+        def read_all(order_by, page_size=3):
+            rows, cursor = [], None
+            while True:
+                page = db.search_files("null_", limit=page_size, after=cursor, order_by=order_by)
+                if not page:
+                    return rows
+                rows.extend(page)
+                cursor = db.get_cursor(page[-1])
+        
+        # 一半文件缺少创建时间和哈希值
+        db.add_files([make_test_file_info(f"/data/nulls/null_{i}.txt",
+                                          created=datetime(2024, 1, i + 1) if i % 2 else None,
+                                          hash=None if i % 2 else f"h{i}")
+                      for i in range(10)])
+        for property_name in ('created', 'hash'):
+            for reverse in (False, True):
+                rows = read_all([(property_name, reverse)])
+                assert len(rows) == len({r['id'] for r in rows}) == 10
+        
+        # 旧数据中残留的 NULL：游标值为 NULL 时仍能继续向后翻页
+        conn = db.get_write_connection()
+        with conn:
+            conn.execute("UPDATE files SET created = NULL WHERE name IN ('null_0.txt', 'null_2.txt', 'null_4.txt')")
+        rows = read_all([('created', False)])
+        assert len({r['id'] for r in rows}) == 10
+        assert [r['created'] for r in rows[:3]] == [None] * 3
+        print("✓ 排序键为空时分页不漏行")
+        
+        db.close()
+    finally:
+        shutil.rmtree(temp_dir)
+
+def test_sql_sorting():
+    """测试在数据库中排序（含多列排序与分页）"""
+    from everything import LightweightDatabase
+    
+    temp_dir = tempfile.mkdtemp()
+    try:
+        db = LightweightDatabase(temp_dir)
+        db.add_files([make_test_file_info(f"/data/sort/f{i:02d}{'.txt' if i % 2 else '.bin'}",
+                                          size=(i * 7) % 10, attributes='H' if i % 3 == 0 else '')
+                      for i in range(60)])
+        
+        def read_all(order_by, page_size=7):
+            rows, cursor = [], None
+            while True:
+                page = db.search_files(limit=page_size, after=cursor, order_by=order_by)
+                if not page:
+                    return rows
+                rows.extend(page)
+                cursor = db.get_cursor(page[-1])
+        
+        # 单列降序
+        rows = read_all([('size', True)])
+        assert [r['size'] for r in rows] == sorted((r['size'] for r in rows), reverse=True)
+        assert len({r['id'] for r in rows}) == 60
+        
+        # 多列混合方向：扩展名升序，大小降序，文件名升序
+        rows = read_all([('extension', False), ('size', True), ('name', False)])
+        keys = [(os.path.splitext(r['name'])[1], -r['size'], r['name']) for r in rows]
+        assert keys == sorted(keys)
+        
+        # 按属性表达式排序
+        rows = read_all([('is_hidden', True), ('length', False)], page_size=11)
+        hidden = ['H' in r['attributes'] for r in rows]
+        assert hidden == sorted(hidden, reverse=True) and len(rows) == 60
+        print("✓ 数据库排序与分页结果正确")
+        
+        db.close()
+    finally:
+        shutil.rmtree(temp_dir)
+
+def test_range_filters():
+    """测试大小与时间范围筛选"""
+    from everything import LightweightDatabase
+    
+    temp_dir = tempfile.mkdtemp()
+    try:
+        db = LightweightDatabase(temp_dir)
+        base = datetime(2024, 1, 1)
+        db.add_files([make_test_file_info(f"/data/range/f{i:02d}.dat", size=i * 1024 ** 2,
+                                          modified=base + timedelta(days=i),
+                                          created=base - timedelta(days=i))
+                      for i in range(20)])
+        
+        def names(**filters):
+            return sorted(r['name'] for r in db.search_files(**filters))
+        
+        assert len(names(size_filter="小于1MB")) == 1
+        assert names(size_filter="1MB-10MB") == [f"f{i:02d}.dat" for i in range(1, 10)]
+        assert names(min_size=5 * 1024 ** 2, max_size=8 * 1024 ** 2) == ["f05.dat", "f06.dat", "f07.dat"]
+        # 界面筛选项与显式范围取交集
+        assert names(size_filter="10MB-100MB", max_size=12 * 1024 ** 2) == ["f10.dat", "f11.dat"]
+        print("✓ 大小范围筛选正确")
+        
+        assert names(modified_after=base + timedelta(days=18)) == ["f18.dat", "f19.dat"]
+        assert names(modified_after=base + timedelta(days=3),
+                     modified_before=base + timedelta(days=5)) == ["f03.dat", "f04.dat"]
+        assert names(created_before=base - timedelta(days=17)) == ["f18.dat", "f19.dat"]
+        assert db.count_files(query="f1", modified_after=base + timedelta(days=15)) == 5
+        print("✓ 时间范围筛选正确")
+        
+        db.close()
+    finally:
+        shutil.rmtree(temp_dir)
+
+def test_timestamp_migration():
+    """测试旧版本数据库（ISO 时间字符串）升级为整数时间戳"""
+    import sqlite3
+    from everything import LightweightDatabase
+    
+    temp_dir = tempfile.mkdtemp()
+    try:
+        # 构造与初始版本相同结构的数据库
+        conn = sqlite3.connect(os.path.join(temp_dir, "files.db"))
+        conn.execute('''
+            CREATE TABLE files (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, path TEXT UNIQUE NOT NULL,
+                size INTEGER, type TEXT, created TEXT, modified TEXT, accessed TEXT,
+                attributes TEXT, hash TEXT, indexed_at TEXT
+            )
+        ''')
+        modified = datetime(2023, 6, 1, 12, 30, 15, 250000)
+        conn.executemany(
+            'INSERT INTO files (name, path, size, type, created, modified, accessed, attributes, hash, indexed_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            [(f"old_{i}.txt", f"/old/old_{i}.txt", i, '文档', modified.isoformat(),
+              (modified + timedelta(days=i)).isoformat(), modified.isoformat(), '', '', modified.isoformat())
+             for i in range(5)]
+        )
+        # 无法识别的时间和缺失的值
+        conn.execute(
+            'INSERT INTO files (name, path, size, type, created, modified, accessed, attributes, hash, indexed_at) '
+            "VALUES ('old_bad.txt', '/old/old_bad.txt', 9, '文档', NULL, 'not a date', '2023/06/01', NULL, NULL, NULL)"
+        )
+        conn.commit()
+        conn.close()
+        
+        db = LightweightDatabase(temp_dir)
+        conn = sqlite3.connect(db.db_path)
+        column_types = {row[1]: row[2] for row in conn.execute('PRAGMA table_info(files)')}
+        assert all(column_types[column] == 'INTEGER' for column in db.TIMESTAMP_COLUMNS)
+        assert conn.execute("SELECT COUNT(*) FROM files WHERE typeof(modified) != 'integer'").fetchone()[0] == 0
+        assert conn.execute(
+            'SELECT COUNT(*) FROM files WHERE created IS NULL OR accessed IS NULL OR attributes IS NULL OR hash IS NULL'
+        ).fetchone()[0] == 0
+        conn.close()
+        
+        rows = db.search_files(order_by=[('modified', False)])
+        assert [r['name'] for r in rows] == ["old_bad.txt"] + [f"old_{i}.txt" for i in range(5)]
+        assert (rows[0]['created'], rows[0]['modified'], rows[0]['accessed'], rows[0]['hash']) == (0, 0, 0, '')
+        assert rows[1]['modified'] == int(modified.timestamp())
+        assert db.count_files(modified_after=modified + timedelta(days=3)) == 2
+        print("✓ 旧数据库时间列已升级为整数时间戳，无法识别的时间记为 0")
+        
+        # 按包含未知时间的列分页，不漏行
+        pages, after = [], None
+        while True:
+            page = db.search_files(order_by=[('created', True)], limit=4, after=after)
+            if not page:
+                break
+            pages.extend(r['name'] for r in page)
+            after = db.get_cursor(page[-1])
+        assert sorted(pages) == sorted(r['name'] for r in rows)
+        
+        # 重建文件表后全文索引和触发器仍然有效
+        db.add_file(make_test_file_info("/old/new_file.txt"))
+        assert [r['name'] for r in db.search_files("new_f")] == ["new_file.txt"]
+        assert len(db.search_files("old_")) == 6
+        print("✓ 升级后全文索引正常")
+        
+        db.close()
+    finally:
+        shutil.rmtree(temp_dir)
+
+def test_typed_properties():
+    """测试属性以 JSON 保存并可在数据库中排序和筛选"""
+    import sqlite3
+    from everything import LightweightDatabase
+    
+    temp_dir = tempfile.mkdtemp()
+    try:
+        # 旧版本的属性表（文本值）在升级时转换为 JSON
+        conn = sqlite3.connect(os.path.join(temp_dir, "files.db"))
+        conn.execute('''
+            CREATE TABLE files (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, path TEXT UNIQUE NOT NULL,
+                size INTEGER, type TEXT, created TEXT, modified TEXT, accessed TEXT,
+                attributes TEXT, hash TEXT, indexed_at TEXT
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE properties (
+                file_id INTEGER, property_name TEXT, property_value TEXT,
+                PRIMARY KEY (file_id, property_name)
+            )
+        ''')
+        now = datetime.now().isoformat()
+        conn.execute("INSERT INTO files (id, name, path, size, type, created, modified, accessed, attributes, hash, "
+                     "indexed_at) VALUES (1, 'old.png', '/media/old.png', 1, '图片', ?, ?, ?, '', '', ?)",
+                     (now, now, now, now))
+        conn.executemany("INSERT INTO properties VALUES (1, ?, ?)",
+                         [('width', '640'), ('height', '480'), ('format', 'PNG'), ('dimensions', '640x480')])
+        conn.commit()
+        conn.close()
+        
+        db = LightweightDatabase(temp_dir)
+        old = db.search_files("old.png", include_properties=True)[0]
+        assert old['properties'] == {'width': 640, 'height': 480, 'format': 'PNG', 'dimensions': '640x480'}
+        print("✓ 旧属性表已转换为 JSON")
+        
+        db.add_files([make_test_file_info(f"/media/clip_{i:02d}.mp4", properties={
+            'width': 320 * (i % 4 + 1), 'height': 240, 'duration': i * 1.5, 'title': f"第{i}集, 上"})
+            for i in range(12)] +
+            [make_test_file_info("/media/readme.txt", properties={'line_count': 3, 'ratio': float('nan')})])
+        
+        # 含逗号的值不再被拆开，数字保持数字类型
+        clip = db.search_files("clip_05", include_properties=True)[0]
+        assert clip['properties'] == {'width': 640, 'height': 240, 'duration': 7.5, 'title': "第5集, 上"}
+        assert db.search_files("readme", include_properties=True)[0]['properties'] == {'line_count': 3}
+        assert 'properties' not in db.search_files("clip_05")[0]
+        
+        # 按宽度（生成列）降序分页排序，没有宽度的文件排在最后
+        rows, cursor = [], None
+        while True:
+            page = db.search_files(limit=5, after=cursor, order_by=[('width', True), ('duration', False)],
+                                   include_properties=True)
+            if not page:
+                break
+            rows.extend(page)
+            cursor = db.get_cursor(page[-1])
+        widths = [r['properties'].get('width', -1) for r in rows]
+        assert len(rows) == 14 and widths == sorted(widths, reverse=True) and widths[-1] == -1
+        print("✓ 按媒体属性排序正确")
+        
+        assert db.count_files(property_ranges={'width': (1280, None)}) == 3
+        assert db.count_files(property_ranges={'duration': (3, 9), 'width': (None, 700)}) == 2
+        assert db.count_files(property_ranges={'line_count': (2, 4)}) == 1
+        print("✓ 按媒体属性筛选正确")
+        
+        db.close()
+    finally:
+        shutil.rmtree(temp_dir)
+
+def test_property_statistics():
+    """测试属性统计表随属性增量更新并可分页读取"""
+    import sqlite3
+    from everything import LightweightDatabase
+    
+    def full_group_by(db):
+        return db.get_read_connection().execute('''
+            SELECT p.key, p.value, COUNT(*) AS count FROM file_properties fp, json_each(fp.data) p
+            GROUP BY p.key, p.value ORDER BY p.key, count DESC, p.value
+        ''').fetchall()
+    
+    temp_dir = tempfile.mkdtemp()
+    try:
+        db = LightweightDatabase(temp_dir)
+        db.add_files([make_test_file_info(f"/media/clip_{i:02d}.mp4", properties={
+            'width': 320 * (i % 3 + 1), 'codec': 'h264' if i % 2 else 'av1', 'duration': i * 1.5})
+            for i in range(20)])
+        assert db.get_property_statistics() == full_group_by(db)
+        assert db.get_property_keys() == [('codec', 20), ('duration', 20), ('width', 20)]
+        
+        # 重新索引、补全、删除和清空都同步更新统计
+        db.add_files([make_test_file_info(f"/media/clip_{i:02d}.mp4", properties={'width': 100})
+                      for i in range(5)])
+        file_id = db.search_files("clip_07")[0]['id']
+        mtime_ns = db.get_read_connection().execute('SELECT mtime_ns FROM files WHERE id = ?',
+                                                    (file_id,)).fetchone()[0]
+        db.save_enrichment([{'id': file_id, 'mtime_ns': mtime_ns, 'hash': 'x', 'properties': {'codec': 'vp9'}}])
+        db.remove_paths(["/media/clip_19.mp4"])
+        assert db.get_property_statistics() == full_group_by(db)
+        assert dict(db.get_property_keys()) == {'codec': 14, 'duration': 13, 'width': 18}
+        print("✓ 属性统计随文件增删增量更新")
+        
+        # 按属性名和游标分页
+        rows, after = [], None
+        while True:
+            page = db.get_property_statistics(limit=4, after=after)
+            if not page:
+                break
+            rows.extend(page)
+            after = page[-1]
+        assert rows == full_group_by(db)
+        widths = db.get_property_statistics(key='width')
+        assert widths[0] == ('width', 100, 5) and {row[0] for row in widths} == {'width'}
+        assert db.get_property_statistics(key='width', limit=2, after=widths[1]) == widths[2:4]
+        print("✓ 属性统计分页读取")
+        db.close()
+        
+        # 旧数据库没有统计表时根据已有属性建立
+        conn = sqlite3.connect(os.path.join(temp_dir, "files.db"))
+        conn.execute('DROP TABLE property_stats')
+        conn.execute('DROP TABLE property_keys')
+        conn.commit()
+        conn.close()
+        db = LightweightDatabase(temp_dir)
+        assert db.get_property_statistics() == full_group_by(db)
+        db.clear_database()
+        assert db.get_property_statistics() == [] and db.get_property_keys() == []
+        print("✓ 升级时为已有属性建立统计")
+        db.close()
+    finally:
+        shutil.rmtree(temp_dir)
+
+def test_result_exporter():
+    """测试搜索结果流式导出为 CSV、JSON Lines 和 Parquet"""
+    import csv
+    import json
+    from everything import LightweightDatabase, ResultExporter, PYARROW_AVAILABLE
+    
+    temp_dir = tempfile.mkdtemp()
+    try:
+        db = LightweightDatabase(temp_dir)
+        db.add_files([make_test_file_info(f'/data/报告, 第{i:02d}版 "终稿".txt', size=i,
+                                          properties={'line_count': i, 'title': 'a,b\nc'})
+                      for i in range(25)])
+        exporter = ResultExporter(db, batch_size=7)
+        progress = []
+        
+        # 含逗号、引号和换行的值正确转义
+        csv_path = os.path.join(temp_dir, "out.csv")
+        stats = exporter.export(csv_path, include_properties=True, order_by=[('size', True)],
+                                progress_callback=lambda s: progress.append(s['files']))
+        assert stats == {'output': csv_path, 'format': 'csv', 'files': 25, 'completed': True}
+        assert progress == [7, 14, 21, 25]
+        with open(csv_path, encoding='utf-8', newline='') as f:
+            rows = list(csv.DictReader(f))
+        assert len(rows) == 25 and rows[0]['path'] == '/data/报告, 第24版 "终稿".txt' and rows[0]['size'] == '24'
+        assert json.loads(rows[0]['properties']) == {'line_count': 24, 'title': 'a,b\nc'}
+        print("✓ 分批导出 CSV，特殊字符正确转义")
+        
+        jsonl_path = os.path.join(temp_dir, "out.jsonl")
+        assert exporter.export(jsonl_path, query="第03版")['files'] == 1
+        with open(jsonl_path, encoding='utf-8') as f:
+            record = json.loads(f.read())
+        assert record['size'] == 3 and datetime.fromisoformat(record['modified'])
+        
+        # 取消时不留下不完整的文件，已有的同名文件保持不变
+        stats = exporter.export(csv_path, output_format='jsonl', should_continue=lambda: False)
+        assert not stats['completed'] and not os.path.exists(csv_path + ".part")
+        with open(csv_path, encoding='utf-8', newline='') as f:
+            assert len(list(csv.DictReader(f))) == 25
+        print("✓ 导出 JSON Lines，取消时保留原文件")
+        
+        if PYARROW_AVAILABLE:
+            import pyarrow.parquet as pq
+            parquet_path = os.path.join(temp_dir, "out.parquet")
+            assert exporter.export(parquet_path, include_properties=True)['format'] == 'parquet'
+            parquet_file = pq.ParquetFile(parquet_path)
+            assert parquet_file.metadata.num_rows == 25 and parquet_file.metadata.num_row_groups == 4
+            assert sorted(parquet_file.read().column('size').to_pylist()) == list(range(25))
+            print("✓ 导出 Parquet")
+        db.close()
+    finally:
+        shutil.rmtree(temp_dir)
+
+def test_directory_table():
+    """测试目录表：路径拆分为目录 id 和文件名，按目录查询子树，旧数据库升级"""
+    import sqlite3
+    from everything import LightweightDatabase
+    
+    temp_dir = tempfile.mkdtemp()
+    try:
+        db = LightweightDatabase(temp_dir)
+        paths = [f"/share/{project}/docs/report_{i}.txt" for project in ("alpha", "beta") for i in range(3)]
+        paths += ["/share/alpha/src/main.py", "/share/readme.md"]
+        db.add_files([make_test_file_info(path) for path in paths])
+        
+        conn = db.get_read_connection()
+        assert sorted(path for path, in conn.execute('SELECT path FROM dirs')) == [
+            "/", "/share/", "/share/alpha/", "/share/alpha/docs/", "/share/alpha/src/",
+            "/share/beta/", "/share/beta/docs/"]
+        assert sorted(r['path'] for r in db.search_files()) == sorted(paths)
+        assert db.get_file_fingerprints(paths[:2] + ["/share/missing.txt"]).keys() == set(paths[:2])
+        print("✓ 每个目录只保存一次，文件路径由目录和文件名拼出")
+        
+        # 关键词在文件名中、在目录路径中、或跨越目录和文件名
+        assert len(db.search_files("report")) == 6
+        assert len(db.search_files("beta")) == 3
+        assert [r['path'] for r in db.search_files("docs/report_1")] == [
+            "/share/alpha/docs/report_1.txt", "/share/beta/docs/report_1.txt"]
+        assert [r['path'] for r in db.search_files("a/src/m")] == ["/share/alpha/src/main.py"]
+        assert len(db.search_files("s/")) == 6 and len(db.search_files("/s")) == 8
+        # 按路径排序：同一目录的文件相邻
+        assert [r['path'] for r in db.search_files(query="alpha", order_by=[('path', False)])] == sorted(
+            path for path in paths if '/alpha/' in path)
+        print("✓ 文件名、目录路径和跨越两者的关键词都能匹配")
+        
+        # _ 和 % 按字面匹配：短关键词、不使用全文索引时和跨越目录与文件名时都不作为通配符
+        db.add_files([make_test_file_info(path) for path in
+                      ["/like/a_b/f_1.txt", "/like/axb/fx1.txt", "/like/axb/50%.txt"]])
+        assert [r['path'] for r in db.search_files("%")] == ["/like/axb/50%.txt"]
+        assert [r['path'] for r in db.search_files("_b")] == ["/like/a_b/f_1.txt"]
+        assert [r['path'] for r in db.search_files("a_b/f_")] == ["/like/a_b/f_1.txt"]
+        db.fts_enabled = False
+        assert [r['path'] for r in db.search_files("f_1")] == ["/like/a_b/f_1.txt"]
+        db.fts_enabled = True
+        assert db.remove_paths(["/like"]) == 3
+        print("✓ 关键词中的 _ 和 % 按字面匹配")
+        
+        # 子树查询：重新索引 alpha 后清理已删除的文件和空目录
+        generation = db.begin_generation()
+        db.add_files([{'path': "/share/alpha/docs/report_0.txt", 'unchanged': True}], generation=generation)
+        assert db.sweep_stale_files("/share/alpha", generation) == 3
+        alpha_dirs = [path for path, in conn.execute("SELECT path FROM dirs WHERE path LIKE '/share/alpha/%'")]
+        assert sorted(alpha_dirs) == ["/share/alpha/", "/share/alpha/docs/"]
+        assert db.remove_paths(["/share/beta"]) == 3
+        assert conn.execute("SELECT COUNT(*) FROM dirs WHERE path LIKE '/share/beta/%'").fetchone()[0] == 0
+        assert sorted(r['path'] for r in db.search_files()) == ["/share/alpha/docs/report_0.txt", "/share/readme.md"]
+        print("✓ 按目录 id 删除子树，空目录随之清理")
+        db.close()
+        
+        # v6 数据库（文件表保存完整路径）升级后保留 id 和属性
+        old_dir = os.path.join(temp_dir, "old")
+        os.makedirs(old_dir)
+        conn = sqlite3.connect(os.path.join(old_dir, "files.db"))
+        conn.execute('''
+            CREATE TABLE files (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, path TEXT UNIQUE NOT NULL,
+                size INTEGER, type TEXT, created INTEGER, modified INTEGER, accessed INTEGER, attributes TEXT,
+                hash TEXT, indexed_at INTEGER, mtime_ns INTEGER, inode INTEGER, generation INTEGER DEFAULT 0,
+                enriched INTEGER DEFAULT 0, extension TEXT
+            )
+        ''')
+        generated_columns = ''.join(f", {name} {column_type} GENERATED ALWAYS AS (json_extract(data, '$.{name}'))"
+                                    for name, column_type in LightweightDatabase.INDEXED_PROPERTIES.items())
+        conn.execute(f'CREATE TABLE file_properties (file_id INTEGER PRIMARY KEY, data TEXT NOT NULL{generated_columns})')
+        conn.executemany("INSERT INTO files (id, name, path, size, type) VALUES (?, ?, ?, 1, '文档')",
+                         [(7, "a.txt", "/old/a.txt"), (9, "b.txt", "/old/sub/b.txt")])
+        conn.execute("""INSERT INTO file_properties VALUES (9, '{"line_count": 2}')""")
+        conn.execute('PRAGMA user_version = 6')
+        conn.commit()
+        conn.close()
+        
+        db = LightweightDatabase(old_dir)
+        results = db.search_files("sub/b", include_properties=True)
+        assert [(r['id'], r['path'], r['properties']) for r in results] == [(9, "/old/sub/b.txt", {'line_count': 2})]
+        assert db.search_files("a.txt")[0]['id'] == 7
+        assert db.get_statistics()['schema_version'] == LightweightDatabase.SCHEMA_VERSION
+        db.add_file(make_test_file_info("/old/sub/c.txt"))
+        assert db.search_files("c.txt")[0]['id'] == 10
+        print("✓ 旧数据库的完整路径转换为目录表")
+        db.close()
+    finally:
+        shutil.rmtree(temp_dir)
+
+def test_query_language():
+    """测试搜索语法：解析为语法树，能下推的条件在数据库中执行，正则表达式流式后过滤"""
+    from everything import LightweightDatabase, QueryParser, QueryNode
+    
+    parser = QueryParser(now=datetime(2024, 5, 15, 10, 30))
+    assert parser.parse("") is None
+    assert parser.parse("report") == QueryNode('text', "report")
+    assert parser.parse(r"C:\data") == QueryNode('text', r"C:\data")
+    assert parser.parse('a b|c') == QueryNode('and', children=[
+        QueryNode('text', "a"), QueryNode('or', children=[QueryNode('text', "b"), QueryNode('text', "c")])])
+    assert parser.parse('!<a|b> "x y" *.txt') == QueryNode('and', children=[
+        QueryNode('not', children=[QueryNode('or', children=[QueryNode('text', "a"), QueryNode('text', "b")])]),
+        QueryNode('text', "x y"), QueryNode('wildcard', "*.txt")])
+    assert parser.parse("ext:MP4;.mkv") == QueryNode('ext', ('.mp4', '.mkv'))
+    assert parser.parse("size:>1gb").value == (1024 ** 3 + 1, None)
+    assert parser.parse("<size:1kb..2kb>").value == (1024, 2049)
+    assert parser.parse("size:tiny").value == (1, 10 * 1024)
+    assert parser.parse("dm:thisweek").value == (datetime(2024, 5, 13), datetime(2024, 5, 20))
+    assert parser.parse("dc:lastmonth").value == (datetime(2024, 4, 1), datetime(2024, 5, 1))
+    assert parser.parse("da:<2024-03").value == (None, datetime(2024, 3, 1))
+    assert parser.parse("type:video") == QueryNode('type', "视频")
+    for invalid in ("regex:[", "size:big", "dm:someday", "type:unknown"):
+        try:
+            parser.parse(invalid)
+            assert False, invalid
+        except ValueError:
+            pass
+    print("✓ 搜索语法解析为语法树")
+    
+    temp_dir = tempfile.mkdtemp()
+    try:
+        db = LightweightDatabase(temp_dir)
+        now = datetime.now()
+        old = now - timedelta(days=400)
+        file_infos = [make_test_file_info(f"/media/projects/IMG_{i:04d}.jpg", size=1024 * i, type='图片')
+                      for i in range(30)]
+        file_infos += [make_test_file_info(f"/media/movies/movie_{i}.{'mp4' if i % 2 else 'mkv'}",
+                                           size=2 * 1024 ** 3 if i < 3 else 1024 ** 2, type='视频',
+                                           modified=now if i % 3 else old) for i in range(6)]
+        file_infos += [make_test_file_info("/media/projects/IMG_copy.jpg", type='图片'),
+                       make_test_file_info("/media/notes/report_final.txt"),
+                       make_test_file_info("/media/notes/rp_draft.txt")]
+        db.add_files(file_infos)
+        
+        def paths(query, **params):
+            return sorted(r['path'] for r in db.search_files(query, **params))
+        
+        assert paths("ext:mp4;mkv size:>1gb") == [f"/media/movies/movie_{i}.{'mp4' if i % 2 else 'mkv'}"
+                                                  for i in range(3)]
+        assert paths("ext:mp4;mkv dm:thisweek") == ["/media/movies/movie_1.mp4", "/media/movies/movie_2.mkv",
+                                                    "/media/movies/movie_4.mkv", "/media/movies/movie_5.mp4"]
+        assert paths("type:video !ext:mkv") == ["/media/movies/movie_1.mp4", "/media/movies/movie_3.mp4",
+                                                "/media/movies/movie_5.mp4"]
+        assert paths("movie_1|movie_2 movies") == ["/media/movies/movie_1.mp4", "/media/movies/movie_2.mkv"]
+        assert paths("path:notes *.txt") == ["/media/notes/report_final.txt", "/media/notes/rp_draft.txt"]
+        assert paths("fuzzy:rptfn") == ["/media/notes/report_final.txt"]
+        assert len(db.search_files("img_001?.JPG")) == 10 and len(db.search_files("IMG?0001.jpg")) == 1
+        assert db.count_files("type:图片 size:<10kb") == 11
+        print("✓ 扩展名、大小、时间、类型、通配符条件在数据库中执行")
+        
+        # 正则表达式流式过滤：分批读取，翻页和计数与数据库条件一致
+        db.POST_FILTER_BATCH_SIZE = 4
+        expected = sorted(info['path'] for info in file_infos if info['name'].startswith("IMG_0"))
+        assert paths(r"regex:^img_\d+\.jpg$") == expected
+        assert db.count_files(r"regex:^IMG_\d+") == 30
+        first = db.search_files(r"path:projects regex:_\d{4}\.", limit=7, order_by=[('size', True)])
+        second = db.search_files(r"path:projects regex:_\d{4}\.", limit=30, order_by=[('size', True)],
+                                 after=db.get_cursor(first[-1]))
+        assert [r['size'] for r in first + second] == [1024 * i for i in range(29, -1, -1)]
+        assert len(list(db.iter_files(page_size=8, query=r"regex:IMG_\d"))) == 30
+        # 或、非中混合正则表达式时整个子树在 Python 中判断
+        assert paths(r"regex:^rp_|ext:mp4 !movie_1") == ["/media/movies/movie_3.mp4", "/media/movies/movie_5.mp4",
+                                                         "/media/notes/rp_draft.txt"]
+        assert db.count_files(r"type:图片 !regex:\d\.jpg$") == 1
+        assert db.count_files(r"type:图片 !regex:\d\.jpg$|size:<2kb") == 3
+        assert paths(r"regex:movies/movie_[0-2]") == ["/media/movies/movie_0.mkv", "/media/movies/movie_1.mp4",
+                                                     "/media/movies/movie_2.mkv"]
+        try:
+            db.search_files("regex:(")
+            assert False
+        except ValueError:
+            pass
+        print("✓ 正则表达式在数据库结果上流式过滤，分页和计数正确")
+        db.close()
+    finally:
+        shutil.rmtree(temp_dir)
+
+def test_search_worker():
+    """测试后台搜索：过期查询被中止，只返回最新查询的结果，出错时报告错误"""
+    import sqlite3
+    import threading
+    from everything import LightweightDatabase, SearchWorker
+    
+    temp_dir = tempfile.mkdtemp()
+    try:
+        db = LightweightDatabase(temp_dir)
+        db.add_files([make_test_file_info(f"/data/worker/file_{i}.txt") for i in range(20)])
+        
+        results = []
+        done = threading.Event()
+        started = threading.Event()
+        
+        def on_result(generation, result):
+            results.append(result)
+            done.set()
+        
+        def slow_task(conn):
+            started.set()
+            # 足够慢的查询，只能被进度回调中止
+            return conn.execute('''
+                WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n)
+                SELECT COUNT(*) FROM (SELECT i FROM n LIMIT 1000000000)
+            ''').fetchone()
+        
+        errors = []
+        
+        def on_error(generation, error):
+            errors.append((generation, error))
+            done.set()
+        
+        worker = SearchWorker(db, on_result, on_error)
+        worker.start()
+        worker.submit(slow_task)
+        assert started.wait(5)
+        generation = worker.submit(lambda conn: db.count_files("file_1", conn=conn))
+        assert done.wait(5)
+        assert results == [11] and worker.is_current(generation)
+        print("✓ 新查询取消了正在执行的旧查询")
+        
+        # 查询出错时报告给调用方，被取消的旧查询不报告
+        assert errors == []
+        done.clear()
+        generation = worker.submit(lambda conn: db.search_files("regex:(", conn=conn))
+        assert done.wait(5)
+        assert [g for g, _ in errors] == [generation] and isinstance(errors[0][1], ValueError)
+        done.clear()
+        generation = worker.submit(lambda conn: conn.execute('SELECT * FROM missing_table').fetchall())
+        assert done.wait(5)
+        assert errors[-1][0] == generation and isinstance(errors[-1][1], sqlite3.OperationalError)
+        assert results == [11]
+        print("✓ 查询出错时报告错误")
+        
+        worker.stop(timeout=5)
+        db.close()
+    finally:
+        shutil.rmtree(temp_dir)
+
+def test_name_index():
+    """测试内存文件名索引：子串/前缀搜索、与数据库同步、默认视图第一页与数据库结果一致"""
+    from everything import LightweightDatabase
+    
+    temp_dir = tempfile.mkdtemp()
+    try:
+        db = LightweightDatabase(temp_dir)
+        db.add_files([make_test_file_info(f"/data/d{i % 4}/{'Report' if i % 2 else 'photo'}_{i:03d}.txt")
+                      for i in range(200)])
+        
+        def first_page(query):
+            return [r['id'] for r in db.search_files(query, limit=20)]
+        
+        queries = ["report_1", "PHOTO", "d3", "_05", "missing"]
+        expected = {query: first_page(query) for query in queries}
+        index = db.load_name_index()
+        assert len(index) == 200 and index.memory_usage() > 0
+        assert db._name_index_candidates("report", 20, [('name', False)], {}, None) is not None
+        assert {query: first_page(query) for query in queries} == expected
+        assert len(index.search("report_")) == 100 and len(index.search("report_", limit=5)) == 5
+        assert len(index.search("d1", prefix=True)) == 0 and len(index.search("photo_00", prefix=True)) == 5
+        print("✓ 内存索引搜索结果与数据库一致")
+        
+        # 写入、删除和清空都同步到内存索引
+        db.add_files([make_test_file_info("/data/new/Report_new.txt")])
+        db.remove_paths(["/data/d1"])
+        assert len(index) == 151 and len(index.search("report_new")) == 1
+        current = {query: first_page(query) for query in queries}
+        db.unload_name_index()
+        assert {query: first_page(query) for query in queries} == current
+        print("✓ 内存索引与数据库同步")
+        
+        index = db.load_name_index()
+        db.close()
+        db.clear_database()
+        assert len(index) == 0 and index.search("report") == []
+        db.close()
+    finally:
+        shutil.rmtree(temp_dir)
+
+def test_name_index_snapshot():
+    """测试内存文件名索引快照：保存、内存映射打开、过期检测和首次修改"""
+    from everything import LightweightDatabase, NameIndex
+    
+    temp_dir = tempfile.mkdtemp()
+    try:
+        db = LightweightDatabase(temp_dir)
+        db.add_files([make_test_file_info(f"/data/snap/{'Report' if i % 2 else 'photo'}_{i:03d}.txt")
+                      for i in range(100)])
+        expected = [r['id'] for r in db.search_files("report", limit=10)]
+        index = db.load_name_index()
+        db.remove_paths(["/data/snap/photo_000.txt"])
+        db.save_name_index()
+        db.close()
+        
+        # 重新打开：快照直接映射，与数据库一致时核对后继续使用
+        db = LightweightDatabase(temp_dir)
+        snapshot = db.open_name_index_snapshot()
+        assert snapshot is not None and len(snapshot) == 99
+        assert [r['id'] for r in db.search_files("report", limit=10)] == expected
+        assert db.load_name_index() is snapshot
+        
+        # 第一次修改时复制到内存，之后保存的快照包含修改
+        db.add_files([make_test_file_info("/data/snap/Report_new.txt")])
+        assert len(snapshot) == 100 and len(snapshot.search("report_new")) == 1
+        db.save_name_index()
+        db.close()
+        print("✓ 文件名索引快照保存和映射")
+        
+        # 快照保存之后数据库被其他程序修改：核对前搜索不使用快照，核对时重新读取
+        other = LightweightDatabase(temp_dir)
+        other.remove_paths(["/data/snap/Report_new.txt"])
+        other.add_files([make_test_file_info("/data/snap/Report_000.txt")])
+        expected = [r['path'] for r in other.search_files("report", limit=10)]
+        other.close()
+        db = LightweightDatabase(temp_dir)
+        snapshot = db.open_name_index_snapshot()
+        assert len(snapshot) == 100
+        assert [r['path'] for r in db.search_files("report", limit=10)] == expected
+        assert expected[0] == "/data/snap/Report_000.txt"
+        index = db.load_name_index()
+        assert index is not snapshot and len(index) == 100 and index.search("report_new") == []
+        db.close()
+        
+        # 损坏的快照被忽略
+        with open(db.name_index_path, 'r+b') as f:
+            f.truncate(100)
+        assert NameIndex.open_snapshot(db.name_index_path) is None
+        print("✓ 过期或损坏的快照不会被使用")
+    finally:
+        shutil.rmtree(temp_dir)
+
+def test_duplicate_finder():
+    """测试分阶段查找重复文件：大小 -> 部分哈希 -> 完整哈希"""
+    from everything import LightweightDatabase, FileProperties, FileIndexer, DuplicateFinder
+    
+    temp_dir = tempfile.mkdtemp()
+    root = tempfile.mkdtemp(prefix="everything_dup_")
+    try:
+        block = DuplicateFinder.PARTIAL_BLOCK_SIZE
+        content = os.urandom(3 * block)
+        middle_changed = bytearray(content)
+        middle_changed[len(content) // 2] ^= 1
+        head_changed = bytearray(content)
+        head_changed[0] ^= 1
+        files = {
+            "a/big.bin": content, "b/big_copy.bin": content,
+            "a/middle_changed.bin": bytes(middle_changed), "a/head_changed.bin": bytes(head_changed),
+            "a/small.txt": b"hello", "b/small_copy.txt": b"hello", "b/other.txt": b"world",
+            "a/empty": b"", "b/empty": b"",
+        }
+        for name, data in files.items():
+            os.makedirs(os.path.join(root, os.path.dirname(name)), exist_ok=True)
+            with open(os.path.join(root, name), 'wb') as f:
+                f.write(data)
+        
+        db = LightweightDatabase(temp_dir)
+        properties_manager = FileProperties()
+        FileIndexer(db, properties_manager, workers=2).index(root)
+        report = DuplicateFinder(db, properties_manager, workers=2).find()
+        
+        groups = [[os.path.relpath(f['path'], root).replace(os.sep, '/') for f in group['files']]
+                  for group in report['groups']]
+        assert groups == [["a/big.bin", "b/big_copy.bin"], ["a/small.txt", "b/small_copy.txt"]]
+        assert report['groups'][1]['hash'] == properties_manager.calculate_file_hash(os.path.join(root, "a/small.txt"))
+        stats = report['stats']
+        assert stats['completed'] and stats['candidates'] == 7 and stats['wasted_bytes'] == len(content) + 5
+        # 开头不同的文件在部分哈希阶段排除，只有三个大文件需要完整哈希
+        assert stats['full_hashed'] == 3 and stats['full_bytes'] == 3 * len(content)
+        print(f"✓ 找到 {stats['groups']} 组重复文件，完整哈希 {stats['full_hashed']}/{stats['candidates']} 个候选文件")
+        
+        sub_report = DuplicateFinder(db, properties_manager).find(root=os.path.join(root, "a"))
+        assert sub_report['groups'] == []
+        print("✓ 按目录限定查找范围")
+        
+        # 硬链接按 (设备, inode) 识别：其他设备上 inode 相同的文件不是硬链接，没有设备号时不去重
+        distinct = DuplicateFinder._distinct_files([
+            {'path': "x", 'inode': 5, 'device': 1}, {'path': "x_link", 'inode': 5, 'device': 1},
+            {'path': "y", 'inode': 5, 'device': 2}, {'path': "z", 'inode': 5, 'device': None}])
+        assert [f['path'] for f in distinct] == ["x", "y", "z"]
+        # 旧数据库没有设备号，增量索引标记未修改文件时补上
+        with db._write_lock:
+            conn = db.get_write_connection()
+            with conn:
+                conn.execute('UPDATE files SET device = NULL')
+        FileIndexer(db, properties_manager, workers=2).index(root, incremental=True)
+        assert all(f['device'] == os.stat(f['path']).st_dev for f in db.get_files_by_size(len(content)))
+        print("✓ 硬链接按设备和 inode 识别")
+        db.close()
+    finally:
+        shutil.rmtree(temp_dir)
+        shutil.rmtree(root)
+
+def test_connection_manager():
+    """测试连接管理：WAL 模式下读连接可以在写入事务进行时查询"""
+    import sqlite3
+    import threading
+    from everything import LightweightDatabase, FileIndexer, FileProperties, LiveIndexUpdater
+    
+    temp_dir = tempfile.mkdtemp()
+    try:
+        db = LightweightDatabase(temp_dir)
+        db.add_files([make_test_file_info(f"/data/conn/file_{i}.txt") for i in range(10)])
+        
+        writer = db.get_write_connection()
+        reader = db.get_read_connection()
+        assert writer.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert reader is db.get_read_connection()
+        try:
+            reader.execute("DELETE FROM files")
+            assert False, "只读连接不应允许写入"
+        except sqlite3.OperationalError:
+            pass
+        
+        # 写入事务未提交时，其他线程仍可读取已提交的数据
+        with db._write_lock:
+            writer.execute("DELETE FROM files WHERE name = 'file_0.txt'")
+            counts = []
+            thread = threading.Thread(target=lambda: counts.append(db.get_file_count()))
+            thread.start()
+            thread.join(5)
+            writer.commit()
+        assert counts == [10] and db.get_file_count() == 9
+        print("✓ 读连接与写入并发")
+        
+        db.close()
+        # 关闭后再次使用时重新打开连接
+        assert db.get_file_count() == 9
+        
+        # 每轮增量索引的遍历线程、每次启动的监视更新线程结束后，其读连接都已关闭
+        root = os.path.join(temp_dir, "tree")
+        os.makedirs(root)
+        for i in range(5):
+            with open(os.path.join(root, f"file_{i}.txt"), 'w') as f:
+                f.write("x" * i)
+        readers = len(db.connections._readers)
+        indexer = FileIndexer(db, FileProperties(), workers=2)
+        for _ in range(5):
+            indexer.index(root, incremental=True)
+        
+        class IdleWatcher:
+            def start(self):
+                pass
+            
+            def stop(self, timeout=None):
+                pass
+        
+        props = FileProperties()
+        updater = LiveIndexUpdater(db, lambda name, path, stat: dict(
+            props.get_file_properties(path, include_specific=False, stat_result=stat, include_hash=False),
+            name=name, path=path, type='文档'), watcher_factory=lambda root, callback: IdleWatcher())
+        for _ in range(3):
+            updater.start(root)
+            updater.on_event('modified', os.path.join(root, "file_1.txt"))
+            updater.stop(timeout=5)
+        assert len(db.connections._readers) == readers
+        print("✓ 后台线程结束后关闭各自的读连接")
+        
+        db.close()
+    finally:
+        shutil.rmtree(temp_dir)
+
+def test_live_index_updates():
+    """测试监视模式：合并目录变化事件并增量更新索引"""
+    import time
+    from everything import LightweightDatabase, FileProperties, LiveIndexUpdater, InotifyWatcher
+    
+    temp_dir = tempfile.mkdtemp()
+    root = tempfile.mkdtemp()
+    try:
+        db = LightweightDatabase(temp_dir)
+        props = FileProperties()
+        
+        def build_file_info(name, path, stat):
+            file_info = {'name': name, 'path': path, 'type': '文档'}
+            file_info.update(props.get_file_properties(path, include_specific=False, stat_result=stat,
+                                                       include_hash=False))
+            return file_info
+        
+        updates = []
+        updater = LiveIndexUpdater(db, build_file_info, on_update=lambda *counts: updates.append(counts))
+        
+        # 同一路径的多次事件合并为一次，按磁盘上的当前状态更新
+        path = os.path.join(root, "a.txt")
+        with open(path, 'w') as f:
+            f.write("hello")
+        for kind in ('created', 'modified', 'modified'):
+            updater.on_event(kind, path)
+        os.makedirs(os.path.join(root, "sub", "deep"))
+        for i in range(3):
+            with open(os.path.join(root, "sub", "deep", f"n{i}.txt"), 'w') as f:
+                f.write(str(i))
+        updater.on_event('created', os.path.join(root, "sub"))
+        assert updater.flush() == (4, 0)
+        assert updater.flush() == (0, 0)
+        
+        # 删除目录时移除其下所有文件；未变化的文件不重写
+        shutil.rmtree(os.path.join(root, "sub"))
+        updater.on_event('deleted', os.path.join(root, "sub"))
+        updater.on_event('modified', path)
+        assert updater.flush() == (0, 3)
+        assert updates == [(4, 0), (0, 3)]
+        assert [r['name'] for r in db.search_files()] == ["a.txt"]
+        print("✓ 目录变化事件合并后增量更新")
+        
+        if InotifyWatcher.is_available():
+            updater.QUIET_PERIOD = 0.2
+            assert updater.start(root)
+            time.sleep(0.2)
+            os.makedirs(os.path.join(root, "new"))
+            with open(os.path.join(root, "new", "b.txt"), 'w') as f:
+                f.write("b")
+            os.rename(path, os.path.join(root, "renamed.txt"))
+            
+            expected = ["b.txt", "renamed.txt"]
+            deadline = time.time() + 10
+            while sorted(r['name'] for r in db.search_files()) != expected and time.time() < deadline:
+                time.sleep(0.1)
+            assert sorted(r['name'] for r in db.search_files()) == expected
+            updater.stop(timeout=5)
+            print("✓ inotify 监视实时更新索引")
+        
+        db.close()
+    finally:
+        shutil.rmtree(temp_dir)
+        shutil.rmtree(root, ignore_errors=True)
+
+def test_cli():
+    """测试命令行接口：索引、搜索、统计和导出"""
+    import io
+    import json
+    from contextlib import redirect_stdout
+    import everything_cli
+    
+    temp_dir = tempfile.mkdtemp()
+    root = create_test_files()
+    try:
+        def run(*argv):
+            output = io.StringIO()
+            with redirect_stdout(output):
+                assert everything_cli.main(['--data-dir', temp_dir] + list(argv)) == 0
+            return output.getvalue()
+        
+        stats = json.loads(run('index', root, '--enrich', '--no-processes', '--workers', '2'))
+        assert stats['completed'] and stats['indexed'] == stats['total'] > 0
+        assert stats['enriched'] == stats['indexed']
+        assert json.loads(run('index', root, '--incremental'))['skipped'] == stats['total']
+        print("✓ 命令行索引和增量索引")
+        
+        lines = run('search', 'test', '--sort', 'size:desc').splitlines()
+        records = [json.loads(line) for line in lines]
+        assert records and all(os.path.isabs(r['path']) for r in records)
+        assert [r['size'] for r in records] == sorted((r['size'] for r in records), reverse=True)
+        assert len(json.loads(run('search', '--format', 'json', '--limit', '1'))) == 1
+        
+        statistics = json.loads(run('stats'))
+        assert statistics['files'] == stats['total'] and statistics['pending_enrichment'] == 0
+        
+        output_path = os.path.join(temp_dir, "export.jsonl")
+        summary = json.loads(run('export', output_path, '--properties'))
+        with open(output_path, encoding='utf-8') as f:
+            assert len(f.readlines()) == summary['files'] == stats['total']
+        print("✓ 命令行搜索、统计和导出")
+        
+        report = json.loads(run('duplicates', root, '--limit', '5'))
+        assert report['stats']['completed'] and len(report['groups']) <= 5
+        print("✓ 命令行查找重复文件")
+    finally:
+        shutil.rmtree(temp_dir)
+        shutil.rmtree(root)
+
+def test_benchmark():
+    """测试基准测试脚本（小规模）"""
+    import benchmark
+    
+    result = benchmark.run_benchmark(files=300, depth=2, fanout=3, queries=3, page_size=50, workers=2, enrich=True,
+                                     name_index=True)
+    assert result['index']['indexed'] == 300
+    assert result['incremental_unchanged']['skipped'] == 300
+    changes = result['changes']
+    assert result['incremental_changed']['removed'] == changes['deleted']
+    assert result['incremental_changed']['indexed'] == changes['modified'] + changes['added']
+    assert result['enrich']['files'] == result['database']['files']
+    assert all(stats['p50_ms'] <= stats['p99_ms'] for stats in result['queries'].values())
+    assert result['database']['bytes'] > 0
+    assert result['name_index']['files'] == result['database']['files']
+    assert result['queries_name_index'].keys() == result['queries'].keys()
+    print("✓ 基准测试")
+
 def main():
     """主测试函数"""
     print("=" * 50)
@@ -103,6 +1361,32 @@ def main():
     print("=" * 50)
     
     # 测试程序功能
+    test_batch_add_files()
+    test_file_fingerprints()
+    test_sweep_stale_files()
+    test_index_pipeline()
+    test_scan_files_reuses_stat()
+    test_fts_search()
+    test_streaming_hash_cache()
+    test_property_enricher()
+    test_keyset_pagination()
+    test_sql_sorting()
+    test_range_filters()
+    test_timestamp_migration()
+    test_typed_properties()
+    test_property_statistics()
+    test_result_exporter()
+    test_directory_table()
+    test_query_language()
+    test_search_worker()
+    test_connection_manager()
+    test_name_index()
+    test_name_index_snapshot()
+    test_duplicate_finder()
+    test_live_index_updates()
+    test_cli()
+    test_benchmark()
+    
     if test_file_search_app():
         print("\n🎉 所有测试通过！程序可以正常使用。")
         print("\n使用方法:")